@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# td_benchmark と search の結果を比較するスクリプトをまとめたコマンド．
+# usage: compare_bench_result.py <subcommand> [args...]
+#   latency       plot_workload_latency.py と同じ (全ての図と集計)
+#   running-time  plot_running_time.py と同じ (search の各段階の実行時間)
+#   per-ts        query_latency_each_ts.py と同じ (一つの結果の各 SELECT の各時刻の応答時間)
+#   diff          label 間の実行頻度で重み付けした合計応答時間の差だけを表示する
+#   r2            コストモデルの見積もりの精度だけを表示する
+#   batch         batch_scheduler.py と同じ (manifest に書いた複数の比較をまとめて実行する)
+#   regression    regression_gate.py と同じ (基準の結果より遅くなっていれば終了コード 1 で終了する)
+#   repetitions   repetition_planner.py と同じ (相対標準誤差を目標値にするための再実行計画を書き出す)
+#   migrations    migration_attribution.py と同じ (応答時間の変化を各時刻の CF の作成, 削除とマイグレーションに割り当てる)
+#   clear-cache   解析済みの結果のキャッシュ (ParseCache) を削除する．ファイルを指定した場合はそのファイルのキャッシュだけを削除する
+#
+# 起動時間を短く保つため，このファイルでは標準ライブラリだけを import し，pandas, pyarrow, matplotlib, scipy は
+# 各サブコマンドが必要になったときに初めて import する．
+# 起動時間の目安 (python -X importtime で計測する):
+#   --help                                 0.1 s 以内 (標準ライブラリのみ)
+#   clear-cache                            0.4 s 以内 (上に加えて pyarrow)
+#   diff, r2, regression, repetitions,
+#   migrations                             0.8 s 以内 (numpy, pandas, pyarrow, pyparsing. matplotlib は読み込まない)
+#   latency, running-time, per-ts, batch   1.2 s 以内 (上に加えて matplotlib)
+# 図はファイルに書き出すので，MPLBACKEND が設定されていなければ GUI を使わない Agg バックエンドを使う．
+# 図を画面に表示する場合は MPLBACKEND=TkAgg などを設定する．
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.append(str(SCRIPT_DIR / "plot_workload_latency"))
+sys.path.append(str(SCRIPT_DIR / "plot_running_time"))
+
+
+def run_latency(args):
+    import plot_workload_latency
+    plot_workload_latency.main(args.args)
+
+
+def run_running_time(args):
+    import plot_running_time
+    plot_running_time.main(args.args)
+
+
+def run_batch(args):
+    import batch_scheduler
+    batch_scheduler.main(args.args)
+
+
+def run_regression(args):
+    import regression_gate
+    regression_gate.main(args.args)
+
+
+def run_repetitions(args):
+    import repetition_planner
+    repetition_planner.main(args.args)
+
+
+def run_migrations(args):
+    import migration_attribution
+    migration_attribution.main(args.args)
+
+
+def run_per_ts(args):
+    import query_latency_each_ts
+    query_latency_each_ts.main([args.file])
+
+
+def load_labels(args):
+    import plot_workload_latency
+    from parse_cache import ParseCache
+    cache = None if args.no_cache else ParseCache()
+    if args.clear_cache:
+        plot_workload_latency.clear_cache(args.files, cache)
+    return plot_workload_latency.load_labels(args.files, args.workers, args.raw_log, cache)
+
+
+def run_clear_cache(args):
+    from parse_cache import ParseCache
+    cache = ParseCache()
+    if len(args.files) == 0:
+        print("removed " + str(cache.invalidate()) + " cached files from " + str(cache.cache_dir))
+    else:
+        print("removed " + str(sum(cache.invalidate(f) for f in args.files)) + " cached files from " + str(cache.cache_dir))
+
+
+def run_diff(args):
+    import plot_workload_latency
+    dir_name, label_dfs_hash, label_grouped_dfs_hash, _ = load_labels(args)
+    plot_workload_latency.show_total_weighted_latency_diff(dir_name, label_dfs_hash, label_grouped_dfs_hash,
+                                                           args.heatmap)
+
+
+def run_r2(args):
+    import plot_workload_latency
+    dir_name, label_dfs_hash, _, _ = load_labels(args)
+    plot_workload_latency.calculate_r2(dir_name, label_dfs_hash, args.worst)
+
+
+def add_load_arguments(parser):
+    parser.add_argument('files', nargs='+', help='td_benchmark result csv of each label')
+    parser.add_argument('--no-cache', action='store_true', help='parse every file without the columnar parse cache')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='remove the cached parse results of the files before loading them')
+    parser.add_argument('--raw-log', action='store_true',
+                        help='files are raw td_benchmark outputs which are not formatted by bench_res_formatter.rb. '
+                             'all result rows are kept in memory as with formatted files')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes to load the files in parallel')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='compare the results of td_benchmark and search')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # 元のスクリプトの引数をそのまま渡す．-h も元のスクリプトのヘルプを表示する
+    for name, handler, help_text in [
+            ('latency', run_latency, 'plot the latency of each label (same as plot_workload_latency.py)'),
+            ('running-time', run_running_time, 'plot the running time of search (same as plot_running_time.py)'),
+            ('batch', run_batch, 'run the comparisons listed in a manifest at once (same as batch_scheduler.py)'),
+            ('regression', run_regression,
+             'exit with 1 if the candidate is slower than the baseline (same as regression_gate.py)'),
+            ('repetitions', run_repetitions,
+             'write the re-run plan to reach a target relative standard error (same as repetition_planner.py)'),
+            ('migrations', run_migrations,
+             'attribute latency changes to the CFs and migrations of the search result '
+             '(same as migration_attribution.py)')]:
+        subparser = subparsers.add_parser(name, help=help_text, add_help=False)
+        subparser.set_defaults(handler=handler, passthrough=True)
+
+    per_ts = subparsers.add_parser('per-ts', help='plot the latency of each query at each time step of one result')
+    per_ts.add_argument('file', help='td_benchmark result csv')
+    per_ts.set_defaults(handler=run_per_ts)
+
+    clear_cache = subparsers.add_parser('clear-cache', help='remove the cached parse results')
+    clear_cache.add_argument('files', nargs='*', help='remove only the cache of these files (default: all)')
+    clear_cache.set_defaults(handler=run_clear_cache)
+
+    diff = subparsers.add_parser('diff', help='show the reduction of the frequency weighted latency between labels')
+    add_load_arguments(diff)
+    diff.add_argument('--heatmap', action='store_true', help='also plot the reduction as a label x label heatmap')
+    diff.set_defaults(handler=run_diff)
+
+    r2 = subparsers.add_parser('r2', help='show the accuracy of the estimated cost of each statement')
+    add_load_arguments(r2)
+    r2.add_argument('--worst', type=int, default=20, help='number of the worst estimated statements to show')
+    r2.set_defaults(handler=run_r2)
+
+    args, rest = parser.parse_known_args(argv)
+    if getattr(args, 'passthrough', False):
+        args.args = rest
+    elif len(rest) > 0:
+        parser.error('unrecognized arguments: ' + " ".join(rest))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,15 @@
+import argparse
 import sys
+from pathlib import Path
 
-import matplotlib.pyplot as plt
-import matplotlib as mpl
 import pandas as pd
-import pyparsing as pp
 import numpy as np
 
+sys.path.append(str(Path(__file__).resolve().parent.parent / "plot_workload_latency"))
+from running_time_extractor import RunningTimeExtractor, RunningTimeIndex
+
+# matplotlib と scaling_curve (scipy) は読み込みに時間がかかるので，使うときに初めて import する
+
 def change_file_name(name):
     name_hash = {
         # ファイル名以外の名前に設定する場合は以下にファイル名と表示名の対応関係を記入してください
@@ -37,83 +41,130 @@ def change_file_name(name):
     return name_hash[name]
 
 
-file_dataframe = {}
-for i in range(1, len(sys.argv)):
-    file_name = sys.argv[i]
-    with open(file_name) as f:
-        tmp_lines = f.readlines()
-    is_running_time_record = False
-    running_time_record = []
-    for t in tmp_lines:
-        if t == "</running time log> ===========================\n":
-            is_running_time_record = False
-        if is_running_time_record:
-            running_time_record.append(t)
-        if t == "<running time log> ===========================\n":
-            is_running_time_record = True
-    print(file_name)
-    columns = pp.commaSeparatedList.parseString(running_time_record[0]).asList()
-    values = list(map(lambda x: int(x) if x != '' else 0, pp.commaSeparatedList.parseString(running_time_record[1]).asList()))
-    data_name = change_file_name(file_name.split("/")[-1])
-    file_dataframe[data_name] = pd.DataFrame([values], columns=columns)
-
-print(file_dataframe)
+def running_time_dataframe(file_name, index=None):
+    if index is None:
+        columns, values = RunningTimeExtractor.extract(file_name)
+    else:
+        columns, values = index.extract(file_name)
+    return pd.DataFrame([values], columns=columns)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+', help='output of the search command')
+    parser.add_argument('--no-cache', action='store_true', help='read every file without the running time index')
+    parser.add_argument('--scaling', action='store_true',
+                        help='fit the running time of each phase to the number of time steps (_Nts) of each variant')
+    parser.add_argument('--horizons', type=int, nargs='+', default=[48, 64, 96],
+                        help='numbers of time steps to extrapolate the running time to with --scaling')
+    parser.add_argument('--output', default=None,
+                        help='save the figure to OUTPUT instead of showing it (default with a non-GUI backend: '
+                             'running_time.pdf)')
+    return parser.parse_args(argv)
 
 
 run_columns = ["CF_ENUMERATION", "PLAN_ENUMERATION", "MIGPLAN_ENUMERATION", "PRUNING", "OPTIMIZATION", "OTHER"]
-run_dfs = {}
-run_values = []
-file_names = []
-
-for file_name, df in file_dataframe.items():
-    run_df = {}
-    enumeration = df['END_CF_ENUMERATION'].values[0] - df['START_CF_ENUMERATION'].values[0]
-    run_df['CF_ENUMERATION'] = enumeration
-    run_df['PLAN_ENUMERATION'] =  df['END_QUERY_PLAN_ENUMERATION'].values[0] - df['START_QUERY_PLAN_ENUMERATION'].values[0]
-    run_df['MIGPLAN_ENUMERATION'] = df['END_MIGRATION_PLAN_ENUMERATION'].values[0] - df['START_MIGRATION_PLAN_ENUMERATION'].values[0]
-    run_df['PRUNING'] =  df['END_PRUNING'].values[0] - df['START_PRUNING'].values[0]
-    run_df['OPTIMIZATION'] = df['END_WHOLE_OPTIMIZATION'].values[0] - df['START_WHOLE_OPTIMIZATION'].values[0]
-    run_df['OTHER'] = df['END'].values[0] - df['START'].values[0] - sum(run_df.values())
-
-    #run_dfs[file_name] = run_dataframe
-
-    print(run_df)
-
-    run_df_sec = {}
-    for k, v in run_df.items():
-        run_df_sec[k] = v / 1000.0
-
-    current_values = []
-    for c in run_columns:
-        current_values.append(run_df_sec[c])
-    run_values.append(current_values)
-    file_names.append(file_name.split('.')[0].split('/')[-1])
-
-run_values_t = np.array(run_values).T.tolist()
-
-run_dataframe = pd.DataFrame(run_values_t, index=run_columns, columns=file_names)
-
-#fig, ax = plt.subplots(figsize = (10, 0))
-#for i in range(len(run_dataframe)):
-#    ax.bar(run_dataframe.columns, run_dataframe.iloc[i], bottom=run_dataframe.iloc[:i].sum())
-#ax.set(xlabel=file_name, ylabel='running time')
-#ax.legend(run_dataframe.index)
-#plt.savefig('tmp.jpg')
-
-plt.rcParams["font.size"] = 17
-plt.rcParams['figure.subplot.bottom'] = 0.15
-fig = plt.figure(figsize=(10, 3))
-ax = fig.add_subplot(1, 1, 1)
-for i in range(len(run_dataframe)):
-    ax.bar(run_dataframe.columns, run_dataframe.iloc[i], bottom=run_dataframe.iloc[:i].sum(), linewidth=50)
-ax.set(xlabel="workloads with various number of time step", ylabel='Running Time[s]')
-ax.legend(run_dataframe.index)
-ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter('{x:,.0f}'))
-#plt.title("running time [s]")
-plt.xticks(rotation=85)
-#plt.yscale("log")
-plt.subplots_adjust(left=0.2, right=0.95, bottom=0.53, top=0.9)
-#plt.savefig('tmp.jpg')
-plt.show()
 
 
+# 各ファイルの各段階の実行時間 [s] を (段階 × ファイル) の DataFrame にする
+def running_time_table(file_dataframe):
+    run_values = []
+    file_names = []
+
+    for file_name, df in file_dataframe.items():
+        run_df = {}
+        enumeration = df['END_CF_ENUMERATION'].values[0] - df['START_CF_ENUMERATION'].values[0]
+        run_df['CF_ENUMERATION'] = enumeration
+        run_df['PLAN_ENUMERATION'] =  df['END_QUERY_PLAN_ENUMERATION'].values[0] - df['START_QUERY_PLAN_ENUMERATION'].values[0]
+        run_df['MIGPLAN_ENUMERATION'] = df['END_MIGRATION_PLAN_ENUMERATION'].values[0] - df['START_MIGRATION_PLAN_ENUMERATION'].values[0]
+        run_df['PRUNING'] =  df['END_PRUNING'].values[0] - df['START_PRUNING'].values[0]
+        run_df['OPTIMIZATION'] = df['END_WHOLE_OPTIMIZATION'].values[0] - df['START_WHOLE_OPTIMIZATION'].values[0]
+        run_df['OTHER'] = df['END'].values[0] - df['START'].values[0] - sum(run_df.values())
+
+        #run_dfs[file_name] = run_dataframe
+
+        print(run_df)
+
+        run_df_sec = {}
+        for k, v in run_df.items():
+            run_df_sec[k] = v / 1000.0
+
+        current_values = []
+        for c in run_columns:
+            current_values.append(run_df_sec[c])
+        run_values.append(current_values)
+        file_names.append(file_name.split('.')[0].split('/')[-1])
+
+    run_values_t = np.array(run_values).T.tolist()
+
+    return pd.DataFrame(run_values_t, index=run_columns, columns=file_names)
+
+
+def plot_running_time(run_dataframe):
+    import matplotlib as mpl
+    import matplotlib.pyplot as plt
+
+    #fig, ax = plt.subplots(figsize = (10, 0))
+    #for i in range(len(run_dataframe)):
+    #    ax.bar(run_dataframe.columns, run_dataframe.iloc[i], bottom=run_dataframe.iloc[:i].sum())
+    #ax.set(xlabel=file_name, ylabel='running time')
+    #ax.legend(run_dataframe.index)
+    #plt.savefig('tmp.jpg')
+
+    plt.rcParams["font.size"] = 17
+    plt.rcParams['figure.subplot.bottom'] = 0.15
+    fig = plt.figure(figsize=(10, 3))
+    ax = fig.add_subplot(1, 1, 1)
+    for i in range(len(run_dataframe)):
+        ax.bar(run_dataframe.columns, run_dataframe.iloc[i], bottom=run_dataframe.iloc[:i].sum(), linewidth=50)
+    ax.set(xlabel="workloads with various number of time step", ylabel='Running Time[s]')
+    ax.legend(run_dataframe.index)
+    ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter('{x:,.0f}'))
+    #plt.title("running time [s]")
+    plt.xticks(rotation=85)
+    #plt.yscale("log")
+    plt.subplots_adjust(left=0.2, right=0.95, bottom=0.53, top=0.9)
+    #plt.savefig('tmp.jpg')
+    return fig
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    index = None if args.no_cache else RunningTimeIndex()
+
+    file_dataframe = {}
+    for file_name in args.files:
+        print(file_name)
+        data_name = change_file_name(file_name.split("/")[-1])
+        file_dataframe[data_name] = running_time_dataframe(file_name, index)
+    if index is not None:
+        index.save()
+
+    print(file_dataframe)
+
+    run_dataframe = running_time_table(file_dataframe)
+
+    figures = {}
+    if args.scaling:
+        from scaling_curve import ScalingCurve
+        scaling_curve = ScalingCurve(run_dataframe)
+        scaling_curve.show_report(args.horizons)
+        figures["_scaling"] = scaling_curve.plot(args.horizons)
+    figures[""] = plot_running_time(run_dataframe)
+
+    import matplotlib.pyplot as plt
+    output = args.output
+    # 非対話的なバックエンドでは表示できないので書き出す
+    if output is None and plt.get_backend().lower() == "agg":
+        output = "running_time.pdf"
+    if output is None:
+        plt.show()
+        return
+    for suffix, fig in figures.items():
+        path = Path(output)
+        fig.savefig(path.with_name(path.stem + suffix + path.suffix))
+        print(path.with_name(path.stem + suffix + path.suffix))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import csv
+import json
+import mmap
+import os
+from pathlib import Path
+from parse_cache import ParseCache
+
+
+# search の出力から RunTimeLogger.write_running_times が出力する running time log を取り出す．
+# search は running time log の後に各 plan のコスト (print_each_plan_cost) と <txt format>, <json format> の
+# スキーマを出力するので，running time log は出力の最後ではない．
+# ファイルを memory map して末尾から後ろ向きに <txt format> を探し，その手前から running time log のマーカーを探す．
+# 読み込む量は探索の経過 (running time log の前の出力) にはよらないが，時刻の数に比例して大きくなるスキーマの出力には比例する．
+# 変更されていないファイルは RunningTimeIndex の索引から読むので，ファイルを読み込むのは最初の一度だけである．
+class RunningTimeExtractor:
+    START_MARKER = b"<running time log> ==========================="
+    END_MARKER = b"</running time log> ==========================="
+    SCHEMA_MARKER = b"<txt format>"
+
+    @classmethod
+    def extract(cls, file_name):
+        if os.path.getsize(file_name) == 0:
+            raise Exception("running time log is not found in " + file_name)
+        with open(file_name, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                schema = mm.rfind(RunningTimeExtractor.SCHEMA_MARKER)
+                end = mm.rfind(RunningTimeExtractor.END_MARKER, 0, schema if schema >= 0 else len(mm))
+                start = mm.rfind(RunningTimeExtractor.START_MARKER, 0, max(end, 0))
+                if end < 0 or start < 0:
+                    raise Exception("running time log is not found in " + file_name)
+                block = mm[start + len(RunningTimeExtractor.START_MARKER):end].decode()
+        lines = [l for l in block.splitlines() if l.strip() != ""]
+        columns, values = list(csv.reader(lines[:2]))
+        columns = [c.strip() for c in columns]
+        values = [int(v) if v.strip() != '' else 0 for v in values]
+        return columns, values
+
+
+# ファイルのパスと mtime, サイズから各フェーズの時刻への索引を ParseCache と同じディレクトリに保存し，
+# 変更されていないファイルは読み込まない
+class RunningTimeIndex:
+    INDEX_FILE_NAME = "running_time_index.json"
+
+    def __init__(self, cache_dir=None):
+        cache_dir = cache_dir or os.environ.get("COMPARE_BENCH_RESULT_CACHE_DIR", ParseCache.DEFAULT_CACHE_DIR)
+        self.index_path = Path(cache_dir) / RunningTimeIndex.INDEX_FILE_NAME
+        self.index = {}
+        if self.index_path.exists():
+            try:
+                with open(self.index_path) as f:
+                    self.index = json.load(f)
+            except json.JSONDecodeError:
+                self.index = {}
+
+    def extract(self, file_name):
+        key = str(Path(file_name).resolve())
+        stat = os.stat(file_name)
+        entry = self.index.get(key)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['columns'], entry['values']
+
+        columns, values = RunningTimeExtractor.extract(file_name)
+        self.index[key] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'columns': columns,
+            'values': values,
+        }
+        return columns, values
+
+    def save(self):
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = str(self.index_path) + ".tmp" + str(os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
@@ -0,0 +1,195 @@
+import re
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+# 各フェーズの実行時間を時刻数 (ファイル名の _Nts) の関数として variant ごとに回帰し，より大きな時刻数の実行時間を外挿する．
+# 線形, 2 次多項式, 指数 (実行時間の対数に対する線形回帰) のモデルを最小二乗法で当てはめ，AIC が最小のモデルを使う．
+class ScalingCurve:
+    RUN_NAME = re.compile(r'^(?P<variant>.+)_(?P<timestep>[0-9]+)ts$')
+    NO_PRUNING_SUFFIXES = ["_no_iterative", "_no_pruning"]
+    TOTAL = "TOTAL"
+    MODEL_DEGREES = {'linear': 1, 'polynomial': 2, 'exponential': 1}
+    CONFIDENCE = 0.95
+
+    # run_dataframe は (フェーズ × 実行) の実行時間 [s]
+    def __init__(self, run_dataframe):
+        runs = run_dataframe.T.copy()
+        runs[ScalingCurve.TOTAL] = runs.sum(axis=1)
+        names = runs.index.to_series().str.extract(ScalingCurve.RUN_NAME)
+        runs = runs[names['variant'].notna()]
+        names = names[names['variant'].notna()]
+        runs.index = pd.MultiIndex.from_arrays(
+            [names['variant'], names['timestep'].astype('int64')], names=['variant', 'timestep'])
+        self.runs = runs.sort_index()
+        self.phases = list(self.runs.columns)
+        self.models = self.__fit_all()
+
+    def variants(self):
+        return list(self.runs.index.get_level_values('variant').unique())
+
+    # variant, phase ごとの各モデルの当てはまり
+    def fits(self):
+        rows = []
+        for (variant, phase), models in self.models.items():
+            best = self.best_model(variant, phase)
+            for name, model in models.items():
+                rows.append({'variant': variant, 'phase': phase, 'model': name, 'r2': model['r2'],
+                             'aic': model['aic'], 'params': np.round(model['beta'], 6).tolist(),
+                             'best': name == best})
+        return pd.DataFrame(rows)
+
+    def best_model(self, variant, phase):
+        models = self.models[(variant, phase)]
+        if len(models) == 0:
+            return None
+        return min(models, key=lambda name: models[name]['aic'])
+
+    # 最良のモデルによる予測値と信頼区間
+    def predict(self, variant, phase, timesteps):
+        name = self.best_model(variant, phase)
+        timesteps = np.asarray(timesteps, dtype='float64')
+        if name is None:
+            nan = np.full(len(timesteps), np.nan)
+            return nan, nan, nan
+        model = self.models[(variant, phase)][name]
+        x = np.vander(timesteps, len(model['beta']))
+        fitted = x @ model['beta']
+        half_width = model['t'] * np.sqrt(np.einsum('ij,jk,ik->i', x, model['cov'], x))
+        if name == 'exponential':
+            return np.exp(fitted), np.exp(fitted - half_width), np.exp(fitted + half_width)
+        return fitted, fitted - half_width, fitted + half_width
+
+    def extrapolate(self, horizons):
+        rows = []
+        for variant in self.variants():
+            for phase in self.phases:
+                predicted, lower, upper = self.predict(variant, phase, horizons)
+                for idx, horizon in enumerate(horizons):
+                    rows.append({'variant': variant, 'phase': phase, 'timestep': horizon,
+                                 'model': self.best_model(variant, phase), 'seconds': predicted[idx],
+                                 'lower': lower[idx], 'upper': upper[idx]})
+        return pd.DataFrame(rows)
+
+    # 計測した最大の時刻数から horizon までの実行時間の増加が最も大きいフェーズ
+    def dominant_phases(self, horizon):
+        rows = []
+        for variant in self.variants():
+            last_timestep = self.runs.loc[variant].index.max()
+            growth = {}
+            for phase in self.phases:
+                if phase == ScalingCurve.TOTAL:
+                    continue
+                predicted, _, _ = self.predict(variant, phase, [last_timestep, horizon])
+                growth[phase] = predicted[1] - predicted[0]
+            growth = pd.Series(growth).dropna()
+            if len(growth) == 0:
+                continue
+            total_growth = growth.clip(lower=0).sum()
+            rows.append({'variant': variant, 'horizon': horizon, 'phase': growth.idxmax(),
+                         'growth': growth.max(),
+                         'share': growth.max() / total_growth if total_growth > 0 else np.nan})
+        return pd.DataFrame(rows)
+
+    # 反復的な枝刈りを行う variant と行わない variant (_no_iterative) の合計実行時間の差
+    def pruning_savings(self, horizons):
+        rows = []
+        variants = self.variants()
+        for no_pruning in variants:
+            pruning = ScalingCurve.pruning_variant(no_pruning)
+            if pruning is None or pruning not in variants:
+                continue
+            observed = self.runs.loc[no_pruning, ScalingCurve.TOTAL].to_frame('no_pruning') \
+                .join(self.runs.loc[pruning, ScalingCurve.TOTAL].to_frame('pruning'), how='inner')
+            for timestep, row in observed.iterrows():
+                rows.append(ScalingCurve.__saving_row(pruning, timestep, row['no_pruning'], row['pruning'], False))
+            no_pruning_predicted, _, _ = self.predict(no_pruning, ScalingCurve.TOTAL, horizons)
+            pruning_predicted, _, _ = self.predict(pruning, ScalingCurve.TOTAL, horizons)
+            for idx, horizon in enumerate(horizons):
+                rows.append(ScalingCurve.__saving_row(pruning, horizon, no_pruning_predicted[idx],
+                                                      pruning_predicted[idx], True))
+        return pd.DataFrame(rows)
+
+    @classmethod
+    def pruning_variant(cls, variant):
+        for suffix in ScalingCurve.NO_PRUNING_SUFFIXES:
+            if suffix in variant:
+                return variant.replace(suffix, "")
+        return None
+
+    def show_report(self, horizons):
+        print("=== scaling models ===")
+        print(self.fits().to_string())
+        print("=== extrapolated running time [s] (" + str(int(ScalingCurve.CONFIDENCE * 100)) + "% confidence) ===")
+        print(self.extrapolate(horizons).to_string())
+        print("=== dominant phase of the growth ===")
+        print(self.dominant_phases(max(horizons)).to_string())
+        print("=== savings of the iterative pruning ===")
+        print(self.pruning_savings(horizons).to_string())
+
+    # variant ごとの合計実行時間の計測値と最良のモデル，信頼区間
+    def plot(self, horizons):
+        fig = plt.figure(figsize=(10, 5))
+        ax = fig.add_subplot(1, 1, 1)
+        timesteps = np.linspace(self.runs.index.get_level_values('timestep').min(), max(horizons), 200)
+        for variant in self.variants():
+            observed = self.runs.loc[variant, ScalingCurve.TOTAL]
+            predicted, lower, upper = self.predict(variant, ScalingCurve.TOTAL, timesteps)
+            line = ax.plot(timesteps, predicted,
+                           label=variant + " (" + str(self.best_model(variant, ScalingCurve.TOTAL)) + ")")[0]
+            ax.fill_between(timesteps, lower, upper, color=line.get_color(), alpha=0.2)
+            ax.scatter(observed.index, observed.values, color=line.get_color())
+        ax.set(xlabel="number of time steps", ylabel='Running Time[s]')
+        ax.legend()
+        return fig
+
+    def __fit_all(self):
+        models = {}
+        for variant in self.variants():
+            runs = self.runs.loc[variant]
+            x = runs.index.to_numpy(dtype='float64')
+            for phase in self.phases:
+                y = runs[phase].to_numpy(dtype='float64')
+                models[(variant, phase)] = {}
+                for name, degree in ScalingCurve.MODEL_DEGREES.items():
+                    model = ScalingCurve.fit(x, y, name, degree)
+                    if model is not None:
+                        models[(variant, phase)][name] = model
+        return models
+
+    # 信頼区間を求めるために係数の数より 2 点以上多い計測が必要
+    @classmethod
+    def fit(cls, x, y, name, degree):
+        if len(x) < degree + 3:
+            return None
+        target = y
+        if name == 'exponential':
+            if np.any(y <= 0):
+                return None
+            target = np.log(y)
+        vander = np.vander(x, degree + 1)
+        beta, _, _, _ = np.linalg.lstsq(vander, target, rcond=None)
+        dof = len(x) - (degree + 1)
+        sigma2 = np.sum((target - vander @ beta) ** 2) / dof
+        cov = sigma2 * np.linalg.pinv(vander.T @ vander)
+
+        fitted = vander @ beta
+        if name == 'exponential':
+            fitted = np.exp(fitted)
+        rss = max(np.sum((y - fitted) ** 2), np.finfo('float64').tiny)
+        tss = np.sum((y - y.mean()) ** 2)
+        return {
+            'beta': beta,
+            'cov': cov,
+            't': stats.t.ppf((1 + ScalingCurve.CONFIDENCE) / 2, dof),
+            'r2': 1 - rss / tss if tss > 0 else np.nan,
+            'aic': len(x) * np.log(rss / len(x)) + 2 * (degree + 1),
+        }
+
+    @classmethod
+    def __saving_row(cls, variant, timestep, no_pruning, pruning, extrapolated):
+        return {'variant': variant, 'timestep': timestep, 'extrapolated': extrapolated,
+                'no_pruning': no_pruning, 'pruning': pruning, 'saved': no_pruning - pruning,
+                'saved_ratio': (no_pruning - pruning) / no_pruning if no_pruning > 0 else np.nan}
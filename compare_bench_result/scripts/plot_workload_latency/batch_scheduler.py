@@ -0,0 +1,218 @@
+import argparse
+import json
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from graphlib import TopologicalSorter
+from pathlib import Path
+import pandas as pd
+from graph import Graph
+from parallel_loader import ParallelLoader
+from parse_cache import ParseCache
+from render_farm import RenderFarm
+from stage_profiler import StageProfiler
+from statement_index import StatementIndex
+from upseart import Upseart
+import plot_workload_latency
+
+# manifest に書いた複数の比較 (plot_workload_latency.py の一回の実行に相当する) を一つのプロセスでまとめて実行する．
+# 全ての比較を (読み込み -> 集計 -> 比較の各段階 -> 描画) の DAG として計画し，
+# 複数の比較に現れる同じファイルは一度だけ読み込んで集計する．
+# 読み込みは workers 個のプロセスプールで並列に行い，比較の各段階が登録した図は最後に RenderFarm の
+# render_workers 個のプロセスプールでまとめて描画する．各ジョブの時間は timings (JSON) に書き出す．
+# usage: python batch_scheduler.py manifest.json [--workers N] [--render-workers N] [--timings batch_timings.json]
+#
+# manifest の形式 (ファイルのパスは manifest からの相対パス):
+# {"comparisons": [{"name": "cyclic", "files": ["cyclic/prop.csv", "base.csv"],
+#                   "output_dir": "cyclic", "stages": ["plot", "diff"]}, ...]}
+# output_dir を省略した場合は最初のファイルのディレクトリに，stages を省略した場合は DEFAULT_STAGES を実行する．
+
+BatchJob = namedtuple('BatchJob', ['name', 'kind', 'target', 'depends'])
+
+
+class BatchScheduler:
+    STAGES = ["plot", "heatmap", "diff", "r2", "writes"]
+    DEFAULT_STAGES = ["plot", "diff"]
+
+    def __init__(self, manifest_path, workers=1, raw_log=False, use_cache=True, compact=False):
+        self.workers = workers
+        self.raw_log = raw_log
+        self.use_cache = use_cache
+        self.compact = compact
+        self.comparisons = BatchScheduler.read_manifest(manifest_path)
+        self.frames = {}
+        self.indexes = {}
+        self.totals = {}
+        self.timings = []
+
+    @classmethod
+    def read_manifest(cls, manifest_path):
+        base_dir = Path(manifest_path).resolve().parent
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        comparisons = []
+        for idx, comparison in enumerate(manifest['comparisons']):
+            files = [str((base_dir / f).resolve()) for f in comparison['files']]
+            labels = [Path(f).stem for f in files]
+            if len(set(labels)) != len(labels):
+                raise Exception('labels of a comparison must be unique: ' + str(comparison['files']))
+            stages = comparison.get('stages', BatchScheduler.DEFAULT_STAGES)
+            for stage in stages:
+                if stage not in BatchScheduler.STAGES:
+                    raise Exception('unknown stage ' + stage + ' (' + ", ".join(BatchScheduler.STAGES) + ')')
+            output_dir = str(base_dir / comparison['output_dir']) if 'output_dir' in comparison \
+                else str(Path(files[0]).parent)
+            comparisons.append({'name': comparison.get('name', str(idx)), 'labels': dict(zip(labels, files)),
+                                'output_dir': output_dir, 'stages': stages,
+                                'tail_latency': comparison.get('tail_latency'),
+                                'cluster_statements': comparison.get('cluster_statements', False)})
+        return comparisons
+
+    # ジョブ名からジョブへの dict (依存するジョブが先に並ぶ)
+    def plan(self):
+        jobs = {}
+        stage_jobs = []
+        for comparison in self.comparisons:
+            for file_name in comparison['labels'].values():
+                load = "load:" + file_name
+                jobs.setdefault(load, BatchJob(load, "load", file_name, ()))
+                aggregate = "aggregate:" + file_name
+                jobs.setdefault(aggregate, BatchJob(aggregate, "aggregate", file_name, (load,)))
+            depends = tuple("aggregate:" + f for f in comparison['labels'].values())
+            for stage in comparison['stages']:
+                name = comparison['name'] + ":" + stage
+                jobs[name] = BatchJob(name, stage, comparison, depends)
+                stage_jobs.append(name)
+        jobs["render"] = BatchJob("render", "render", None, tuple(stage_jobs))
+        return jobs
+
+    def run(self, render_farm):
+        jobs = self.plan()
+        sorter = TopologicalSorter({name: job.depends for name, job in jobs.items()})
+        sorter.prepare()
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        futures = {}
+        try:
+            while sorter.is_active():
+                for name in sorter.get_ready():
+                    job = jobs[name]
+                    if job.kind == "load" and executor is not None:
+                        futures[executor.submit(BatchScheduler.load_to_shared_dir, job.target, self.raw_log,
+                                                self.use_cache, self.compact)] = (job, time.perf_counter())
+                        continue
+                    self.__run_job(job, render_farm)
+                    sorter.done(name)
+                if len(futures) > 0:
+                    finished, _ = wait(list(futures.keys()), return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        job, start = futures.pop(future)
+                        shared_dir, worker_seconds = future.result()
+                        read_start = time.perf_counter()
+                        self.frames[job.target] = ParallelLoader.read_shared_dir(shared_dir)
+                        self.__record(job, time.perf_counter() - start, worker_seconds=worker_seconds,
+                                      read_seconds=time.perf_counter() - read_start)
+                        sorter.done(job.name)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return self.timings
+
+    # プロセスプールのワーカーで実行し，読み込みにかかった時間も返す
+    @classmethod
+    def load_to_shared_dir(cls, file_name, raw_log, use_cache, compact):
+        start = time.perf_counter()
+        shared_dir = ParallelLoader.load_to_shared_dir(file_name, raw_log, use_cache, compact)
+        return shared_dir, time.perf_counter() - start
+
+    def __run_job(self, job, render_farm):
+        start = time.perf_counter()
+        with StageProfiler.stage(job.kind):
+            if job.kind == "load":
+                self.frames[job.target] = ParallelLoader.load_file(
+                    job.target, self.raw_log, ParseCache() if self.use_cache else None, self.compact)
+            elif job.kind == "aggregate":
+                df = self.frames[job.target]
+                self.indexes[job.target] = StatementIndex(df)
+                self.totals[job.target] = plot_workload_latency.get_total_weighted_avg_matrix({Path(job.target).stem: df})
+            elif job.kind == "render":
+                results = render_farm.render_all()
+                self.__record(job, time.perf_counter() - start, figures=len(results))
+                for comparison in self.comparisons:
+                    self.__record_render(comparison, results)
+                return
+            else:
+                print("=== " + job.name + " ===")
+                self.__run_stage(job.kind, job.target)
+        self.__record(job, time.perf_counter() - start)
+
+    def __run_stage(self, stage, comparison):
+        dir_name = comparison['output_dir']
+        label_dfs_hash = {label: self.frames[f] for label, f in comparison['labels'].items()}
+        label_grouped_dfs_hash = {label: self.indexes[f] for label, f in comparison['labels'].items()}
+        totals = pd.concat([self.totals[f] for f in comparison['labels'].values()])
+        if stage == "plot":
+            plot_workload_latency.plot_weighted_total_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash, totals)
+            plot_workload_latency.plot_unweighted_group_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash)
+            plot_workload_latency.plot_unweighted_query_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash)
+            Upseart.plot_unweighted_upsert_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash,
+                                                   plot_workload_latency.EVALUATION_RESULT_COLUMN)
+            plot_workload_latency.plot_queries(dir_name, label_grouped_dfs_hash, comparison['tail_latency'])
+        elif stage == "heatmap":
+            plot_workload_latency.plot_query_heatmap(dir_name, label_dfs_hash, comparison['cluster_statements'])
+        elif stage == "diff":
+            plot_workload_latency.show_weighted_latency_reduction(dir_name, totals)
+        elif stage == "r2":
+            plot_workload_latency.calculate_r2(dir_name, label_dfs_hash)
+        elif stage == "writes":
+            Upseart.show_write_amplification(dir_name, label_dfs_hash, plot_workload_latency.EVALUATION_RESULT_COLUMN)
+
+    def __record(self, job, seconds, **values):
+        record = {'job': job.name, 'kind': job.kind, 'depends': list(job.depends), 'seconds': seconds}
+        record.update(values)
+        self.timings.append(record)
+
+    # 比較の出力先に描画した図の数と描画時間の合計
+    def __record_render(self, comparison, results):
+        prefix = comparison['output_dir'] + "/"
+        render_times = [t for output_path, t in results if output_path.startswith(prefix)]
+        self.timings.append({'job': comparison['name'] + ":figures", 'kind': "figures", 'depends': ["render"],
+                             'seconds': sum(render_times), 'figures': len(render_times)})
+
+    @classmethod
+    def show_report(cls, timings):
+        print("=== batch jobs ===")
+        for record in timings:
+            print("  " + "{:9.3f}".format(record['seconds']) + " [s]  " + record['kind'].ljust(10) + record['job'])
+        print("  " + "{:9.3f}".format(sum(r['seconds'] for r in timings if r['kind'] != "figures"))
+              + " [s]  total")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('manifest', help='JSON file which lists the comparisons')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes to load the files in parallel')
+    parser.add_argument('--render-workers', type=int, default=1, help='number of processes to render the figures')
+    parser.add_argument('--no-cache', action='store_true', help='parse every file without the columnar parse cache')
+    parser.add_argument('--raw-log', action='store_true',
+                        help='files are raw td_benchmark outputs which are not formatted by bench_res_formatter.rb. '
+                             'all result rows are kept in memory as with formatted files')
+    parser.add_argument('--compact', action='store_true',
+                        help='keep label, group and name as categories and downcast numeric columns')
+    parser.add_argument('--force-render', action='store_true', help='render every figure even if its inputs are unchanged')
+    parser.add_argument('--timings', default="batch_timings.json", help='JSON file to write the time of each job')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scheduler = BatchScheduler(args.manifest, args.workers, args.raw_log, not args.no_cache, args.compact)
+    Graph.render_farm = RenderFarm(args.render_workers, args.force_render, mode="batch")
+    timings = scheduler.run(Graph.render_farm)
+    BatchScheduler.show_report(timings)
+    with open(args.timings, 'w') as f:
+        json.dump({'jobs': timings}, f, indent=1)
+    print(args.timings)
+
+
+if __name__ == '__main__':
+    main()
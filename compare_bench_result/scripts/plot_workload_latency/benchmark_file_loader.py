@@ -0,0 +1,36 @@
+import sys
+import time
+import pandas as pd
+from file_loader import FileLoader
+
+# FileLoader.file2dataframe の pyparsing 実装と arrow 実装の読み込み時間を比較する
+# usage: python benchmark_file_loader.py <td_benchmark csv> [<td_benchmark csv> ...]
+
+
+def measure(file_path, engine, repeat):
+    elapsed = []
+    df = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = FileLoader.parse_file(file_path, engine)
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed), df
+
+
+def main():
+    repeat = 3
+    for file_path in sys.argv[1:]:
+        pyparsing_time, pyparsing_df = measure(file_path, "pyparsing", repeat)
+        arrow_time, arrow_df = measure(file_path, "arrow", repeat)
+        # pyparsing 実装は values 列の引用符を取り除かないので比較対象から外す
+        compared_columns = [c for c in pyparsing_df.columns if c != 'values']
+        pd.testing.assert_frame_equal(pyparsing_df[compared_columns], arrow_df[compared_columns], check_dtype=False)
+
+        print(file_path + " (" + str(len(arrow_df)) + " rows)")
+        print("  pyparsing: " + "{:.3f}".format(pyparsing_time) + " [s]")
+        print("  arrow:     " + "{:.3f}".format(arrow_time) + " [s]")
+        print("  speedup:   " + "{:.1f}".format(pyparsing_time / arrow_time) + "x")
+
+
+if __name__ == '__main__':
+    main()
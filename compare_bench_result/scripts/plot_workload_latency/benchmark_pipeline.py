@@ -0,0 +1,178 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from matplotlib import pyplot
+from file_loader import FileLoader
+from graph import Graph, PlotSpec
+from latency_aggregator import LatencyAggregator
+from stage_profiler import StageProfiler
+from statement_index import StatementIndex
+from synthetic_results import SyntheticResults
+
+# synthetic_results.py で生成した td_benchmark の結果に対して，読み込み, 文ごとの分割, 集計, 描画の処理量と最大メモリ使用量を計測する．
+# 最大メモリ使用量は tracemalloc で追跡した Python のメモリと，読み込みで使う Arrow のメモリプールのそれぞれの最大値である．
+# 結果は履歴ファイル (JSON Lines) に追記し，同じ設定の前回の結果より tolerance 以上遅いか多くのメモリを使う段階を報告する．
+# usage: python benchmark_pipeline.py [--timesteps N] [--statements N] [--groups N] [--labels N] [--samples N]
+#                                     [--history benchmark_history.jsonl] [--fail-on-regression]
+
+STAGES = ["load", "group", "aggregate", "render"]
+
+
+def run_pipeline(paths, figures, output_dir):
+    with StageProfiler.stage("load"):
+        dfs = {Path(p).stem: FileLoader.file2dataframe(p) for p in paths}
+    with StageProfiler.stage("group"):
+        indexes = {label: StatementIndex(df) for label, df in dfs.items()}
+        for index in indexes.values():
+            for statement in index.keys():
+                index[statement]
+    with StageProfiler.stage("aggregate"):
+        for df in dfs.values():
+            LatencyAggregator.avg_query_latency(df, 'mean')
+            LatencyAggregator.weighted_avg_group_latency_matrix(
+                df, 'mean', LatencyAggregator.statement_weight_totals(df, FileLoader.weight_matrix(df)))
+            LatencyAggregator.upsert_latency_sum(df, 'mean')
+            LatencyAggregator.tail_latency(df, FileLoader.samples(df))
+    with StageProfiler.stage("render"):
+        queries = list(indexes.values())[0].keys_of_kind("SELECT")[:figures]
+        for statement in queries:
+            label_data_hash = {label: index.statement_df(statement)['mean'].tolist() for label, index in indexes.items()}
+            label_se_hash = {label: index.statement_df(statement)['standard_error'].tolist()
+                             for label, index in indexes.items()}
+            Graph.render(PlotSpec(output_dir, statement, "timestep", "latency [s]", label_data_hash, label_se_hash,
+                                  None, ""))
+    return sum(len(df) for df in dfs.values()), len(queries)
+
+
+def measure(paths, figures, output_dir, repeat):
+    seconds = {stage: float('inf') for stage in STAGES}
+    for _ in range(repeat):
+        profiler = StageProfiler()
+        profiler.start()
+        rows, rendered = run_pipeline(paths, figures, output_dir)
+        profiler.stop()
+        for stage in STAGES:
+            seconds[stage] = min(seconds[stage], profiler.stats[StageProfiler.ROOT + ";" + stage]['wall_seconds'])
+
+    # tracemalloc は処理を遅くするので，メモリ使用量は別に一度だけ計測する
+    profiler = StageProfiler(trace_memory=True)
+    profiler.start()
+    run_pipeline(paths, figures, output_dir)
+    profiler.stop()
+
+    counts = {'load': rows, 'group': rows, 'aggregate': rows, 'render': rendered}
+    units = {'load': "rows/s", 'group': "rows/s", 'aggregate': "rows/s", 'render': "figures/s"}
+    result = {}
+    for stage in STAGES:
+        result[stage] = {
+            'seconds': seconds[stage],
+            'throughput': counts[stage] / seconds[stage] if seconds[stage] > 0 else None,
+            'unit': units[stage],
+            'traced_peak_bytes': profiler.stats[StageProfiler.ROOT + ";" + stage]['traced_peak_bytes'],
+            'arrow_peak_bytes': profiler.stats[StageProfiler.ROOT + ";" + stage]['arrow_peak_bytes'],
+        }
+    return result
+
+
+def current_version():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_record(history_path, config):
+    if not os.path.exists(history_path):
+        return None
+    previous = None
+    with open(history_path) as f:
+        for line in f:
+            if line.strip() == "":
+                continue
+            record = json.loads(line)
+            if record['config'] == config:
+                previous = record
+    return previous
+
+
+MEMORY_METRICS = ['traced_peak_bytes', 'arrow_peak_bytes']
+
+
+# 前回より tolerance 以上遅いか多くのメモリを使う段階．前回の記録に無い指標は比べない
+def regressions(record, previous, tolerance):
+    found = []
+    if previous is None:
+        return found
+    for stage in STAGES:
+        current, before = record['stages'][stage], previous['stages'][stage]
+        for metric in ['seconds'] + MEMORY_METRICS:
+            if before.get(metric) and current[metric] > before[metric] * (1 + tolerance):
+                found.append((stage, metric, before[metric], current[metric]))
+    return found
+
+
+def show_report(record, previous, found):
+    print("version " + record['version'] + " (" + json.dumps(record['config']) + ")")
+    for stage in STAGES:
+        result = record['stages'][stage]
+        line = "  " + stage.ljust(10) + "{:9.3f}".format(result['seconds']) + " [s] " \
+               + "{:14.1f}".format(result['throughput'] or 0) + " " + result['unit'].ljust(10) \
+               + "{:9.1f}".format(result['traced_peak_bytes'] / 1024 ** 2) + " [MiB] (traced) " \
+               + "{:9.1f}".format(result['arrow_peak_bytes'] / 1024 ** 2) + " [MiB] (arrow)"
+        if previous is not None:
+            line += "  (x" + "{:.2f}".format(result['seconds'] / previous['stages'][stage]['seconds']) \
+                    + " time of " + previous['version'] + ")"
+        print(line)
+    for stage, metric, before, current in found:
+        print("regression: " + stage + " " + metric + " " + str(before) + " -> " + str(current))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--timesteps', type=int, default=12)
+    parser.add_argument('--statements', type=int, default=20, help='number of statements in each group')
+    parser.add_argument('--groups', type=int, default=4)
+    parser.add_argument('--labels', type=int, default=3)
+    parser.add_argument('--samples', type=int, default=10, help='number of samples of each measurement')
+    parser.add_argument('--figures', type=int, default=10, help='number of query figures to render')
+    parser.add_argument('--repeat', type=int, default=3, help='the fastest of REPEAT runs is recorded')
+    parser.add_argument('--history', default="benchmark_history.jsonl", help='JSON Lines file to append the result')
+    parser.add_argument('--version', default=None, help='name of the measured version (default: git revision)')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown ratio from the previous result')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit with 1 if any stage regressed')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    pyplot.switch_backend("Agg")
+    config = {'timesteps': args.timesteps, 'statements': args.statements, 'groups': args.groups,
+              'labels': args.labels, 'samples': args.samples, 'figures': args.figures}
+    work_dir = tempfile.mkdtemp(prefix="benchmark_pipeline_")
+    try:
+        results = SyntheticResults(args.timesteps, args.statements, args.groups, args.samples)
+        paths = results.write_labels(work_dir, args.labels)
+        stages = measure(paths, args.figures, work_dir, args.repeat)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    record = {'version': args.version or current_version(), 'time': datetime.datetime.now().isoformat(),
+              'config': config, 'stages': stages}
+    previous = previous_record(args.history, config)
+    found = regressions(record, previous, args.tolerance)
+    show_report(record, previous, found)
+    with open(args.history, 'a') as f:
+        f.write(json.dumps(record) + "\n")
+    if args.fail_on_regression and len(found) > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import warnings
+import numpy as np
+import pandas as pd
+
+
+# td_benchmark の各計測の全実行時間 (SampleArray) を再標本化して，平均応答時間のブートストラップ信頼区間と検定を求める．
+# 全ての計測の再標本化を NumPy でまとめて行い，一度に使うメモリが max_batch_bytes を超えないように計測 (行) を分割する．
+# 各バッチの再標本化した平均 (行 × resamples) は呼び出し側で集計して捨てるので，全体のメモリ使用量も行数に比例しない．
+class Bootstrap:
+    DEFAULT_RESAMPLES = 1000
+    DEFAULT_MAX_BATCH_BYTES = 256 * 1024 ** 2
+    # 一つの値の再標本化に使う配列 (乱数, 添字, 値) の大きさ
+    BYTES_PER_DRAW = 24
+
+    def __init__(self, resamples=DEFAULT_RESAMPLES, seed=None, confidence=0.95, max_batch_bytes=DEFAULT_MAX_BATCH_BYTES):
+        self.resamples = resamples
+        self.rng = np.random.default_rng(seed)
+        self.confidence = confidence
+        self.max_batch_bytes = max_batch_bytes
+
+    # 行数の等しい sample_arrays の同じ行の範囲ごとに，各 SampleArray の再標本化した平均 (行 × resamples) を返す
+    def batches(self, sample_arrays):
+        row_num = len(sample_arrays[0].offsets) - 1
+        if row_num == 0:
+            return
+        costs = np.sum([sa.lengths() for sa in sample_arrays], axis=0) * self.resamples * Bootstrap.BYTES_PER_DRAW
+        batch_ids = (np.cumsum(costs) - costs) // self.max_batch_bytes
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(batch_ids)) + 1, [row_num]])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            yield start, end, [self.__resample_means(sa, start, end) for sa in sample_arrays]
+
+    def __resample_means(self, sample_array, start, end):
+        lengths = sample_array.lengths()[start:end]
+        offsets = sample_array.offsets[start:end + 1]
+        means = np.full((end - start, self.resamples), np.nan)
+        if offsets[-1] == offsets[0]:
+            return means
+        draws = self.rng.random((self.resamples, offsets[-1] - offsets[0]))
+        draws = (draws * np.repeat(lengths, lengths)).astype('int64') + np.repeat(offsets[:-1], lengths)
+        values = sample_array.flat[draws]
+        has_samples = lengths > 0
+        sums = np.add.reduceat(values, (offsets[:-1] - offsets[0])[has_samples], axis=1)
+        means[has_samples] = (sums / lengths[has_samples]).T
+        return means
+
+    # 再標本化した値 (... × resamples) のパーセンタイル信頼区間．実行時間の無い計測は nan になる
+    def interval(self, replicates):
+        alpha = (1 - self.confidence) / 2
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanpercentile(replicates, [alpha * 100, (1 - alpha) * 100], axis=-1)
+
+    # 差が 0 であることの両側検定の p 値
+    @classmethod
+    def p_value(cls, differences):
+        valid = np.sum(~np.isnan(differences), axis=-1)
+        lower = np.sum(differences <= 0, axis=-1) / np.maximum(valid, 1)
+        upper = np.sum(differences >= 0, axis=-1) / np.maximum(valid, 1)
+        return np.where(valid > 0, np.minimum(2 * np.minimum(lower, upper), 1.0), np.nan)
+
+    # 各計測の平均応答時間の信頼区間 (行 × [下限, 上限])
+    def mean_intervals(self, samples):
+        result = np.full((len(samples.offsets) - 1, 2), np.nan)
+        for start, end, (means,) in self.batches([samples]):
+            result[start:end] = self.interval(means).T
+        return result
+
+    # 同じ statement の同じ時刻の計測を行ごとに対応させた二つの SampleArray の平均の差 (a - b) の信頼区間と p 値
+    def compare(self, samples_a, samples_b):
+        row_num = len(samples_a.offsets) - 1
+        result = pd.DataFrame({'lower': np.full(row_num, np.nan), 'upper': np.full(row_num, np.nan),
+                               'p_value': np.full(row_num, np.nan)})
+        for start, end, (means_a, means_b) in self.batches([samples_a, samples_b]):
+            differences = means_a - means_b
+            lower, upper = self.interval(differences)
+            result.iloc[start:end, 0] = lower
+            result.iloc[start:end, 1] = upper
+            result.iloc[start:end, 2] = Bootstrap.p_value(differences)
+        return result
+
+    # 実行頻度で重み付けした各時刻の平均応答時間 (LatencyAggregator.weighted_total_latency_matrix の 1 行) を再標本化した値
+    # (timestep × resamples)．samples, weights, timesteps は TOTAL 以外の各計測の行
+    def weighted_total_replicates(self, samples, weights, timesteps, total_weights):
+        total_weights = np.asarray(total_weights, dtype='float64')
+        sums = np.zeros((len(total_weights), self.resamples))
+        for start, end, (means,) in self.batches([samples]):
+            np.add.at(sums, timesteps[start:end], np.nan_to_num(weights[start:end, None] * means))
+        return sums / total_weights[:, None]
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from statement_index import StatementIndex
+
+
+# コストモデルの見積もり (cost 列) と実測の平均応答時間の一致度を，全ての label の全ての計測をまとめた groupby で求める．
+# cost は秒ではなくオプティマイザの単位なので，label と statement の種類 (SELECT, INSERT, UPDATE) ごとに
+# log(cost / mean) の平均 (対数での最小二乗) を単位の差 (scale = cost / 秒) とみなし，cost / scale を秒に換算した見積もりとする．
+# statement ごと，statement の種類ごとに，換算した見積もりの R^2, MAPE, 見積もりと実測の比の対数の平均と絶対値の平均と，
+# Spearman の順位相関係数を計算する．
+class CostAccuracy:
+    METRICS = ['count', 'scale', 'r2', 'mape', 'log_ratio', 'abs_log_ratio', 'spearman']
+
+    def __init__(self, label_dfs_hash, column):
+        frames = []
+        for label, df in label_dfs_hash.items():
+            statements = df[(df['name'] != "TOTAL") & df['cost'].notna() & (df[column] > 0) & (df['cost'] > 0)]
+            frames.append(pd.DataFrame({
+                'label': label,
+                'statement': (statements['group'].astype(str) + "_" + statements['name'].astype(str)).to_numpy(),
+                'kind': statements['name'].map(StatementIndex.kind_of).to_numpy(),
+                'actual': statements[column].to_numpy(dtype='float64'),
+                'cost': statements['cost'].to_numpy(dtype='float64'),
+            }))
+        measurements = pd.concat(frames, ignore_index=True) if len(frames) > 0 else pd.DataFrame(
+            columns=['label', 'statement', 'kind', 'actual', 'cost'], dtype='float64')
+        scale = np.exp(np.log(measurements['cost'] / measurements['actual'])
+                       .groupby([measurements['label'], measurements['kind']]).transform('mean'))
+        self.measurements = measurements.assign(scale=scale, estimated=measurements['cost'] / scale)
+
+    def by_statement(self):
+        return CostAccuracy.metrics(self.measurements, ['label', 'kind', 'statement'])
+
+    def by_kind(self):
+        return CostAccuracy.metrics(self.measurements, ['label', 'kind'])
+
+    # 単位の差を除いた見積もりと実測の比の対数の平均 (見積もりの偏り) の絶対値が大きい statement．
+    # log_ratio が正の statement は過大に，負の statement は過小に見積もられている
+    def worst_statements(self, n):
+        return self.by_statement().sort_values('log_ratio', ascending=False, key=np.abs).head(n)
+
+    # 各グループの指標を，グループごとの合計だけから求める
+    @classmethod
+    def metrics(cls, measurements, keys):
+        m = measurements.assign(
+            log_ratio=np.log(measurements['estimated'] / measurements['actual']),
+            ape=np.abs(measurements['estimated'] - measurements['actual']) / measurements['actual'])
+        m['abs_log_ratio'] = m['log_ratio'].abs()
+        grouped = m.groupby(keys, sort=True)
+        # 順位相関はグループ内の順位の Pearson の相関係数
+        m['actual_rank'] = grouped['actual'].rank()
+        m['estimated_rank'] = grouped['estimated'].rank()
+        m['actual_mean'] = grouped['actual'].transform('mean')
+        m['squared_error'] = (m['actual'] - m['estimated']) ** 2
+        m['squared_deviation'] = (m['actual'] - m['actual_mean']) ** 2
+        m['rank_product'] = m['actual_rank'] * m['estimated_rank']
+        m['actual_rank_square'] = m['actual_rank'] ** 2
+        m['estimated_rank_square'] = m['estimated_rank'] ** 2
+
+        sums = m.groupby(keys, sort=True).agg(
+            count=('actual', 'size'), scale=('scale', 'median'), mape=('ape', 'mean'), log_ratio=('log_ratio', 'mean'),
+            abs_log_ratio=('abs_log_ratio', 'mean'), squared_error=('squared_error', 'sum'),
+            squared_deviation=('squared_deviation', 'sum'), actual_rank=('actual_rank', 'sum'),
+            estimated_rank=('estimated_rank', 'sum'), rank_product=('rank_product', 'sum'),
+            actual_rank_square=('actual_rank_square', 'sum'), estimated_rank_square=('estimated_rank_square', 'sum'))
+
+        n = sums['count']
+        covariance = sums['rank_product'] - sums['actual_rank'] * sums['estimated_rank'] / n
+        actual_variance = sums['actual_rank_square'] - sums['actual_rank'] ** 2 / n
+        estimated_variance = sums['estimated_rank_square'] - sums['estimated_rank'] ** 2 / n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sums['r2'] = np.where(sums['squared_deviation'] > 0, 1 - sums['squared_error'] / sums['squared_deviation'],
+                                  np.nan)
+            sums['spearman'] = covariance / np.sqrt(actual_variance * estimated_variance)
+        sums.loc[(actual_variance <= 0) | (estimated_variance <= 0), 'spearman'] = np.nan
+        return sums[CostAccuracy.METRICS].reset_index()
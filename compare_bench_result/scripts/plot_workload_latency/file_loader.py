@@ -1,21 +1,163 @@
+import csv
+import hashlib
 import pandas as pd
 import pyparsing as pp
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
+from statement_index import StatementIndex
+from weight_matrix import WeightMatrix
+from sample_array import SampleArray
 
 
 class FileLoader:
+    # td_benchmark の td_output_csv が出力する列の型
+    COLUMN_TYPES = {
+        'timestep': pa.int64(),
+        'label': pa.string(),
+        'group': pa.string(),
+        'name': pa.string(),
+        'weight': pa.string(),
+        'mean': pa.float64(),
+        'cost': pa.float64(),
+        'standard_error': pa.float64(),
+        'middle_mean': pa.float64(),
+        'values': pa.string(),
+    }
+    # parse_file が返す DataFrame (ParseCache に保存する内容) を変更した場合は値を変える．
+    # decode_arrays と compact はキャッシュから読み込んだ後に行うので，キャッシュの内容には含まれない
+    PARSE_VERSION = 2
+    # compact で category 型にする列と捨てる列
+    CATEGORICAL_COLUMNS = ['label', 'group', 'name']
+    UNUSED_TEXT_COLUMNS = ['weight']
+
+    @classmethod
+    def file2dataframe(cls, file_path, engine="arrow", cache=None):
+        if cache is not None:
+            df = cache.load(file_path, lambda path: cls.parse_file(path, engine), cls.cache_namespace(engine))
+        else:
+            df = cls.parse_file(file_path, engine)
+        return cls.decode_arrays(df)
+
+    # values, weight 列の数値のリストを SampleArray, WeightMatrix に変換して df.attrs に保持する
+    @classmethod
+    def decode_arrays(cls, df, samples=None):
+        if 'values' in df.columns:
+            # 実行時間は SampleArray として保持するので，文字列の列は残さない
+            samples = SampleArray(*cls.parse_number_lists(df['values']))
+            df = df.drop(columns=['values'])
+        if samples is not None:
+            df.attrs['samples'] = samples
+        if 'weight' in df.columns:
+            flat, offsets = cls.parse_number_lists(df['weight'])
+            is_list = df['weight'].str.startswith("[").to_numpy(dtype=bool)
+            df.attrs['weight_matrix'] = WeightMatrix.from_number_lists(flat, offsets, is_list)
+        return df
+
+    # ParseCache のキーとサイドカーの名前に使う名前空間．列の型か PARSE_VERSION が変わると別の名前空間になるので，
+    # 以前の形式のサイドカーは使われずに LRU で削除される
+    @classmethod
+    def cache_namespace(cls, engine):
+        schema = str(cls.PARSE_VERSION) + ";" + ";".join(c + "=" + str(t) for c, t in cls.COLUMN_TYPES.items())
+        return "td_benchmark_" + engine + "_" + hashlib.blake2b(schema.encode(), digest_size=4).hexdigest()
+
+    # label, group, name 列を category 型に，数値の列を値が変わらない範囲で小さい型に変換し，
+    # 実行頻度を WeightMatrix に変換した後は使わない weight 列の文字列を捨てる
+    @classmethod
+    def compact(cls, df):
+        df = df.drop(columns=[c for c in cls.UNUSED_TEXT_COLUMNS if c in df.columns])
+        for column in cls.CATEGORICAL_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].astype('category')
+        for column in df.select_dtypes(include='integer').columns:
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+        for column in df.select_dtypes(include='float64').columns:
+            downcasted = df[column].astype('float32')
+            if np.array_equal(downcasted.to_numpy(dtype='float64'), df[column].to_numpy(), equal_nan=True):
+                df[column] = downcasted
+        return df
+
+    # DataFrame と df.attrs の SampleArray, WeightMatrix が使うメモリ
+    @classmethod
+    def memory_bytes(cls, df):
+        total = int(df.memory_usage(index=True, deep=True).sum())
+        if 'samples' in df.attrs:
+            total += df.attrs['samples'].flat.nbytes + df.attrs['samples'].offsets.nbytes
+        if 'weight_matrix' in df.attrs:
+            total += df.attrs['weight_matrix'].values.nbytes
+        return total
+
+    @classmethod
+    def parse_file(cls, file_path, engine):
+        if engine == "arrow":
+            return cls.file2dataframe_arrow(file_path)
+        if engine == "pyparsing":
+            return cls.file2dataframe_pyparsing(file_path)
+        raise Exception("unknown engine: " + engine)
+
+    # 各時刻の実行頻度 (行 × 時刻) の行列
+    @classmethod
+    def weight_matrix(cls, df):
+        return df.attrs['weight_matrix'].rows(df)
+
+    # 各計測の全実行時間
+    @classmethod
+    def samples(cls, df):
+        return df.attrs['samples'].rows(df)
+
+    # "[0.1, 0.2]" のような数値のリストの文字列の列を，全ての値を連結した配列と各行の開始位置に変換する
+    @classmethod
+    def parse_number_lists(cls, strings):
+        lists = pc.split_pattern(pc.utf8_trim(pa.array(strings, type=pa.string()), "\"[]"), ",")
+        lengths = pc.list_value_length(lists).to_numpy(zero_copy_only=False)
+        flat = pc.list_flatten(lists)
+        flat = pc.if_else(pc.equal(pc.utf8_trim_whitespace(flat), ""), pa.scalar(None, pa.string()), flat)
+        flat = pc.cast(pc.utf8_trim_whitespace(flat), pa.float64()).to_numpy(zero_copy_only=False)
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype('int64')
+        return flat, offsets
+
+    @classmethod
+    def file2dataframe_arrow(cls, file_path):
+        # 各時刻の出力ごとにヘッダ行が繰り返されるので，一旦全ての列を文字列として読み込む
+        with open(file_path) as f:
+            column = next(csv.reader(f))
+        table = pa_csv.read_csv(
+            file_path,
+            convert_options=pa_csv.ConvertOptions(
+                column_types={c: pa.string() for c in column},
+                strings_can_be_null=False))
+        return cls.typed_dataframe(table)
+
+    # 全ての列を文字列として読み込んだ table から繰り返されるヘッダ行を取り除き，各列を COLUMN_TYPES の型に変換する
+    @classmethod
+    def typed_dataframe(cls, table):
+        column = table.schema.names
+        table = table.filter(pc.not_equal(table[column[0]], column[0]))
+
+        columns = []
+        for c in column:
+            arr = table[c]
+            arrow_type = cls.COLUMN_TYPES.get(c, pa.string())
+            if arrow_type != pa.string():
+                arr = pc.if_else(pc.equal(arr, ""), pa.scalar(None, pa.string()), arr)
+                arr = pc.cast(arr, arrow_type)
+            columns.append(arr)
+        return pa.Table.from_arrays(columns, names=column).to_pandas()
+
     @classmethod
-    def file2dataframe(cls, file_path):
+    def file2dataframe_pyparsing(cls, file_path):
         with open(file_path) as f:
             tmp_lines = f.readlines()
-        column = pp.commaSeparatedList.parseString(tmp_lines[0]).asList()
+        comma_separated_list = pp.pyparsing_common.comma_separated_list
+        column = comma_separated_list.parseString(tmp_lines[0]).asList()
         lines = []
         #header = 'timestep,label,group,name,weight,mean,cost,standard_error\n'
         header = tmp_lines[0]
 
         for tl in tmp_lines[1:]:
             if tl != header:
-                tmp = pp.commaSeparatedList.parseString(tl).asList()
+                tmp = comma_separated_list.parseString(tl).asList()
                 tmp[3] = tmp[3].strip("\"")
                 tmp[4] = tmp[4].strip("\"")
                 lines.append(tmp)
@@ -31,12 +173,5 @@ class FileLoader:
 
     @classmethod
     def file_2_statement_dfs(cls, df):
-        statements = []
-        for g, n in df[['group', 'name']].values:
-            statements.append(g + n)
-        statements = set(statements)
-        stmnt_dfs = []
-        for s in statements:
-            stmnt_dfs.append(
-                df[df['group'] + df['name'] == s])
-        return stmnt_dfs
+        statement_index = StatementIndex(df)
+        return [statement_index.statement_df(s) for s in statement_index.ranges.keys()]
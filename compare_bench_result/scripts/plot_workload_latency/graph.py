@@ -1,8 +1,19 @@
+import hashlib
+import json
 from pathlib import Path
-import matplotlib.pyplot as pyplot
 import numpy as np
+from collections import namedtuple
+from stage_profiler import StageProfiler
 
 
+PlotSpec = namedtuple('PlotSpec', ['dir_name', 'title', 'x_label', 'y_label', 'label_data_hash', 'label_se_hash',
+                                   'label_tail_hash', 'tail_name'])
+# ヒートマップなどの PlotSpec 以外の図．Graph.render_<kind>(spec) で描画する．
+# args は描画に使う全てのデータ，labels は凡例などで Graph.convert_legends を通して表示する label
+FigureSpec = namedtuple('FigureSpec', ['dir_name', 'title', 'kind', 'args', 'labels'])
+
+
+# matplotlib は読み込みに時間がかかるので，図を描画するときに初めて import する
 class Graph:
     @classmethod
     def convert_legends(cls, legend):
@@ -37,8 +48,30 @@ class Graph:
             return convert_hash[legend]
         return legend
 
+    # 描画方法を変更した場合は値を変えて，既存の図を全て描画し直す
+    STYLE_VERSION = 1
+
+    # None でなければ図を描画せずに RenderFarm に登録し，後でまとめて描画する
+    render_farm = None
+
+    @classmethod
+    def plot_graph(cls, dir_name, title, x_label, y_label, label_data_hash, label_se_hash, label_tail_hash=None, tail_name=""):
+        spec = PlotSpec(dir_name, title, x_label, y_label, label_data_hash, label_se_hash, label_tail_hash, tail_name)
+        Graph.submit_or_render(spec)
+
+    @classmethod
+    def submit_or_render(cls, spec):
+        if Graph.render_farm is not None:
+            Graph.render_farm.submit(spec)
+            return
+        Graph.render(spec)
+
     @classmethod
-    def plot_graph(cls, dir_name, title, x_label, y_label, label_data_hash, label_se_hash):
+    def render(cls, spec):
+        if isinstance(spec, FigureSpec):
+            return getattr(Graph, "render_" + spec.kind)(spec)
+        from matplotlib import pyplot
+        dir_name, title, x_label, y_label, label_data_hash, label_se_hash, label_tail_hash, tail_name = spec
         x = list(range(0, len(list(label_data_hash.values())[0])))
 
         # fig = pyplot.figure(dpi=300)
@@ -59,6 +92,10 @@ class Graph:
                 if bool(label_se_hash) and not any([np.isnan(se) for se in label_se_hash[label]]):
                     doubled_se_interval = [se * 2 for se in label_se_hash[label]]
                     ax.errorbar(x, label_data_hash[label], doubled_se_interval, fmt='o', capsize=2, ecolor=cmap(idx), markeredgecolor = cmap(idx), color=cmap(idx))
+                if label_tail_hash is not None and label in label_tail_hash:
+                    ax.plot(x, label_tail_hash[label], marker=makers[idx], label=Graph.convert_legends(label) + " (" + tail_name + ")", linewidth=1.0, linestyle="--", markersize=3, color=cmap(idx), zorder=order)
+                    if y_max_lim < max(label_tail_hash[label]):
+                        y_max_lim = max(label_tail_hash[label])
 
         #pyplot.rcParams["font.size"] = 13
         pyplot.title(Graph.title_with_newline(title))
@@ -73,12 +110,173 @@ class Graph:
         ax.set_xlim(xmax=max(x))
         pyplot.legend(fontsize=9, ncol=2)
         #pyplot.legend(bbox_to_anchor=(0, -0.25), loc='upper left', borderaxespad=0, fontsize=8)
-        output_dir = dir_name + "/figs/"
-        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        output_path = Graph.output_path(spec)
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        with StageProfiler.stage("pdf_write"):
+            fig.savefig(output_path)
+        #fig.show()
+        pyplot.close(fig)
+        return output_path
+
+    # label × label の行列をヒートマップとして描画する
+    @classmethod
+    def plot_heatmap(cls, dir_name, title, matrix, value_label):
+        labels = list(matrix.index) + list(matrix.columns)
+        Graph.submit_or_render(FigureSpec(dir_name, title, "heatmap", (matrix, value_label), labels))
+
+    @classmethod
+    def render_heatmap(cls, spec):
+        from matplotlib import pyplot
+        matrix, value_label = spec.args
+        title = spec.title
+        fig = pyplot.figure(figsize=(2 + len(matrix.columns) * 1.2, 1.5 + len(matrix.index) * 0.8))
+        ax = fig.add_subplot(1, 1, 1)
+        values = matrix.to_numpy(dtype='float64')
+        limit = np.nanmax(np.abs(values)) if np.isfinite(values).any() else 1.0
+        image = ax.imshow(values, cmap="RdBu", vmin=-limit, vmax=limit)
+        fig.colorbar(image, ax=ax, label=value_label)
+        ax.set_xticks(range(len(matrix.columns)))
+        ax.set_xticklabels([Graph.convert_legends(c) for c in matrix.columns], rotation=45, ha="right", fontsize=8)
+        ax.set_yticks(range(len(matrix.index)))
+        ax.set_yticklabels([Graph.convert_legends(i) for i in matrix.index], fontsize=8)
+        for i in range(values.shape[0]):
+            for j in range(values.shape[1]):
+                if np.isfinite(values[i, j]):
+                    ax.text(j, i, "{:.1f}".format(values[i, j]), ha="center", va="center", fontsize=8)
+        pyplot.title(Graph.title_with_newline(title))
+        fig.tight_layout()
+        output_path = Graph.output_path(spec)
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        with StageProfiler.stage("pdf_write"):
+            fig.savefig(output_path)
+        pyplot.close(fig)
+        return output_path
+
+    # 各 label の (statement × timestep) の応答時間と，基準の label との差 [%] を横に並べた一つの図として描画する
+    @classmethod
+    def plot_matrix_heatmaps(cls, dir_name, title, label_matrix_hash, label_diff_hash):
+        labels = list(label_matrix_hash.keys()) + list(label_diff_hash.keys())
+        Graph.submit_or_render(FigureSpec(dir_name, title, "matrix_heatmaps", (label_matrix_hash, label_diff_hash), labels))
+
+    @classmethod
+    def render_matrix_heatmaps(cls, spec):
+        from matplotlib import colors, pyplot
+        label_matrix_hash, label_diff_hash = spec.args
+        title = spec.title
+        panels = list(label_matrix_hash.items()) + list(label_diff_hash.items())
+        statements = list(panels[0][1].index)
+        timestep_num = len(panels[0][1].columns)
+        fig, axes = pyplot.subplots(1, len(panels), sharey=True, squeeze=False,
+                                    figsize=(3 + len(panels) * (1 + timestep_num * 0.2), 2 + len(statements) * 0.18))
+
+        latencies = np.concatenate([m.to_numpy(dtype='float64').ravel() for m in label_matrix_hash.values()])
+        latencies = latencies[np.isfinite(latencies) & (latencies > 0)]
+        norm = colors.LogNorm(vmin=latencies.min(), vmax=latencies.max()) if len(latencies) > 0 else None
+        diffs = np.concatenate([m.to_numpy(dtype='float64').ravel() for m in label_diff_hash.values()] + [np.zeros(0)])
+        diffs = diffs[np.isfinite(diffs)]
+        limit = max(np.percentile(np.abs(diffs), 99), 1e-9) if len(diffs) > 0 else 1.0
+
+        latency_image = None
+        diff_image = None
+        for idx, (ax, (name, matrix)) in enumerate(zip(axes[0], panels)):
+            values = matrix.to_numpy(dtype='float64')
+            if name in label_diff_hash:
+                diff_image = ax.imshow(values, aspect='auto', cmap="RdBu_r", vmin=-limit, vmax=limit,
+                                       interpolation='nearest')
+            else:
+                latency_image = ax.imshow(values, aspect='auto', cmap="viridis", norm=norm, interpolation='nearest')
+            ax.set_title(Graph.title_with_newline(Graph.convert_legends(name)), fontsize=9)
+            ax.set_xlabel("timestep")
+            ax.set_xticks(range(0, timestep_num, max(timestep_num // 6, 1)))
+        axes[0][0].set_yticks(range(len(statements)))
+        axes[0][0].set_yticklabels([s.split("--")[-1].strip(" ") for s in statements], fontsize=6)
+        if latency_image is not None:
+            fig.colorbar(latency_image, ax=list(axes[0][:len(label_matrix_hash)]), label="latency [s]")
+        if diff_image is not None:
+            fig.colorbar(diff_image, ax=list(axes[0][len(label_matrix_hash):]), label="difference [%]")
+        fig.suptitle(title)
+        output_path = Graph.output_path(spec)
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        with StageProfiler.stage("pdf_write"):
+            fig.savefig(output_path)
+        pyplot.close(fig)
+        return output_path
+
+    # 書き込みの増幅の表 (Upseart.write_amplification_table) から，各 label の (statement × timestep) の
+    # 書き込み先の CF の数 (上段) と，実行頻度で重み付けした応答時間の合計に占める割合 [%] (下段) を一つの図として描画する
+    @classmethod
+    def plot_write_amplification(cls, dir_name, title, table):
+        labels = list(dict.fromkeys(table['label']))
+        Graph.submit_or_render(FigureSpec(dir_name, title, "write_amplification", (table,), labels))
+
+    @classmethod
+    def render_write_amplification(cls, spec):
+        from matplotlib import pyplot
+        table, = spec.args
+        title = spec.title
+        labels = list(dict.fromkeys(table['label']))
+        statements = sorted(table['statement'].unique())
+        timesteps = range(int(table['timestep'].max()) + 1)
+        rows = [("CFs", 'cfs', "Blues"), ("share of weighted latency [%]", 'weighted_share', "OrRd")]
+        fig, axes = pyplot.subplots(len(rows), len(labels), sharex=True, sharey=True, squeeze=False,
+                                    figsize=(3 + len(labels) * (1 + len(timesteps) * 0.2), 2 + len(statements) * 0.36))
+        for row, (value_label, column, cmap) in enumerate(rows):
+            scale = 100 if column == 'weighted_share' else 1
+            matrices = [table[table['label'] == label].pivot(index='statement', columns='timestep', values=column)
+                        .reindex(index=statements, columns=timesteps) * scale for label in labels]
+            values = np.concatenate([m.to_numpy(dtype='float64').ravel() for m in matrices])
+            vmax = np.nanmax(values) if np.isfinite(values).any() else 1.0
+            image = None
+            for ax, label, matrix in zip(axes[row], labels, matrices):
+                image = ax.imshow(matrix.to_numpy(dtype='float64'), aspect='auto', cmap=cmap, vmin=0, vmax=vmax,
+                                  interpolation='nearest')
+                if row == 0:
+                    ax.set_title(Graph.title_with_newline(Graph.convert_legends(label)), fontsize=9)
+                if row == len(rows) - 1:
+                    ax.set_xlabel("timestep")
+                    ax.set_xticks(range(0, len(timesteps), max(len(timesteps) // 6, 1)))
+            fig.colorbar(image, ax=list(axes[row]), label=value_label)
+            axes[row][0].set_yticks(range(len(statements)))
+            axes[row][0].set_yticklabels(statements, fontsize=6)
+        fig.suptitle(title)
+        output_path = Graph.output_path(spec)
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        with StageProfiler.stage("pdf_write"):
+            fig.savefig(output_path, bbox_inches='tight')
+        pyplot.close(fig)
+        return output_path
+
+    @classmethod
+    def output_path(cls, spec):
+        if isinstance(spec, FigureSpec):
+            return spec.dir_name + "/figs/" + spec.title + ".pdf"
+        title = spec.title
         if '--' in title:
             title = title.split('--')[-1].strip(" ")
-        fig.savefig(output_dir + title + "_" + y_label.strip(" ") + ".pdf")
-        #fig.show()
+        return spec.dir_name + "/figs/" + title + "_" + spec.y_label.strip(" ") + ".pdf"
+
+    # 図の内容を決める全ての入力 (データ, 凡例の表示名, 描画方法) のハッシュ
+    @classmethod
+    def spec_hash(cls, spec):
+        if isinstance(spec, FigureSpec):
+            legends = {str(label): Graph.convert_legends(label) for label in spec.labels}
+            content = [spec.dir_name, spec.title, spec.kind, Graph.__hashable(spec.args)]
+        else:
+            legends = {label: Graph.convert_legends(label) for label in spec.label_data_hash.keys()}
+            content = list(spec)
+        content = json.dumps([Graph.STYLE_VERSION, content, legends], sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    # DataFrame は str では一部の値しか表示されないので，全ての値を JSON にする
+    @classmethod
+    def __hashable(cls, value):
+        if isinstance(value, (tuple, list)):
+            return [Graph.__hashable(v) for v in value]
+        if isinstance(value, dict):
+            return [[str(k), Graph.__hashable(v)] for k, v in value.items()]
+        if hasattr(value, 'to_json'):
+            return value.to_json(orient='split', double_precision=15)
+        return value
 
     @classmethod
     def title_with_newline(cls, title):
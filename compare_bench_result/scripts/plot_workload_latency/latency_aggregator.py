@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+
+
+# 各時刻の応答時間の集計を groupby で (group × timestep) や (種類 × timestep) の行列としてまとめて計算する．
+# 行ごとの Python のループを使わないので，計算量は行数に比例する．
+class LatencyAggregator:
+    TAIL_PERCENTILES = {'p50': 50, 'p95': 95, 'p99': 99, 'max': 100}
+
+    @classmethod
+    def timesteps(cls, df):
+        return pd.RangeIndex(df['timestep'].max() + 1, name='timestep')
+
+    # keys の値ごとの column の合計．groupby の sum は値をまとめて足すので，以前の実装 (Python の sum) と最後の桁が変わることがある．
+    # 同じ値になるように，各 key の k 番目の行を (key × k) の行列に並べ，行ごとの累積和で行の順に一つずつ足す
+    @classmethod
+    def sequential_sum(cls, df, keys, column):
+        grouped = df.groupby(keys, sort=True)
+        ranks = grouped.cumcount().to_numpy()
+        matrix = np.zeros((grouped.ngroups, ranks.max() + 1 if len(ranks) > 0 else 1))
+        matrix[grouped.ngroup().to_numpy(), ranks] = df[column].to_numpy(dtype='float64')
+        return pd.Series(np.cumsum(matrix, axis=1)[:, -1], index=grouped.size().index, name=column)
+
+    @classmethod
+    def avg_query_latency(cls, df, column):
+        queries = df[df['name'].str.startswith("SELECT")]
+        return (LatencyAggregator.sequential_sum(queries, 'timestep', column) / queries.groupby('timestep').size()) \
+            .reindex(LatencyAggregator.timesteps(df))
+
+    # INSERT は各 CF への書き込みを合わせて元の一つの INSERT として数える
+    @classmethod
+    def statement_num_matrix(cls, df):
+        statements = df[df['name'] != "TOTAL"]
+        statements = statements.assign(statement=statements['name'].str.split("for", n=1).str[0])
+        return statements.groupby(['group', 'timestep'])['statement'].nunique() \
+            .unstack('timestep', fill_value=0) \
+            .reindex(columns=LatencyAggregator.timesteps(df), fill_value=0)
+
+    @classmethod
+    def group_latency_sum_matrix(cls, df, column):
+        statements = df[df['name'] != "TOTAL"]
+        return LatencyAggregator.sequential_sum(statements, ['group', 'timestep'], column) \
+            .unstack('timestep', fill_value=0) \
+            .reindex(columns=LatencyAggregator.timesteps(df), fill_value=0)
+
+    @classmethod
+    def avg_group_latency_matrix(cls, df, column):
+        return LatencyAggregator.group_latency_sum_matrix(df, column) / LatencyAggregator.statement_num_matrix(df)
+
+    # 各 group の TOTAL は既に実行頻度で重み付けされている
+    @classmethod
+    def weighted_avg_group_latency_matrix(cls, df, column, total_weights):
+        group_totals = df[(df['name'] == "TOTAL") & (df['group'] != "TOTAL")]
+        if group_totals.duplicated(['group', 'timestep']).any():
+            raise Exception("TOTAL of each group should be unique at each time step")
+        group_totals = group_totals.pivot(index='group', columns='timestep', values=column) \
+            .reindex(columns=LatencyAggregator.timesteps(df))
+        statement_counts = LatencyAggregator.statement_num_matrix(df).reindex(group_totals.index)
+        total_weights = np.asarray(total_weights, dtype='float64')[:len(group_totals.columns)]
+        # 各時刻の statement 数を，各時刻の合計の合計重みで割ることで，合計重みが1より小さい場合に応答時間を小さく評価することを防ぐ
+        total_weight_per_statement = statement_counts / total_weights
+        return (group_totals / statement_counts) * total_weight_per_statement
+
+    # 各時刻の合計重みを求める．
+    # 各 statement の weight には全ての時刻の実行頻度が入っているので，どの時刻の行から求めても同じ結果になる．
+    # 以前の実装と同じ値になるように，各時刻の行をファイルの順に足し，足す度に小数点以下 5 桁に丸める．
+    # 丸めは各時刻の k 番目の行を全ての時刻についてまとめて足すので，ループの回数は時刻ごとの最大の行数になる
+    @classmethod
+    def total_weight_each_timestep(cls, df, weights):
+        statements = df['name'].to_numpy() != "TOTAL"
+        timesteps = df['timestep'].to_numpy()[statements]
+        weights = weights[statements]
+        order = np.argsort(timesteps, kind='stable')
+        counts = np.bincount(timesteps, minlength=len(LatencyAggregator.timesteps(df)))
+        ranks = np.empty(len(order), dtype='int64')
+        ranks[order] = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts)
+        weight_totals = np.zeros((len(counts), weights.shape[1]))
+        for rank in range(counts.max() if len(counts) > 0 else 0):
+            rows = np.flatnonzero(ranks == rank)
+            if rank == 0:
+                weight_totals[timesteps[rows]] = weights[rows]
+            else:
+                weight_totals[timesteps[rows]] = LatencyAggregator.round_like_python(
+                    weight_totals[timesteps[rows]] + weights[rows], 5)
+        if (weight_totals != weight_totals[0]).any():
+            raise Exception("weights of each statement of each time step already has all weights."
+                            + " Therefore the result should be the same")
+        return weight_totals[0]
+
+    # Python の round(x, digits) と同じ値に丸める．np.round は x * 10^digits の丸め誤差のため，
+    # ちょうど中間に近い値を Python の round (x の正確な値を丸める) と逆に丸めることがあるので，中間に近い値だけ round で丸め直す
+    @classmethod
+    def round_like_python(cls, values, digits):
+        scaled = values * 10.0 ** digits
+        rounded = np.round(values, digits)
+        near_half = np.abs(scaled - np.floor(scaled) - 0.5) <= 4 * np.finfo('float64').eps * np.abs(scaled)
+        rounded[near_half] = [round(float(v), digits) for v in values[near_half]]
+        return rounded
+
+    # 各時刻の全ての statement の実行頻度の合計．
+    # INSERT, UPDATE は CF ごとの行に元の statement と同じ実行頻度が出力されるので，元の statement ごとに一度だけ数える
+    @classmethod
+    def statement_weight_totals(cls, df, weights):
+        statements = df['name'].to_numpy() != "TOTAL"
+        keys = pd.DataFrame({'group': df['group'], 'statement': df['name'].str.split(" -- ", n=1).str[0]})[statements]
+        unique_rows = ~keys.duplicated().to_numpy()
+        return np.nansum(weights[statements][unique_rows], axis=0)
+
+    # 各 label の実行頻度で重み付けした各時刻の平均応答時間 (label × timestep)．
+    # 各 group の TOTAL (実行頻度 × 平均応答時間の合計) を全ての label についてまとめて合計し，各時刻の実行頻度の合計で割るので，
+    # 実行頻度の合計が 1 でない場合も 1 回の実行あたりの応答時間になる
+    @classmethod
+    def weighted_total_latency_matrix(cls, label_dfs_hash, column, label_weight_totals):
+        labels = list(label_dfs_hash.keys())
+        group_totals = pd.concat(
+            [df.loc[(df['name'] == "TOTAL") & (df['group'] != "TOTAL"), ['timestep', column]]
+             for df in label_dfs_hash.values()], keys=labels, names=['label', None])
+        timesteps = pd.RangeIndex(max(df['timestep'].max() for df in label_dfs_hash.values()) + 1, name='timestep')
+        sums = group_totals.groupby(['label', 'timestep'])[column].sum(min_count=1).unstack('timestep') \
+            .reindex(index=labels, columns=timesteps)
+
+        total_weights = np.full(sums.shape, np.nan)
+        for idx, label in enumerate(labels):
+            weights = np.asarray(label_weight_totals[label], dtype='float64')[:len(timesteps)]
+            total_weights[idx, :len(weights)] = weights
+        return sums / total_weights
+
+    # label1 (行) の全時刻の合計が label2 (列) の合計からどれだけ減ったか (1 - label1 / label2)
+    @classmethod
+    def reduction_ratio_matrix(cls, totals):
+        sums = totals.sum(axis=1).to_numpy()
+        return pd.DataFrame(1 - sums[:, None] / sums[None, :],
+                            index=totals.index.rename('label1'), columns=totals.index.rename('label2'))
+
+    # kind の各 statement ("group_name") の各時刻の値 (statement × timestep)
+    @classmethod
+    def statement_timestep_matrix(cls, df, column, kind):
+        statements = df[df['name'].str.startswith(kind)]
+        matrix = statements.pivot_table(index=['group', 'name'], columns='timestep', values=column, aggfunc='mean')
+        matrix.index = pd.Index([str(group) + "_" + str(name) for group, name in matrix.index], name='statement')
+        return matrix.reindex(columns=LatencyAggregator.timesteps(df))
+
+    # 各時刻の応答時間の変化の形 (対数を statement ごとに標準化したもの) が近い statement が隣り合う順序．
+    # scipy は集計では使わないので，この順序を求める時だけ読み込む
+    @classmethod
+    def cluster_order(cls, matrix):
+        if len(matrix) < 3:
+            return list(matrix.index)
+        from scipy.cluster import hierarchy
+        with np.errstate(divide='ignore', invalid='ignore'):
+            profiles = np.log(matrix.to_numpy(dtype='float64'))
+            profiles[~np.isfinite(profiles)] = np.nan
+            profiles = (profiles - np.nanmean(profiles, axis=1, keepdims=True)) \
+                / np.nanstd(profiles, axis=1, keepdims=True)
+        profiles = np.nan_to_num(profiles, nan=0.0, posinf=0.0, neginf=0.0)
+        return list(matrix.index[hierarchy.leaves_list(hierarchy.linkage(profiles, method='average'))])
+
+    # 以前の実装と同じ順に，各時刻の UPDATE を全て足してから INSERT を足す
+    @classmethod
+    def upsert_latency_sum(cls, df, column):
+        upserts = pd.concat([df[df['name'].str.startswith("UPDATE")], df[df['name'].str.startswith("INSERT")]])
+        return LatencyAggregator.sequential_sum(upserts, 'timestep', column) \
+            .reindex(LatencyAggregator.timesteps(df), fill_value=0)
+
+    # INSERT, UPDATE の元の statement ごとの各時刻の書き込み先の CF の数と，CF ごとの応答時間の合計と最大値．
+    # weighted_share は実行頻度で重み付けした合計 (weight × latency_sum) が，その時刻の全ての statement の
+    # 重み付けした応答時間の合計 (各 group の TOTAL の合計) に占める割合．weights は df の行ごとの実行頻度
+    @classmethod
+    def write_amplification(cls, df, weights, column):
+        names = df['name'].astype(str)
+        writes = (names.str.startswith("INSERT") | names.str.startswith("UPDATE")).to_numpy()
+        timesteps = df['timestep'].to_numpy()[writes]
+        row_weights = weights[writes][np.arange(writes.sum()), np.minimum(timesteps, weights.shape[1] - 1)] \
+            if weights.shape[1] > 0 else np.full(writes.sum(), np.nan)
+        m = pd.DataFrame({
+            'timestep': timesteps,
+            'statement': df['group'].astype(str).to_numpy()[writes] + "_" + names[writes].str.split(" -- ", n=1).str[0],
+            'latency': df[column].to_numpy(dtype='float64')[writes],
+            'weight': row_weights,
+        })
+        result = m.groupby(['statement', 'timestep'], sort=True).agg(
+            cfs=('latency', 'size'), latency_sum=('latency', 'sum'), latency_max=('latency', 'max'),
+            weight=('weight', 'first')).reset_index()
+        result['weighted_latency'] = result['weight'] * result['latency_sum']
+
+        group_totals = df[(df['name'] == "TOTAL") & (df['group'] != "TOTAL")]
+        weighted_totals = group_totals.groupby('timestep')[column].sum(min_count=1)
+        result['weighted_share'] = result['weighted_latency'] / result['timestep'].map(weighted_totals).to_numpy()
+        return result
+
+    # 各 statement の各時刻の実行時間のパーセンタイル
+    @classmethod
+    def tail_latency(cls, df, samples):
+        percentiles = samples.percentiles(list(LatencyAggregator.TAIL_PERCENTILES.values()))
+        tails = pd.DataFrame(percentiles, index=df.index, columns=list(LatencyAggregator.TAIL_PERCENTILES.keys()))
+        return pd.concat([df[['timestep', 'group', 'name']], tails], axis=1)
@@ -0,0 +1,143 @@
+import csv
+import re
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from file_loader import FileLoader
+from sample_array import SampleArray
+
+
+# td_benchmark の標準出力をそのまま (bench_res_formatter.rb を通さずに) 一定サイズのチャンクごとに読み込む．
+# 各チャンクから結果の CSV 行だけをまとめて取り出し，型を付けた DataFrame として集計器に渡すので，
+# 使用するメモリはログ全体の大きさではなくチャンクの大きさと集計結果の大きさで決まる．
+class LogStreamReader:
+    DEFAULT_CHUNK_BYTES = 64 * 1024 ** 2
+    # bench_res_formatter.rb と同じく，先頭の列が時刻かヘッダである行を結果の行とする
+    RESULT_LINE = re.compile(rb'^(?:[0-9]+|timestep),[^\r\n]*', re.M)
+    HEADER_PREFIX = b'timestep,'
+
+    def __init__(self, file_path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+        self.file_path = file_path
+        self.chunk_bytes = chunk_bytes
+        self.column = None
+
+    def read(self, aggregators):
+        rows = 0
+        for chunk_df in self.chunks():
+            rows += len(chunk_df)
+            for aggregator in aggregators:
+                aggregator.update(chunk_df)
+        if rows == 0:
+            raise Exception("no td_benchmark rows found in " + str(self.file_path))
+        return [aggregator.result() for aggregator in aggregators]
+
+    def chunks(self):
+        rest = b''
+        with open(self.file_path, 'rb') as f:
+            while True:
+                block = f.read(self.chunk_bytes)
+                if not block:
+                    break
+                block = rest + block
+                cut = block.rfind(b'\n') + 1
+                rest = block[cut:]
+                chunk_df = self.__parse_block(block[:cut])
+                if chunk_df is not None:
+                    yield chunk_df
+        chunk_df = self.__parse_block(rest)
+        if chunk_df is not None:
+            yield chunk_df
+
+    def __parse_block(self, block):
+        lines = LogStreamReader.RESULT_LINE.findall(block)
+        if self.column is None:
+            headers = [l for l in lines if l.startswith(LogStreamReader.HEADER_PREFIX)]
+            if len(headers) == 0:
+                return None
+            self.column = next(csv.reader([headers[0].decode()]))
+            lines = lines[lines.index(headers[0]):]
+        if len(lines) == 0:
+            return None
+
+        # 列数が合わない行はログの一部なので読み飛ばす
+        table = pa_csv.read_csv(
+            pa.py_buffer(b'\n'.join(lines) + b'\n'),
+            read_options=pa_csv.ReadOptions(column_names=self.column),
+            parse_options=pa_csv.ParseOptions(invalid_row_handler=lambda row: 'skip'),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={c: pa.string() for c in self.column},
+                strings_can_be_null=False))
+        if table.num_rows == 0:
+            return None
+        return FileLoader.typed_dataframe(table)
+
+
+# 結果の行を FileLoader.file2dataframe と同じ DataFrame にまとめる．
+# 実行時間の文字列はチャンクごとに SampleArray に変換して捨てる．
+# ログの結果以外の行は保持しないが，全ての結果の行を保持するので，使用するメモリは結果の行の数に比例し，
+# bench_res_formatter.rb で整形したファイルを読み込む場合と同じになる．
+# ログの大きさによらずメモリを抑える場合は，行を保持しない QueryLatencyAggregator と GroupLatencyAggregator を使う (--stream)
+class ResultFrameAggregator:
+    def __init__(self):
+        self.dfs = []
+        self.sample_arrays = []
+
+    def update(self, chunk_df):
+        if 'values' in chunk_df.columns:
+            self.sample_arrays.append(SampleArray(*FileLoader.parse_number_lists(chunk_df['values'])))
+            chunk_df = chunk_df.drop(columns=['values'])
+        self.dfs.append(chunk_df)
+
+    def result(self):
+        df = pd.concat(self.dfs, ignore_index=True)
+        samples = SampleArray.concatenate(self.sample_arrays) if len(self.sample_arrays) > 0 else None
+        return FileLoader.decode_arrays(df, samples)
+
+
+# 各時刻の SELECT の平均応答時間を合計と個数だけを保持して逐次的に求める．
+# LatencyAggregator.avg_query_latency と同じく，SELECT の無い時刻も含めたログの全ての時刻の値を返す
+class QueryLatencyAggregator:
+    def __init__(self, column):
+        self.column = column
+        self.sums = np.zeros(0)
+        self.counts = np.zeros(0, dtype='int64')
+
+    def update(self, chunk_df):
+        queries = chunk_df[chunk_df['name'].str.startswith("SELECT")]
+        timesteps = queries['timestep'].to_numpy()
+        size = max(len(self.sums), chunk_df['timestep'].max() + 1)
+        self.sums = np.pad(self.sums, (0, size - len(self.sums)))
+        self.counts = np.pad(self.counts, (0, size - len(self.counts)))
+        np.add.at(self.sums, timesteps, queries[self.column].to_numpy())
+        np.add.at(self.counts, timesteps, 1)
+
+    def result(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return pd.Series(self.sums / self.counts, index=pd.RangeIndex(len(self.sums), name='timestep'))
+
+
+# 各 group の各時刻の平均応答時間 (LatencyAggregator.avg_group_latency_matrix と同じ group × timestep の行列) を，
+# 応答時間の合計と (group, timestep, statement) の組だけを保持して逐次的に求める
+class GroupLatencyAggregator:
+    def __init__(self, column):
+        self.column = column
+        self.sums = pd.Series(dtype='float64')
+        self.statements = pd.DataFrame(columns=['group', 'timestep', 'statement'])
+        self.max_timestep = -1
+
+    def update(self, chunk_df):
+        self.max_timestep = max(self.max_timestep, int(chunk_df['timestep'].max()))
+        statements = chunk_df[chunk_df['name'] != "TOTAL"]
+        sums = statements.groupby(['group', 'timestep'])[self.column].sum()
+        self.sums = sums if len(self.sums) == 0 else self.sums.add(sums, fill_value=0)
+        # INSERT は各 CF への書き込みを合わせて元の一つの INSERT として数える
+        keys = pd.DataFrame({'group': statements['group'].to_numpy(), 'timestep': statements['timestep'].to_numpy(),
+                             'statement': statements['name'].str.split("for", n=1).str[0].to_numpy()})
+        self.statements = pd.concat([self.statements, keys], ignore_index=True).drop_duplicates(ignore_index=True)
+
+    def result(self):
+        timesteps = pd.RangeIndex(self.max_timestep + 1, name='timestep')
+        counts = self.statements.groupby(['group', 'timestep']).size()
+        sums = self.sums.unstack('timestep', fill_value=0).reindex(columns=timesteps, fill_value=0)
+        return sums / counts.unstack('timestep', fill_value=0).reindex(index=sums.index, columns=timesteps, fill_value=0)
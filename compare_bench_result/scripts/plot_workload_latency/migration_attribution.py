@@ -0,0 +1,190 @@
+import argparse
+import json
+import mmap
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from file_loader import FileLoader
+from parallel_loader import ParallelLoader
+from parse_cache import ParseCache
+
+# search の結果 (JSON) の各時刻のスキーマ (time_depend_indexes), 各 statement の各時刻の plan とマイグレーション計画を
+# td_benchmark の各時刻の応答時間と突き合わせて，応答時間の変化を各時刻に作成, 削除された CF とマイグレーションに割り当てる．
+# - plan の変化: 時刻 t に新しく使い始めた CF (使わなくなった CF) に，その statement の応答時間の変化
+#   (weight[t] * (mean[t] - mean[t - 1])) を等分して割り当てる．
+# - 一時的な遅延: 同じ plan (使う CF の集合) の時刻の中央値からの超過分 (weight[t] * (mean[t] - median)) を時刻ごとに合計し，
+#   その時刻に実行中のマイグレーション (start_time が t) に作成する CF の大きさ (size) の比で割り当てる．
+#   td_benchmark は時刻 t の計測中に次の時刻の CF を非同期に作成する (migrator.migrate_async)．
+# usage: python migration_attribution.py <search output or json> result.csv [result.csv ...] [--top N]
+
+
+class MigrationAttribution:
+    JSON_START_MARKER = b"<json format>"
+    JSON_END_MARKER = b"</json format>"
+
+    def __init__(self, search_result):
+        self.usage = MigrationAttribution.plan_usage(search_result)
+        self.changes = MigrationAttribution.schema_changes(search_result)
+        self.migrations = MigrationAttribution.migrations(search_result)
+
+    # search の出力から <json format> の中身を取り出す．JSON だけのファイル (td_benchmark の入力) はそのまま読む
+    @classmethod
+    def read_search_result(cls, file_name):
+        with open(file_name, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = mm.rfind(MigrationAttribution.JSON_END_MARKER)
+                start = mm.rfind(MigrationAttribution.JSON_START_MARKER, 0, max(end, 0))
+                if end < 0 or start < 0:
+                    return json.loads(mm[:].decode())
+                return json.loads(mm[start + len(MigrationAttribution.JSON_START_MARKER):end].decode())
+
+    # 各時刻の各 plan (td_benchmark の計測の group と name) が使う CF (timestep, group, name, cf)
+    @classmethod
+    def plan_usage(cls, search_result):
+        rows = []
+        for time_depend_plan in search_result.get('time_depend_plans', []):
+            for timestep, plan in enumerate(time_depend_plan['plans']):
+                for cf in MigrationAttribution.__step_indexes(plan):
+                    rows.append((timestep, plan['group'], plan['name'], cf))
+        for time_depend_update_plan in search_result.get('time_depend_update_plans', []):
+            for timestep, plans in enumerate(time_depend_update_plan['plans_all_timestep']):
+                for plan in plans['plans']:
+                    cfs = {plan['index']['key']}
+                    for query_plan in plan.get('query_plans', []):
+                        cfs |= MigrationAttribution.__step_indexes(query_plan)
+                    rows.extend((timestep, plan['group'], plan['name'], cf) for cf in cfs)
+        return pd.DataFrame(rows, columns=['timestep', 'group', 'name', 'cf']).drop_duplicates()
+
+    @classmethod
+    def __step_indexes(cls, plan):
+        return {step['index']['key'] for step in plan.get('steps', []) if step.get('index') is not None}
+
+    # 各時刻に作成, 削除された CF (timestep, cf, change, size)
+    @classmethod
+    def schema_changes(cls, search_result):
+        rows = []
+        indexes_all_timestep = search_result['time_depend_indexes']['indexes_all_timestep']
+        for timestep, each_timestep in enumerate(indexes_all_timestep):
+            rows.extend((timestep, index['key'], index.get('size', np.nan)) for index in each_timestep['indexes'])
+        schema = pd.DataFrame(rows, columns=['timestep', 'cf', 'size'])
+        previous = schema.assign(timestep=schema['timestep'] + 1)
+        created = schema.merge(previous[['timestep', 'cf']], on=['timestep', 'cf'], how='left', indicator=True)
+        created = created[(created['_merge'] == 'left_only') & (created['timestep'] > 0)].assign(change="created")
+        dropped = previous.merge(schema[['timestep', 'cf']], on=['timestep', 'cf'], how='left', indicator=True)
+        dropped = dropped[(dropped['_merge'] == 'left_only') & (dropped['timestep'] < len(indexes_all_timestep))] \
+            .assign(change="dropped")
+        return pd.concat([created, dropped], ignore_index=True)[['timestep', 'cf', 'change', 'size']] \
+            .sort_values(['timestep', 'change', 'cf'], ignore_index=True)
+
+    # 各マイグレーションで作成する CF (start_time, end_time, query, cf, size)
+    @classmethod
+    def migrations(cls, search_result):
+        rows = []
+        for migrate_plan in search_result.get('migrate_plans', []):
+            for prepare_plan in migrate_plan.get('prepare_plans', []):
+                rows.append((migrate_plan['start_time'], migrate_plan['end_time'], migrate_plan['query'],
+                             prepare_plan['index']['key'], prepare_plan['index'].get('size', np.nan)))
+        return pd.DataFrame(rows, columns=['start_time', 'end_time', 'query', 'cf', 'size']).drop_duplicates()
+
+    # TOTAL 以外の各計測と，その statement の前の時刻からの応答時間の変化と同じ plan の時刻の中央値からの超過分
+    def latency_changes(self, df, column='mean'):
+        statements = df[df['name'] != "TOTAL"]
+        timesteps = statements['timestep'].to_numpy()
+        weights = FileLoader.weight_matrix(statements)
+        m = pd.DataFrame({
+            'timestep': timesteps,
+            'group': statements['group'].astype(str).to_numpy(),
+            'name': statements['name'].astype(str).to_numpy(),
+            'latency': statements[column].to_numpy(dtype='float64'),
+            'weight': np.nan_to_num(weights[np.arange(len(statements)), timesteps]) if weights.shape[1] > 0 else 0.0,
+        }).sort_values(['group', 'name', 'timestep'], ignore_index=True)
+        signatures = self.usage.sort_values('cf').groupby(['timestep', 'group', 'name'])['cf'] \
+            .agg(" ".join).rename('plan').reset_index()
+        m = m.merge(signatures, on=['timestep', 'group', 'name'], how='left')
+        m['plan'] = m['plan'].fillna("")
+
+        previous = m.groupby(['group', 'name'], sort=False)['latency'].shift(1)
+        previous_timestep = m.groupby(['group', 'name'], sort=False)['timestep'].shift(1)
+        m['weighted_delta'] = np.where(previous_timestep == m['timestep'] - 1, m['weight'] * (m['latency'] - previous), np.nan)
+        m['plan_changed'] = m['plan'] != m.groupby(['group', 'name'], sort=False)['plan'].shift(1).fillna(m['plan'])
+        baseline = m.groupby(['group', 'name', 'plan'], sort=False)['latency'].transform('median')
+        m['weighted_excess'] = m['weight'] * (m['latency'] - baseline)
+        return m
+
+    # 時刻 t に使い始めた CF, 使わなくなった CF ごとの応答時間の変化の合計
+    def cf_attribution(self, changes):
+        usage = self.usage
+        previous = usage.assign(timestep=usage['timestep'] + 1)
+        keys = ['timestep', 'group', 'name', 'cf']
+        started = usage.merge(previous, on=keys, how='left', indicator=True)
+        started = started[(started['_merge'] == 'left_only') & (started['timestep'] > 0)][keys].assign(role="started")
+        stopped = previous.merge(usage, on=keys, how='left', indicator=True)
+        stopped = stopped[(stopped['_merge'] == 'left_only') & (stopped['timestep'] <= usage['timestep'].max())][keys] \
+            .assign(role="stopped")
+        switched = pd.concat([started, stopped], ignore_index=True)
+        switched['share'] = 1.0 / switched.groupby(['timestep', 'group', 'name'])['cf'].transform('size')
+
+        attributed = switched.merge(changes[['timestep', 'group', 'name', 'weighted_delta']],
+                                    on=['timestep', 'group', 'name'])
+        attributed['weighted_delta'] = attributed['weighted_delta'] * attributed['share']
+        result = attributed.groupby(['timestep', 'cf', 'role'], sort=True).agg(
+            statements=('name', 'size'), weighted_delta=('weighted_delta', 'sum')).reset_index()
+        result = result.merge(self.changes[['timestep', 'cf', 'change']], on=['timestep', 'cf'], how='left')
+        result['change'] = result['change'].fillna("existing")
+        return result.sort_values('weighted_delta', ascending=False, ignore_index=True)
+
+    # 各マイグレーションに割り当てた，実行中の時刻の一時的な遅延
+    def migration_slowdowns(self, changes):
+        excess = changes.groupby('timestep')['weighted_excess'].sum().rename('timestep_excess').reset_index()
+        migrations = self.migrations.copy()
+        sizes = migrations['size'].fillna(0)
+        timestep_sizes = sizes.groupby(migrations['start_time']).transform('sum')
+        timestep_counts = migrations.groupby('start_time')['cf'].transform('size')
+        migrations['share'] = np.where(timestep_sizes > 0, sizes / timestep_sizes, 1.0 / timestep_counts)
+        migrations = migrations.merge(excess, left_on='start_time', right_on='timestep', how='left')
+        migrations['weighted_excess'] = migrations['timestep_excess'].fillna(0) * migrations['share']
+        result = migrations.groupby(['start_time', 'end_time', 'query'], sort=True).agg(
+            cfs=('cf', lambda cfs: " ".join(sorted(cfs))), size=('size', 'sum'),
+            weighted_excess=('weighted_excess', 'sum'), timestep_excess=('timestep_excess', 'first')).reset_index()
+        return result.sort_values('weighted_excess', ascending=False, ignore_index=True)
+
+
+def show_migration_attribution(dir_name, label, attribution, df, top_num):
+    changes = attribution.latency_changes(df)
+    cf_attribution = attribution.cf_attribution(changes)
+    slowdowns = attribution.migration_slowdowns(changes)
+    print("=" + label)
+    print("  schema changes (created / dropped CFs of each time step)")
+    counts = attribution.changes.groupby(['timestep', 'change']).size().unstack('change', fill_value=0)
+    print("    " + counts.to_string().replace("\n", "\n    "))
+    print("  CFs with the largest latency increase of the statements which started (stopped) using them")
+    print("    " + cf_attribution.head(top_num).to_string(index=False).replace("\n", "\n    "))
+    print("  migrations with the largest transient slowdown while they run")
+    print("    " + slowdowns.head(top_num).to_string(index=False).replace("\n", "\n    "))
+    for name, result in [("cf_attribution", cf_attribution), ("migration_slowdowns", slowdowns)]:
+        output_path = dir_name + "/" + label + "_" + name + ".csv"
+        result.to_csv(output_path, index=False)
+        print("  " + output_path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('search_result', help='output of the search command or the json part of it')
+    parser.add_argument('files', nargs='+', help='td_benchmark result csv of each label of the search result')
+    parser.add_argument('--top', type=int, default=10, help='number of CFs and migrations to show')
+    parser.add_argument('--no-cache', action='store_true', help='parse every file without the columnar parse cache')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cache = None if args.no_cache else ParseCache()
+    attribution = MigrationAttribution(MigrationAttribution.read_search_result(args.search_result))
+    for file_name in args.files:
+        dir_name = str(Path(file_name).parent)
+        show_migration_attribution(dir_name, Path(file_name).stem, attribution,
+                                   ParallelLoader.load_file(file_name, cache=cache), args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pyarrow as pa
+from file_loader import FileLoader
+from log_stream import LogStreamReader, ResultFrameAggregator
+from parse_cache import ParseCache
+from sample_array import SampleArray
+from weight_matrix import WeightMatrix
+
+
+# 複数のラベルのファイルをプロセスプールで並列に読み込む．
+# 読み込んだ DataFrame は pickle で返さずに，共有メモリ (/dev/shm) 上の Arrow IPC ファイルと .npy ファイルに書き出し，
+# 親プロセスはそれを memory map して取り出す．
+class ParallelLoader:
+    SHARED_MEMORY_DIR = "/dev/shm"
+
+    @classmethod
+    def load(cls, file_names, workers, raw_log=False, use_cache=True, compact=False):
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            shared_dirs = list(executor.map(
+                ParallelLoader.load_to_shared_dir, file_names,
+                [raw_log] * len(file_names), [use_cache] * len(file_names), [compact] * len(file_names)))
+        return [ParallelLoader.read_shared_dir(d) for d in shared_dirs]
+
+    @classmethod
+    def load_file(cls, file_name, raw_log=False, cache=None, compact=False):
+        if raw_log:
+            df = LogStreamReader(file_name).read([ResultFrameAggregator()])[0]
+        else:
+            df = FileLoader.file2dataframe(file_name, cache=cache)
+        if compact:
+            before = FileLoader.memory_bytes(df)
+            df = FileLoader.compact(df)
+            print(file_name + ": " + "{:.1f}".format(before / 1024 ** 2) + " [MiB] -> "
+                  + "{:.1f}".format(FileLoader.memory_bytes(df) / 1024 ** 2) + " [MiB]")
+        return df
+
+    @classmethod
+    def load_to_shared_dir(cls, file_name, raw_log, use_cache, compact):
+        df = ParallelLoader.load_file(file_name, raw_log, ParseCache() if use_cache else None, compact)
+        base_dir = ParallelLoader.SHARED_MEMORY_DIR if Path(ParallelLoader.SHARED_MEMORY_DIR).is_dir() else None
+        shared_dir = Path(tempfile.mkdtemp(prefix="plot_workload_latency_", dir=base_dir))
+
+        table = pa.Table.from_pandas(ParallelLoader.__without_attrs(df), preserve_index=False)
+        with pa.OSFile(str(shared_dir / "frame.arrow"), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        if 'samples' in df.attrs:
+            np.save(shared_dir / "samples_flat.npy", df.attrs['samples'].flat)
+            np.save(shared_dir / "samples_offsets.npy", df.attrs['samples'].offsets)
+        if 'weight_matrix' in df.attrs:
+            np.save(shared_dir / "weight_matrix.npy", df.attrs['weight_matrix'].values)
+        return str(shared_dir)
+
+    # ファイルを memory map した後に削除するので，共有メモリは DataFrame が参照されなくなった時点で解放される
+    @classmethod
+    def read_shared_dir(cls, shared_dir):
+        shared_dir = Path(shared_dir)
+        try:
+            with pa.memory_map(str(shared_dir / "frame.arrow"), 'r') as source:
+                df = pa.ipc.open_file(source).read_all().to_pandas()
+            if (shared_dir / "samples_flat.npy").exists():
+                df.attrs['samples'] = SampleArray(np.load(shared_dir / "samples_flat.npy", mmap_mode='r'),
+                                                  np.load(shared_dir / "samples_offsets.npy", mmap_mode='r'))
+            if (shared_dir / "weight_matrix.npy").exists():
+                df.attrs['weight_matrix'] = WeightMatrix(np.load(shared_dir / "weight_matrix.npy", mmap_mode='r'))
+        finally:
+            shutil.rmtree(shared_dir, ignore_errors=True)
+        return df
+
+    @classmethod
+    def __without_attrs(cls, df):
+        df = df.copy(deep=False)
+        df.attrs = {}
+        return df
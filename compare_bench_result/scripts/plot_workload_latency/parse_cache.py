@@ -0,0 +1,171 @@
+import fcntl
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+import pyarrow as pa
+
+
+# 解析済みの入力ファイルを Arrow IPC 形式のサイドカーとして保存し，次回以降はパースせずに memory map で読み込む．
+# キャッシュの対応はパス, サイズ, mtime, 内容のハッシュで管理する．
+# 索引 (index.json) は複数のプロセス (ParallelLoader のワーカーや同時に実行したコマンド) が更新するので，
+# 書き込む時はロックを取ってディスク上の索引を読み直し，このプロセスが追加, 削除したエントリだけを反映する．
+# サイドカーの内容 (解析した DataFrame の形式) の版は呼び出し側が namespace に含める (FileLoader.cache_namespace)．
+class ParseCache:
+    # サイドカーと索引のファイル形式の版
+    FORMAT_VERSION = 1
+    INDEX_FILE_NAME = "index.json"
+    LOCK_FILE_NAME = "index.lock"
+    DEFAULT_CACHE_DIR = Path.home() / ".cache" / "compare_bench_result"
+    DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+    HASH_CHUNK_BYTES = 1024 ** 2
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir or os.environ.get("COMPARE_BENCH_RESULT_CACHE_DIR", ParseCache.DEFAULT_CACHE_DIR))
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index = self.__load_index()
+        self.__updated_keys = set()
+        self.__removed_keys = set()
+        self.__removed_sidecars = set()
+
+    def load(self, file_path, parse, namespace):
+        key = namespace + ":" + str(Path(file_path).resolve())
+        stat = os.stat(file_path)
+        entry = self.index.get(key)
+        content_hash = None
+
+        if entry is not None and not self.__is_same_stat(entry, stat):
+            # mtime が変わっていても内容が同じであればサイドカーを使い続ける
+            content_hash = ParseCache.content_hash(file_path)
+            if entry['hash'] != content_hash:
+                self.__remove_entry(key)
+                entry = None
+            else:
+                entry['size'] = stat.st_size
+                entry['mtime_ns'] = stat.st_mtime_ns
+
+        if entry is not None and (self.cache_dir / entry['sidecar']).exists():
+            entry['last_access'] = time.time()
+            self.__updated_keys.add(key)
+            self.__commit()
+            return ParseCache.read_sidecar(self.cache_dir / entry['sidecar'])
+
+        df = parse(file_path)
+        if content_hash is None:
+            content_hash = ParseCache.content_hash(file_path)
+        if key in self.index:
+            self.__remove_entry(key)
+        sidecar = namespace + "-" + str(ParseCache.FORMAT_VERSION) + "-" + content_hash + ".arrow"
+        ParseCache.write_sidecar(self.cache_dir / sidecar, df)
+        self.index[key] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'hash': content_hash,
+            'sidecar': sidecar,
+            'bytes': (self.cache_dir / sidecar).stat().st_size,
+            'last_access': time.time(),
+        }
+        self.__updated_keys.add(key)
+        self.__commit()
+        return df
+
+    # file_path のキャッシュを削除する．file_path が None の場合は，索引に無いサイドカーも含めて全て削除する
+    def invalidate(self, file_path=None):
+        self.__commit()
+        if file_path is None:
+            targets = list(self.index.keys())
+        else:
+            path = str(Path(file_path).resolve())
+            targets = [k for k in self.index.keys() if k.split(":", 1)[1] == path]
+        for key in targets:
+            self.__remove_entry(key)
+        self.__commit(remove_unindexed=file_path is None)
+        return len(targets)
+
+    # サイドカーの合計サイズが上限を超えている間，最後に参照された時刻が古いものから削除する
+    def evict(self):
+        sidecar_bytes = {}
+        sidecar_last_access = {}
+        for entry in self.index.values():
+            sidecar_bytes[entry['sidecar']] = entry['bytes']
+            sidecar_last_access[entry['sidecar']] = max(entry['last_access'],
+                                                        sidecar_last_access.get(entry['sidecar'], 0))
+        total_bytes = sum(sidecar_bytes.values())
+        for sidecar in sorted(sidecar_last_access, key=lambda s: sidecar_last_access[s]):
+            if total_bytes <= self.max_bytes:
+                break
+            for key in [k for k, e in self.index.items() if e['sidecar'] == sidecar]:
+                self.__remove_entry(key)
+            total_bytes -= sidecar_bytes[sidecar]
+
+    @classmethod
+    def content_hash(cls, file_path):
+        h = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(ParseCache.HASH_CHUNK_BYTES), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    @classmethod
+    def read_sidecar(cls, sidecar_path):
+        with pa.memory_map(str(sidecar_path), 'r') as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+
+    @classmethod
+    def write_sidecar(cls, sidecar_path, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        tmp_path = str(sidecar_path) + ".tmp" + str(os.getpid())
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, sidecar_path)
+
+    def __is_same_stat(self, entry, stat):
+        return entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+    # サイドカーは他のプロセスのエントリが参照している場合があるので，__commit で索引をまとめた後に削除する
+    def __remove_entry(self, key):
+        self.__removed_sidecars.add(self.index.pop(key)['sidecar'])
+        self.__removed_keys.add(key)
+        self.__updated_keys.discard(key)
+
+    # ロックを取ってディスク上の索引にこのプロセスの変更を反映し，上限を超えた分を削除してから書き込む
+    def __commit(self, remove_unindexed=False):
+        with open(self.cache_dir / ParseCache.LOCK_FILE_NAME, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = self.__load_index()
+            for key in self.__removed_keys:
+                index.pop(key, None)
+            index.update({key: self.index[key] for key in self.__updated_keys})
+            self.index = index
+            self.evict()
+            referenced = {e['sidecar'] for e in self.index.values()}
+            for sidecar in self.__removed_sidecars - referenced:
+                (self.cache_dir / sidecar).unlink(missing_ok=True)
+            if remove_unindexed:
+                for sidecar_path in self.cache_dir.glob("*.arrow"):
+                    if sidecar_path.name not in referenced:
+                        sidecar_path.unlink(missing_ok=True)
+            self.__write_index()
+            self.__updated_keys.clear()
+            self.__removed_keys.clear()
+            self.__removed_sidecars.clear()
+
+    def __load_index(self):
+        index_path = self.cache_dir / ParseCache.INDEX_FILE_NAME
+        if not index_path.exists():
+            return {}
+        try:
+            with open(index_path) as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            return {}
+
+    def __write_index(self):
+        index_path = self.cache_dir / ParseCache.INDEX_FILE_NAME
+        tmp_path = str(index_path) + ".tmp" + str(os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, index_path)
@@ -1,9 +1,19 @@
-import sys
-from sklearn.metrics import r2_score
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
 from file_loader import FileLoader
+from parse_cache import ParseCache
+from parallel_loader import ParallelLoader
+from log_stream import GroupLatencyAggregator, LogStreamReader, QueryLatencyAggregator
+from statement_index import StatementIndex
+from latency_aggregator import LatencyAggregator
 from graph import Graph
+from render_farm import RenderFarm
+from stage_profiler import StageProfiler
+from bootstrap import Bootstrap
+from cost_accuracy import CostAccuracy
 from upseart import Upseart
-import ast
 
 # 総実行時間
 # 1. 各時刻の各処理の応答時間に実行頻度を掛け合わせる (各処理の加重した応答時間)
@@ -14,64 +24,74 @@ import ast
 
 class DataFrameUtils:
     @classmethod
-    def group_dfs_by_statement(cls, dfs):
-        statement_hash = {}
-        for df in dfs:
-            statement = list(
-                map(lambda gn: gn[0] + "_" + gn[1], df[['group', 'name']].values.tolist()))[0]
-            if statement in statement_hash:
-                statement_hash[statement].append(df)
-            else:
-                statement_hash[statement] = [df]
-
-            if statement.split('_')[1].startswith(
-                    "UPDATE") or statement.split('_')[1].startswith("INSERT"):
-                statement = "Aggregated-" + statement.split(" -- ")[0]
-                if statement in statement_hash:
-                    statement_hash[statement].append(df)
-                else:
-                    statement_hash[statement] = [df]
-        return statement_hash
+    def group_dfs_by_statement(cls, df):
+        with StageProfiler.stage("group_dfs_by_statement"):
+            return StatementIndex(df)
 
 
 def plot_queries(
         dir_name,
-        label_dfs_hash):
-    for statement in list(label_dfs_hash.values())[0].keys():
-        if statement.split('_')[1].startswith("UPDATE") or statement.split('_')[1].startswith("INSERT"):
+        label_dfs_hash,
+        tail_name=None):
+    statement_index = list(label_dfs_hash.values())[0]
+    for statement in statement_index.keys():
+        kind = statement_index.kinds[statement]
+        if kind == "UPDATE" or kind == "INSERT" or kind == "TOTAL":
             continue
-        if statement.split('_')[1].startswith("SELECT"):
-            plot_statement(dir_name, label_dfs_hash, statement, EVALUATION_RESULT_COLUMN, statement.split("--")[1], 'Latency [s]', True)
+        if kind == "SELECT":
+            plot_statement(dir_name, label_dfs_hash, statement, EVALUATION_RESULT_COLUMN, statement.split("--")[1], 'Latency [s]', True, tail_name)
             plot_statement(dir_name, label_dfs_hash, statement, 'cost', "COST" + "\n" + statement, 'Estimated Cost', False)
             continue
-        elif "TOTAL_TOTAL" == statement or "TOTAL" in statement:
-            continue
-        raise('statement not match' + statement)
-
-
-def calculate_r2(label_dfs_hash):
-    for label in label_dfs_hash.keys():
-        print("=====================================")
-        print(label)
-        print("=====================================")
-        for statement in label_dfs_hash[label].keys():
-            actual = list(label_dfs_hash[label][statement][0]['mean'].values)
-            estimated = list(label_dfs_hash[label][statement][0]['cost'].values)
-            print(statement)
-            print(r2_score(actual, estimated))
-
-
-def plot_statement(dir_name, l_dfs_hash, statement, target_column, title, y_label, does_plot_se):
+        raise Exception('statement not match' + statement)
+
+
+# 全ての SELECT の各時刻の応答時間を label ごとの (statement × timestep) の行列として並べ，
+# 最初の label との差 [%] と合わせて一つの図に描画する
+def plot_query_heatmap(dir_name, label_dfs_hash, cluster_statements=False):
+    labels = list(label_dfs_hash.keys())
+    label_matrix_hash = {label: LatencyAggregator.statement_timestep_matrix(df, EVALUATION_RESULT_COLUMN, "SELECT")
+                         for label, df in label_dfs_hash.items()}
+    statements = sorted(set().union(*[m.index for m in label_matrix_hash.values()]))
+    timesteps = max((m.columns for m in label_matrix_hash.values()), key=len)
+    label_matrix_hash = {label: m.reindex(index=statements, columns=timesteps) for label, m in label_matrix_hash.items()}
+    if cluster_statements:
+        statements = LatencyAggregator.cluster_order(pd.concat(list(label_matrix_hash.values()), axis=1))
+        label_matrix_hash = {label: m.reindex(index=statements) for label, m in label_matrix_hash.items()}
+
+    base = label_matrix_hash[labels[0]]
+    label_diff_hash = {Graph.convert_legends(label) + " / " + Graph.convert_legends(labels[0]):
+                       (label_matrix_hash[label] / base - 1) * 100 for label in labels[1:]}
+    Graph.plot_matrix_heatmaps(dir_name, "Query latency of each time step", label_matrix_hash, label_diff_hash)
+
+
+# コストモデルの見積もりの精度を statement の種類ごとに表示し，statement ごとの結果を dir_name/cost_accuracy.csv に書き出す
+def calculate_r2(dir_name, label_dfs_hash, worst_num=20):
+    accuracy = CostAccuracy(label_dfs_hash, EVALUATION_RESULT_COLUMN)
+    print("=== cost model accuracy ===")
+    print(accuracy.by_kind().to_string(index=False))
+    print("=== worst estimated statements ===")
+    print(accuracy.worst_statements(worst_num).to_string(index=False))
+    output_path = dir_name + "/cost_accuracy.csv"
+    accuracy.by_statement().to_csv(output_path, index=False)
+    print(output_path)
+
+
+def plot_statement(dir_name, l_dfs_hash, statement, target_column, title, y_label, does_plot_se, tail_name=None):
     label_data_hash = {}
     label_se_hash = {}
+    label_tail_hash = {}
     for label in l_dfs_hash.keys():
         if statement in l_dfs_hash[label]:
+            statement_df = l_dfs_hash[label].statement_df(statement)
             label_data_hash[label] = list(
-                l_dfs_hash[label][statement][0][target_column].values.tolist())
-            if does_plot_se and 'standard_error' in l_dfs_hash[label][statement][0].columns:
+                statement_df[target_column].values.tolist())
+            if does_plot_se and 'standard_error' in statement_df.columns:
                 label_se_hash[label] = list(
-                    l_dfs_hash[label][statement][0]['standard_error'].values.tolist())
-    Graph.plot_graph(dir_name, title, 'time step', y_label, label_data_hash, label_se_hash)
+                    statement_df['standard_error'].values.tolist())
+            if tail_name is not None:
+                tails = LatencyAggregator.tail_latency(statement_df, FileLoader.samples(statement_df))
+                label_tail_hash[label] = tails[tail_name].values.tolist()
+    Graph.plot_graph(dir_name, title, 'time step', y_label, label_data_hash, label_se_hash, label_tail_hash, tail_name)
 
 
 #def sumup_each_series(max_ts, dataframes):
@@ -84,69 +104,49 @@ def plot_statement(dir_name, l_dfs_hash, statement, target_column, title, y_labe
 
 
 def avg_query_latency(df):
-    values = [[]
-              for _ in range((max(df['timestep'].values.tolist()) + 1))]
-    for ts, v in df.query("name.str.startswith(\"SELECT\")")[
-        ['timestep', EVALUATION_RESULT_COLUMN]].values.tolist():
-        values[int(ts)].append(v)
-    avg_values = [sum(vs) / len(vs) for vs in values]
-    return avg_values
+    with StageProfiler.stage("avg_query_latency"):
+        return LatencyAggregator.avg_query_latency(df, EVALUATION_RESULT_COLUMN).tolist()
 
 
 # count the number of statements in the group
 # count INSERT into each cf as one original INSERT statement
 def count_statement_num_for_each_ts(df, group_name):
-    statement_counts = [[] for _ in range((max(df['timestep'].values.tolist()) + 1))]
-    for ts in sorted(set(list(df.query("group == @group_name and name != \"TOTAL\"")['timestep'].values.tolist()))):
-        statement_counts[int(ts)] = len(set(list(map(lambda x : x[0].split("for")[0], df.query("group == @group_name and name != \"TOTAL\" and timestep == @ts")[['name']].values.tolist()))))
-    return statement_counts
+    with StageProfiler.stage("count_statement_num_for_each_ts"):
+        return LatencyAggregator.statement_num_matrix(df).loc[group_name].tolist()
 
 
 def avg_group_latency(df, group_name):
-    values = [[] for _ in range((max(df['timestep'].values.tolist()) + 1))]
-    for ts, v in df.query("group == @group_name and name != \"TOTAL\"")[['timestep', EVALUATION_RESULT_COLUMN]].values.tolist():
-        values[int(ts)].append(v)
-
-    statement_counts = count_statement_num_for_each_ts(df, group_name)
-    avg_values = [sum(vs) / statement_counts[idx] for idx, vs in enumerate(values)]
-    return avg_values
+    with StageProfiler.stage("avg_group_latency"):
+        return LatencyAggregator.avg_group_latency_matrix(df, EVALUATION_RESULT_COLUMN).loc[group_name].tolist()
 
 
 def weighted_avg_group_latency(df, group_name):
-    weighted_group_totals = [[] for _ in range((max(df['timestep'].values.tolist()) + 1))]
-    # TOTAL mean of each group is already weighted
-    for ts, v in df.query("group == @group_name and name == \"TOTAL\"")[['timestep', EVALUATION_RESULT_COLUMN]].values.tolist():
-        if len(weighted_group_totals[int(ts)]) != 0:
-            raise Exception
-        weighted_group_totals[int(ts)] = v
-
-    statement_counts = count_statement_num_for_each_ts(df, group_name)
-    # 各時刻の statement 数を，各時刻の合計の合計重みで割ることで，合計重みが1より小さい場合に応答時間を小さく評価することを防ぐ
-    total_weight_per_statement = [sc / wt for sc, wt in zip(statement_counts, get_total_weight_each_timestep(df))]
-    avg_values = [(group_total / statement_counts[idx]) * total_weight_per_statement[idx]
-                  for idx, group_total in enumerate(weighted_group_totals)]
-    return avg_values
-
-
-# 各時刻の合計重みを求める．
+    with StageProfiler.stage("weighted_avg_group_latency"):
+        return LatencyAggregator.weighted_avg_group_latency_matrix(
+            df, EVALUATION_RESULT_COLUMN, get_statement_weight_totals(df)).loc[group_name].tolist()
+
+
+# 各時刻の実行頻度の合計．INSERT, UPDATE の CF ごとの行は元の statement ごとに一度だけ数える．
+# 各 group の重み付けした応答時間と全体の合計 (get_total_weighted_avg_matrix) はどちらもこの合計で割るので，
+# 各 group の値の和が全体の合計になる
+def get_statement_weight_totals(df):
+    return LatencyAggregator.statement_weight_totals(df, FileLoader.weight_matrix(df))
+
+
+# 各時刻の合計重みを求める．CF ごとの行を全て数えるので，重み付けした応答時間には get_statement_weight_totals を使う
 def get_total_weight_each_timestep(df):
-    weight_totals = [[] for _ in range((max(df['timestep'].values.tolist()) + 1))]
-    for ts, v in df.query("name != \"TOTAL\"")[['timestep', 'weight']].values.tolist():
-        weights = ast.literal_eval(v)
-        if len(weight_totals[int(ts)]) != 0:
-            weight_totals[int(ts)] = [round(a + b, 5) for a, b in zip(weight_totals[int(ts)], weights)]
-        else:
-            weight_totals[int(ts)] = weights
-    if len(set([tuple(ws) for ws in weight_totals])) > 1:
-        raise Exception("weights of each statement of each time step already has all weights."
-                        + " Therefore the result should be the same")
-    return weight_totals[0]
+    with StageProfiler.stage("get_total_weight_each_timestep"):
+        return LatencyAggregator.total_weight_each_timestep(df, FileLoader.weight_matrix(df)).tolist()
 
 
 def plot_unweighted_query_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash):
     label_data_hash = {}
     for label in label_grouped_dfs_hash.keys():
         label_data_hash[label] = avg_query_latency(label_dfs_hash[label])
+    plot_avg_query_latency(dir_name, label_data_hash)
+
+
+def plot_avg_query_latency(dir_name, label_data_hash):
     Graph.plot_graph(
         dir_name,
         "",
@@ -156,16 +156,26 @@ def plot_unweighted_query_latency(dir_name, label_dfs_hash, label_grouped_dfs_ha
 
 
 def plot_unweighted_group_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash):
-    label_data_hash = {}
-
     groups = set()
     for label in label_grouped_dfs_hash.keys():
         groups |= set(label_dfs_hash[label].group.values)
 
     groups.remove("TOTAL")
+    label_latency_matrix = {}
+    for label in label_grouped_dfs_hash.keys():
+        label_latency_matrix[label] = LatencyAggregator.avg_group_latency_matrix(label_dfs_hash[label], EVALUATION_RESULT_COLUMN)
+    plot_avg_group_latency(dir_name, groups, label_latency_matrix)
+
+
+# label ごとの (group × timestep) の平均応答時間から，group ごとに一つの図を描画する
+def plot_avg_group_latency(dir_name, groups, label_latency_matrix):
     for g in groups:
-        for label in label_grouped_dfs_hash.keys():
-            label_data_hash[label] = avg_group_latency(label_dfs_hash[label], g)
+        label_data_hash = {}
+        for label in label_latency_matrix.keys():
+            if g in label_latency_matrix[label].index:
+                label_data_hash[label] = label_latency_matrix[label].loc[g].tolist()
+            else:
+                label_data_hash[label] = None
 
         Graph.plot_graph(
             dir_name,
@@ -175,46 +185,100 @@ def plot_unweighted_group_latency(dir_name, label_dfs_hash, label_grouped_dfs_ha
             label_data_hash, {})
 
 
-def show_total_weighted_latency_diff(label_dfs_hash, label_grouped_dfs_hash):
-    print("TOTAL diff")
-    label_total_weighted_avg_hash = get_total_weighted_avg_hash(label_dfs_hash, label_grouped_dfs_hash)
-    for label1 in label_total_weighted_avg_hash.keys():
-        for label2 in label_total_weighted_avg_hash.keys():
-            if label1 == label2:
-                continue
-            label1_total_weighted_latency = sum(label_total_weighted_avg_hash[label1])
-            label2_total_weighted_latency = sum(label_total_weighted_avg_hash[label2])
-            print("  " + label1 + ": " + str(label1_total_weighted_latency))
-            print("  " + label2 + ": " + str(label2_total_weighted_latency))
-            print(label1 + " / " + label2)
-            print(str(label1_total_weighted_latency / label2_total_weighted_latency))
-            print(" " + str((1 - label1_total_weighted_latency / label2_total_weighted_latency) * 100) + "% reduced")
-
-
-# TODO: このメソッドで合計実行頻度が1では無い場合に対応する必要がありそう．
-def get_total_weighted_avg_hash(label_dfs_hash, label_grouped_dfs_hash):
-    raise Exception("合計実行頻度が1では無い場合に対応する必要あり")
-    label_total_weighted_avg_hash = {}
-
+# --stream: 生の td_benchmark のログを一度だけチャンクごとに読み，結果の行を保持せずに
+# 各時刻の SELECT の平均応答時間と各 group の平均応答時間の図だけを描画する．
+# 使用するメモリはログの大きさではなくチャンクの大きさと (group × timestep) の集計結果の大きさで決まる
+def plot_streamed_latency(files, chunk_bytes=LogStreamReader.DEFAULT_CHUNK_BYTES):
+    label_query_hash = {}
+    label_latency_matrix = {}
+    for file_name in files:
+        label = Path(file_name).stem
+        query_latency, group_latency = LogStreamReader(file_name, chunk_bytes).read(
+            [QueryLatencyAggregator(EVALUATION_RESULT_COLUMN), GroupLatencyAggregator(EVALUATION_RESULT_COLUMN)])
+        label_query_hash[label] = query_latency.tolist()
+        label_latency_matrix[label] = group_latency
+    dir_name = str(Path(files[-1]).parent)
     groups = set()
-    for label in label_grouped_dfs_hash.keys():
-        groups |= set(label_dfs_hash[label].group.values)
+    for matrix in label_latency_matrix.values():
+        groups |= set(matrix.index)
+    plot_avg_query_latency(dir_name, label_query_hash)
+    plot_avg_group_latency(dir_name, groups, label_latency_matrix)
 
-    groups.remove("TOTAL")
-    for label in label_grouped_dfs_hash.keys():
-        for g in groups:
-            if label in label_total_weighted_avg_hash:
-                label_total_weighted_avg_hash[label] = \
-                    [a + b for a, b in
-                        zip(label_total_weighted_avg_hash[label], weighted_avg_group_latency(label_dfs_hash[label], g))]
-            else:
-                label_total_weighted_avg_hash[label] = weighted_avg_group_latency(label_dfs_hash[label], g)
-    return label_total_weighted_avg_hash
 
+def show_total_weighted_latency_diff(dir_name, label_dfs_hash, label_grouped_dfs_hash, plot_heatmap=True):
+    show_weighted_latency_reduction(dir_name, get_total_weighted_avg_matrix(label_dfs_hash), plot_heatmap)
 
 
-def plot_weighted_total_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash):
-    label_total_weighted_avg_hash = get_total_weighted_avg_hash(label_dfs_hash, label_grouped_dfs_hash)
+# totals は get_total_weighted_avg_matrix の (label × timestep) の行列
+def show_weighted_latency_reduction(dir_name, totals, plot_heatmap=True):
+    print("TOTAL diff")
+    for label, total in totals.sum(axis=1).items():
+        print("  " + label + ": " + str(total))
+    reduction = LatencyAggregator.reduction_ratio_matrix(totals) * 100
+    print("reduced [%] (1 - label1 / label2)")
+    print(reduction.to_string())
+    if plot_heatmap:
+        Graph.plot_heatmap(dir_name, "Reduction of frequency weighted latency", reduction, "reduced [%]")
+
+
+def get_total_weighted_avg_matrix(label_dfs_hash):
+    label_weight_totals = {label: get_statement_weight_totals(df) for label, df in label_dfs_hash.items()}
+    return LatencyAggregator.weighted_total_latency_matrix(label_dfs_hash, EVALUATION_RESULT_COLUMN, label_weight_totals)
+
+
+def get_total_weighted_avg_hash(label_dfs_hash, label_grouped_dfs_hash, totals=None):
+    if totals is None:
+        totals = get_total_weighted_avg_matrix(label_dfs_hash)
+    return {label: totals.loc[label].tolist() for label in label_dfs_hash.keys()}
+
+
+# label の組ごとに，各 statement の各時刻の平均応答時間の差と，実行頻度で重み付けした全時刻の合計の削減率の
+# ブートストラップ信頼区間と p 値を求める．statement ごとの結果は dir_name/bootstrap_statements.csv に書き出す
+def show_bootstrap_comparison(dir_name, label_dfs_hash, bootstrap):
+    labels = list(label_dfs_hash.keys())
+    statement_dfs = {label: df[df['name'] != "TOTAL"] for label, df in label_dfs_hash.items()}
+    total_replicates = {}
+    for label, statement_df in statement_dfs.items():
+        df = label_dfs_hash[label]
+        timesteps = statement_df['timestep'].to_numpy()
+        weights = FileLoader.weight_matrix(statement_df)[np.arange(len(statement_df)), timesteps]
+        total_weights = LatencyAggregator.statement_weight_totals(df, FileLoader.weight_matrix(df))
+        total_replicates[label] = np.nansum(bootstrap.weighted_total_replicates(
+            FileLoader.samples(statement_df), weights, timesteps, total_weights), axis=0)
+    totals = get_total_weighted_avg_matrix(label_dfs_hash).sum(axis=1)
+
+    print("bootstrap (" + str(bootstrap.resamples) + " resamples, " + str(bootstrap.confidence * 100) + "% confidence)")
+    statement_results = []
+    for idx, label1 in enumerate(labels):
+        for label2 in labels[idx + 1:]:
+            pairs = statement_dfs[label1].reset_index().merge(
+                statement_dfs[label2].reset_index(), on=['group', 'name', 'timestep'], suffixes=('_1', '_2'))
+            result = bootstrap.compare(
+                FileLoader.samples(label_dfs_hash[label1].loc[pairs['index_1'].to_numpy()]),
+                FileLoader.samples(label_dfs_hash[label2].loc[pairs['index_2'].to_numpy()]))
+            result.insert(0, 'diff', (pairs[EVALUATION_RESULT_COLUMN + '_1'] - pairs[EVALUATION_RESULT_COLUMN + '_2']).to_numpy())
+            for column in ['timestep', 'name', 'group']:
+                result.insert(0, column, pairs[column].to_numpy())
+            result.insert(0, 'label2', label2)
+            result.insert(0, 'label1', label1)
+            statement_results.append(result)
+            significant = (result['p_value'] < 1 - bootstrap.confidence).sum()
+            print("  " + label1 + " - " + label2 + ": " + str(significant) + " / " + str(len(result))
+                  + " measurements differ significantly")
+
+            reductions = 1 - total_replicates[label1] / total_replicates[label2]
+            lower, upper = bootstrap.interval(reductions)
+            print("  " + label1 + " / " + label2 + ": " + "{:.2f}".format((1 - totals[label1] / totals[label2]) * 100)
+                  + "% reduced [" + "{:.2f}".format(lower * 100) + ", " + "{:.2f}".format(upper * 100) + "] (p = "
+                  + "{:.4f}".format(Bootstrap.p_value(total_replicates[label1] - total_replicates[label2])) + ")")
+    if len(statement_results) > 0:
+        output_path = dir_name + "/bootstrap_statements.csv"
+        pd.concat(statement_results, ignore_index=True).to_csv(output_path, index=False)
+        print("  " + output_path)
+
+
+def plot_weighted_total_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash, totals=None):
+    label_total_weighted_avg_hash = get_total_weighted_avg_hash(label_dfs_hash, label_grouped_dfs_hash, totals)
 
     #frequency_type = "Periodical"
     #frequency_type = "Linear"
@@ -230,30 +294,133 @@ def plot_weighted_total_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash
         label_total_weighted_avg_hash, {})
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+', help='td_benchmark result csv of each label')
+    parser.add_argument('--no-cache', action='store_true', help='parse every file without the columnar parse cache')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='remove the cached parse results of the files before loading them')
+    parser.add_argument('--raw-log', action='store_true',
+                        help='files are raw td_benchmark outputs which are not formatted by bench_res_formatter.rb. '
+                             'all result rows are kept in memory as with formatted files; use --stream to bound the '
+                             'memory by the chunk size')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes to load the files in parallel')
+    parser.add_argument('--stream', action='store_true',
+                        help='read raw td_benchmark outputs chunk by chunk without keeping the rows and plot only the '
+                             'average latency of the queries and of each group')
+    parser.add_argument('--chunk-mib', type=int, default=LogStreamReader.DEFAULT_CHUNK_BYTES // 1024 ** 2,
+                        help='size of each chunk of --stream in MiB')
+    parser.add_argument('--compact', action='store_true',
+                        help='keep label, group and name as categories, downcast numeric columns and report the memory')
+    parser.add_argument('--render-workers', type=int, default=1, help='number of processes to render the figures')
+    parser.add_argument('--force-render', action='store_true', help='render every figure even if its inputs are unchanged')
+    parser.add_argument('--remove-stale-figures', action='store_true',
+                        help='remove figures rendered by a previous run which this run does not produce')
+    parser.add_argument('--tail-latency', choices=list(LatencyAggregator.TAIL_PERCENTILES.keys()),
+                        help='also plot this percentile of the raw samples for each query')
+    parser.add_argument('--heatmap', action='store_true',
+                        help='plot the latency of all queries as one statement x timestep heatmap of each label '
+                             'instead of one figure for each query')
+    parser.add_argument('--cluster-statements', action='store_true',
+                        help='order the statements of --heatmap by hierarchical clustering of their latency profiles')
+    parser.add_argument('--cost-accuracy', action='store_true',
+                        help='report R2, MAPE, log ratio and Spearman correlation of the estimated cost of each statement')
+    parser.add_argument('--bootstrap', type=int, metavar='RESAMPLES',
+                        help='compare the labels with bootstrap confidence intervals of RESAMPLES resamples of the raw samples')
+    parser.add_argument('--bootstrap-seed', type=int, default=None, help='seed of the bootstrap resampling')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence level of the bootstrap intervals')
+    parser.add_argument('--profile', nargs='?', const='plot_workload_latency_profile', metavar='OUTPUT_PREFIX',
+                        help='measure the time and the memory of each stage and write OUTPUT_PREFIX.json and '
+                             'OUTPUT_PREFIX.collapsed (flamegraph.pl format)')
+    parser.add_argument('--profile-memory', action='store_true', help='also trace the allocations of each stage with tracemalloc')
+    parser.add_argument('--profile-cprofile', action='store_true', help='also write OUTPUT_PREFIX.pstats with cProfile')
+    return parser.parse_args(argv)
+
+
+def clear_cache(files, cache=None):
+    cache = cache or ParseCache()
+    for file_name in files:
+        cache.invalidate(file_name)
+
+
+# 各 label の結果を読み込み，(出力先, label ごとの DataFrame, label ごとの StatementIndex, 最大の時刻) を返す
+def load_labels(files, workers=1, raw_log=False, cache=None, compact=False):
     label_grouped_dfs_hash = {}
     label_dfs_hash = {}
     max_timestep = -1
-    for i in range(1, len(sys.argv)):
-        file_name = sys.argv[i]
-        dataframe = FileLoader.file2dataframe(file_name)
+    with StageProfiler.stage("load"):
+        if workers > 1:
+            dataframes = ParallelLoader.load(files, workers, raw_log, cache is not None, compact)
+        else:
+            dataframes = [ParallelLoader.load_file(f, raw_log, cache, compact) for f in files]
+    for file_name, dataframe in zip(files, dataframes):
         #dir_name = file_name.split('.')[0].split('/')[0]
-        dir_name = "/".join(file_name.split('.')[0].split('/')[0:-1])
+        dir_name = "/".join(file_name.split('.')[0].split('/')[0:-1]) or "."
         label = file_name.split('.')[0].split('/')[-1]
         max_timestep = max(dataframe['timestep'].values.tolist())
-        statement_dfs = FileLoader.file_2_statement_dfs(dataframe)
 
         label_dfs_hash[label] = dataframe
-        label_grouped_dfs_hash[label] = DataFrameUtils.group_dfs_by_statement(statement_dfs)
-
-    plot_weighted_total_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash)
-    plot_unweighted_group_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash)
-    plot_unweighted_query_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash)
-    Upseart.plot_unweighted_upsert_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash, EVALUATION_RESULT_COLUMN)
-    plot_queries(dir_name, label_grouped_dfs_hash)
-    #calculate_r2(label_grouped_dfs_hash)
+        label_grouped_dfs_hash[label] = DataFrameUtils.group_dfs_by_statement(dataframe)
+    return dir_name, label_dfs_hash, label_grouped_dfs_hash, max_timestep
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    profiler = None
+    if args.profile is not None:
+        profiler = StageProfiler(args.profile_memory, args.profile_cprofile)
+        profiler.start()
+    # --stream と --heatmap は通常と異なる種類の図を描画するので，それぞれ別の mode として古い図を探す
+    mode = "stream" if args.stream else ("heatmap" if args.heatmap else "full")
+    Graph.render_farm = RenderFarm(args.render_workers, args.force_render, args.remove_stale_figures, mode)
+    if args.stream:
+        with StageProfiler.stage("stream"):
+            plot_streamed_latency(args.files, args.chunk_mib * 1024 ** 2)
+        with StageProfiler.stage("render"):
+            Graph.render_farm.render_all()
+    else:
+        plot_all(args)
+    if profiler is not None:
+        profiler.stop()
+        StageProfiler.show_report(profiler.write(args.profile))
+
+
+# 全ての図と集計
+def plot_all(args):
+    cache = None if args.no_cache else ParseCache()
+    if args.clear_cache:
+        clear_cache(args.files, cache)
+    dir_name, label_dfs_hash, label_grouped_dfs_hash, max_timestep = load_labels(
+        args.files, args.workers, args.raw_log, cache, args.compact)
+
+    with StageProfiler.stage("plot_weighted_total_latency"):
+        plot_weighted_total_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash)
+    with StageProfiler.stage("plot_unweighted_group_latency"):
+        plot_unweighted_group_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash)
+    with StageProfiler.stage("plot_unweighted_query_latency"):
+        plot_unweighted_query_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash)
+    with StageProfiler.stage("plot_unweighted_upsert_latency"):
+        Upseart.plot_unweighted_upsert_latency(dir_name, label_dfs_hash, label_grouped_dfs_hash, EVALUATION_RESULT_COLUMN)
+    if args.heatmap:
+        with StageProfiler.stage("plot_query_heatmap"):
+            plot_query_heatmap(dir_name, label_dfs_hash, args.cluster_statements)
+    else:
+        with StageProfiler.stage("plot_queries"):
+            plot_queries(dir_name, label_grouped_dfs_hash, args.tail_latency)
+    if args.cost_accuracy:
+        with StageProfiler.stage("cost_accuracy"):
+            calculate_r2(dir_name, label_dfs_hash)
     Upseart.show_upseart_plan_num(label_grouped_dfs_hash, max_timestep)
-    show_total_weighted_latency_diff(label_dfs_hash, label_grouped_dfs_hash)
+    with StageProfiler.stage("write_amplification"):
+        Upseart.show_write_amplification(dir_name, label_dfs_hash, EVALUATION_RESULT_COLUMN)
+    show_total_weighted_latency_diff(dir_name, label_dfs_hash, label_grouped_dfs_hash)
+    if args.bootstrap is not None:
+        with StageProfiler.stage("bootstrap"):
+            show_bootstrap_comparison(dir_name, label_dfs_hash,
+                                      Bootstrap(args.bootstrap, args.bootstrap_seed, args.confidence))
+    # 書き込みの増幅と削減率のヒートマップも同じ manifest に記録するため，全ての図を登録してから一度だけ描画する
+    with StageProfiler.stage("render"):
+        Graph.render_farm.render_all()
 
 
 EVALUATION_RESULT_COLUMN = 'mean'
@@ -0,0 +1,206 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from file_loader import FileLoader
+from parallel_loader import ParallelLoader
+from parse_cache import ParseCache
+
+# 基準 (baseline) の結果と候補 (candidate) の結果を (timestep, group, name) で突き合わせ，
+# 候補の応答時間の増加が標準誤差の threshold 倍を超える statement, group, 全体を遅くなったと判定する．
+# group と全体は各時刻の実行頻度 (baseline の weight) で重み付けした応答時間の全時刻の合計で比べ，
+# 標準誤差は各計測の標準誤差を重みを掛けて二乗和で合成する．
+# 結果は JSON に書き出し，--gate の段階のどれかが遅くなっていれば終了コード 1 で終了する．
+# usage: python regression_gate.py --baseline base/*.csv --candidate new/*.csv [--threshold 3] [--output summary.json]
+# --output を省略した場合は候補の結果ファイルと同じディレクトリの regression_summary.json に書き出す
+
+
+class RegressionGate:
+    SUMMARY_FILE_NAME = "regression_summary.json"
+    KEYS = ['timestep', 'group', 'name']
+    LEVELS = ['statement', 'group', 'total']
+    # JSON に書き出す遅くなった statement の数
+    WORST_NUM = 20
+
+    def __init__(self, baseline_df, candidate_df, column='mean', threshold=3.0, min_relative=0.0):
+        self.column = column
+        self.threshold = threshold
+        self.min_relative = min_relative
+        baseline = RegressionGate.measurements(baseline_df, column)
+        candidate = RegressionGate.measurements(candidate_df, column)
+        self.joined = baseline.merge(candidate.drop(columns=['weight']), on=RegressionGate.KEYS,
+                                     suffixes=('_baseline', '_candidate'))
+        self.unmatched_baseline = len(baseline) - len(self.joined)
+        self.unmatched_candidate = len(candidate) - len(self.joined)
+
+    # TOTAL 以外の各計測の値, 標準誤差, その時刻の実行頻度
+    @classmethod
+    def measurements(cls, df, column):
+        statements = df[df['name'] != "TOTAL"]
+        timesteps = statements['timestep'].to_numpy()
+        weights = FileLoader.weight_matrix(statements)
+        weights = weights[np.arange(len(statements)), np.minimum(timesteps, weights.shape[1] - 1)] \
+            if weights.shape[1] > 0 else np.full(len(statements), np.nan)
+        return pd.DataFrame({
+            'timestep': timesteps,
+            'group': statements['group'].astype(str).to_numpy(),
+            'name': statements['name'].astype(str).to_numpy(),
+            'value': statements[column].to_numpy(dtype='float64'),
+            'standard_error': statements['standard_error'].to_numpy(dtype='float64'),
+            'weight': np.nan_to_num(weights),
+        })
+
+    def statements(self):
+        j = self.joined
+        return self.judge(j[RegressionGate.KEYS], j['value_baseline'], j['value_candidate'],
+                          np.hypot(j['standard_error_baseline'], j['standard_error_candidate']))
+
+    def groups(self):
+        return self.__weighted(['group'])
+
+    def total(self):
+        return self.__weighted([])
+
+    def __weighted(self, keys):
+        j = self.joined
+        w = j['weight']
+        parts = pd.DataFrame({
+            'baseline': w * j['value_baseline'],
+            'candidate': w * j['value_candidate'],
+            'variance': (w * j['standard_error_baseline']) ** 2 + (w * j['standard_error_candidate']) ** 2,
+        })
+        if len(keys) > 0:
+            sums = parts.groupby([j[k] for k in keys], sort=True).sum(min_count=1).reset_index()
+        else:
+            sums = parts.sum(min_count=1).to_frame().T
+        return self.judge(sums[keys], sums['baseline'], sums['candidate'], np.sqrt(sums['variance']))
+
+    # 差が標準誤差の threshold 倍を超え，増加率が min_relative を超えるものを遅くなったとする．
+    # 標準誤差が求められない (0 か nan) ものは判定しない
+    def judge(self, keys, baseline, candidate, standard_error):
+        result = keys.reset_index(drop=True).copy()
+        result['baseline'] = np.asarray(baseline, dtype='float64')
+        result['candidate'] = np.asarray(candidate, dtype='float64')
+        result['diff'] = result['candidate'] - result['baseline']
+        result['standard_error'] = np.asarray(standard_error, dtype='float64')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result['relative'] = result['diff'] / result['baseline']
+            result['z'] = np.where(result['standard_error'] > 0, result['diff'] / result['standard_error'], np.nan)
+        result['regressed'] = (result['z'] > self.threshold) & (result['relative'] > self.min_relative)
+        return result
+
+    def summary(self):
+        statements = self.statements()
+        groups = self.groups()
+        total = self.total().iloc[0]
+        regressed = statements[statements['regressed']].sort_values('z', ascending=False)
+        return {
+            'matched': len(self.joined),
+            'unmatched_baseline': self.unmatched_baseline,
+            'unmatched_candidate': self.unmatched_candidate,
+            'total': RegressionGate.__record(total),
+            'groups': [RegressionGate.__record(g) for _, g in groups.iterrows()],
+            'statements': {
+                'compared': int(statements['z'].notna().sum()),
+                'no_standard_error': int(statements['z'].isna().sum()),
+                'regressed': len(regressed),
+                'worst': [RegressionGate.__record(s) for _, s in regressed.head(RegressionGate.WORST_NUM).iterrows()],
+            },
+            'regressed': {
+                'statement': len(regressed) > 0,
+                'group': bool(groups['regressed'].any()),
+                'total': bool(total['regressed']),
+            },
+        }
+
+    # JSON に書き出せる型に変換し，nan は null にする
+    @classmethod
+    def __record(cls, row):
+        record = {}
+        for key, value in row.items():
+            if isinstance(value, (bool, np.bool_)):
+                record[key] = bool(value)
+            elif isinstance(value, (int, np.integer)):
+                record[key] = int(value)
+            elif isinstance(value, (float, np.floating)):
+                record[key] = None if np.isnan(value) else float(value)
+            else:
+                record[key] = str(value)
+        return record
+
+
+# baseline と candidate のファイルを label (ファイル名) で対応させる．一つずつの場合は名前が違っても対応させる
+def pair_files(baseline_files, candidate_files):
+    if len(baseline_files) == 1 and len(candidate_files) == 1:
+        return {Path(baseline_files[0]).stem: (baseline_files[0], candidate_files[0])}
+    baseline = {Path(f).stem: f for f in baseline_files}
+    candidate = {Path(f).stem: f for f in candidate_files}
+    if set(baseline.keys()) != set(candidate.keys()):
+        raise Exception('labels of the baseline and the candidate do not match: '
+                        + str(sorted(set(baseline.keys()) ^ set(candidate.keys()))))
+    return {label: (baseline[label], candidate[label]) for label in baseline.keys()}
+
+
+def show_report(label, summary, threshold):
+    total = summary['total']
+    print("=" + label + " (" + str(summary['matched']) + " measurements, threshold " + str(threshold) + " SE)")
+    print("  total: " + str(total['baseline']) + " -> " + str(total['candidate']) + " (z = " + str(total['z'])
+          + (", regressed" if total['regressed'] else "") + ")")
+    for group in summary['groups']:
+        if group['regressed']:
+            print("  group " + group['group'] + ": " + str(group['baseline']) + " -> " + str(group['candidate'])
+                  + " (z = " + str(group['z']) + ", regressed)")
+    print("  " + str(summary['statements']['regressed']) + " / " + str(summary['statements']['compared'])
+          + " statements regressed")
+    for statement in summary['statements']['worst']:
+        print("    " + str(statement['timestep']) + " " + statement['group'] + "_" + statement['name']
+              + " (z = " + "{:.2f}".format(statement['z']) + ", +" + "{:.1f}".format(statement['relative'] * 100) + "%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--baseline', nargs='+', required=True, help='td_benchmark result csv of each label of the baseline')
+    parser.add_argument('--candidate', nargs='+', required=True, help='td_benchmark result csv of each label of the candidate')
+    parser.add_argument('--threshold', type=float, default=3.0,
+                        help='flag a regression when the latency increases more than THRESHOLD times the standard error')
+    parser.add_argument('--min-relative', type=float, default=0.0,
+                        help='also require the latency to increase more than this ratio (0.05 for 5%%)')
+    parser.add_argument('--gate', nargs='+', choices=RegressionGate.LEVELS, default=['group', 'total'],
+                        help='levels whose regression makes the exit status 1 (statement level regressions are '
+                             'always reported)')
+    parser.add_argument('--output', default=None,
+                        help='JSON file to write the summary (default: ' + RegressionGate.SUMMARY_FILE_NAME
+                             + ' in the directory of the candidate files)')
+    parser.add_argument('--no-cache', action='store_true', help='parse every file without the columnar parse cache')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cache = None if args.no_cache else ParseCache()
+    labels = {}
+    for label, (baseline_file, candidate_file) in pair_files(args.baseline, args.candidate).items():
+        gate = RegressionGate(ParallelLoader.load_file(baseline_file, cache=cache),
+                              ParallelLoader.load_file(candidate_file, cache=cache),
+                              threshold=args.threshold, min_relative=args.min_relative)
+        summary = gate.summary()
+        summary.update({'baseline': baseline_file, 'candidate': candidate_file})
+        show_report(label, summary, args.threshold)
+        labels[label] = summary
+
+    regressed_levels = [level for level in args.gate if any(summary['regressed'][level] for summary in labels.values())]
+    regressed = len(regressed_levels) > 0
+    output_path = args.output or str(Path(args.candidate[-1]).parent / RegressionGate.SUMMARY_FILE_NAME)
+    with open(output_path, 'w') as f:
+        json.dump({'threshold': args.threshold, 'min_relative': args.min_relative, 'gate': args.gate,
+                   'regressed': regressed, 'labels': labels}, f, indent=1)
+    print(output_path)
+    if regressed:
+        print("regression detected in " + ", ".join(regressed_levels))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from graph import Graph
+
+
+# Graph.plot_graph やヒートマップを描画する関数で登録された図 (PlotSpec, FigureSpec) をまとめて描画する．
+# workers が 2 以上の場合は非対話的なバックエンド (Agg) を使うプロセスプールで描画し，各図の描画時間を報告する．
+# 各図の出力先ごとに spec のハッシュと描画した mode を figs/ の MANIFEST_FILE_NAME に記録し，前回から変わっていない図は描画しない．
+# mode ごとに描画する図の種類が異なる (--stream は平均応答時間の図だけを描画する) ので，
+# 同じ mode で前回は描画したが今回は描画しなかった図だけを古い図とする
+class RenderFarm:
+    MANIFEST_FILE_NAME = ".figures.json"
+
+    def __init__(self, workers=1, force=False, remove_stale=False, mode="full"):
+        self.workers = workers
+        self.force = force
+        self.remove_stale = remove_stale
+        self.mode = mode
+        self.specs = []
+
+    def submit(self, spec):
+        self.specs.append(spec)
+
+    def render_all(self):
+        start = time.perf_counter()
+        manifests = {}
+        targets = []
+        skipped = 0
+        # 同じ出力先の図は最後に登録したものだけが残るので，それだけを描画する
+        output_specs = {}
+        for spec in self.specs:
+            output_specs[Graph.output_path(spec)] = spec
+        for output_path, spec in output_specs.items():
+            manifest = RenderFarm.__manifest(manifests, output_path)
+            spec_hash = Graph.spec_hash(spec)
+            if not self.force and manifest['figures'].get(output_path, {}).get('hash') == spec_hash \
+                    and os.path.exists(output_path):
+                skipped += 1
+            else:
+                targets.append(spec)
+            manifest['rendered'][output_path] = {'hash': spec_hash, 'mode': self.mode}
+
+        if self.workers > 1 and len(targets) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=RenderFarm.init_worker) as executor:
+                results = list(executor.map(RenderFarm.render, targets, chunksize=4))
+        else:
+            results = [RenderFarm.render(spec) for spec in targets]
+        self.specs = []
+
+        for manifest_path, manifest in manifests.items():
+            self.__handle_stale_figures(manifest)
+            RenderFarm.__write_manifest(manifest_path, manifest)
+        RenderFarm.show_report(results, skipped, time.perf_counter() - start, self.workers)
+        return results
+
+    @classmethod
+    def init_worker(cls):
+        from matplotlib import pyplot
+        pyplot.switch_backend("Agg")
+
+    @classmethod
+    def render(cls, spec):
+        start = time.perf_counter()
+        output_path = Graph.render(spec)
+        return output_path, time.perf_counter() - start
+
+    @classmethod
+    def show_report(cls, results, skipped, elapsed, workers):
+        print("rendered " + str(len(results)) + " figures (" + str(skipped) + " unchanged figures skipped) in "
+              + "{:.2f}".format(elapsed) + " [s] with " + str(workers) + " workers")
+        for output_path, render_time in sorted(results, key=lambda r: -r[1]):
+            print("  " + "{:.3f}".format(render_time) + " [s]  " + output_path)
+
+    # 前回は描画したが今回は描画対象ではなかった図．他の mode で描画した図はそのまま記録しておく
+    def __handle_stale_figures(self, manifest):
+        for output_path in sorted(set(manifest['figures'].keys()) - set(manifest['rendered'].keys())):
+            if manifest['figures'][output_path]['mode'] != self.mode:
+                manifest['rendered'][output_path] = manifest['figures'][output_path]
+            elif self.remove_stale:
+                Path(output_path).unlink(missing_ok=True)
+                print("removed stale figure: " + output_path)
+            else:
+                print("stale figure: " + output_path)
+                manifest['rendered'][output_path] = manifest['figures'][output_path]
+
+    @classmethod
+    def __manifest(cls, manifests, output_path):
+        manifest_path = str(Path(output_path).parent / RenderFarm.MANIFEST_FILE_NAME)
+        if manifest_path not in manifests:
+            figures = {}
+            if os.path.exists(manifest_path):
+                with open(manifest_path) as f:
+                    figures = json.load(f)
+            manifests[manifest_path] = {'figures': figures, 'rendered': {}}
+        return manifests[manifest_path]
+
+    @classmethod
+    def __write_manifest(cls, manifest_path, manifest):
+        Path(manifest_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest['rendered'], f, indent=1, sort_keys=True)
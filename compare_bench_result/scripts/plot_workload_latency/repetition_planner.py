@@ -0,0 +1,150 @@
+import argparse
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from file_loader import FileLoader
+from parallel_loader import ParallelLoader
+from parse_cache import ParseCache
+
+# td_benchmark は全ての statement を同じ回数 (--num_iterations) 実行するが，ほとんどの statement は少ない回数で安定する．
+# 各計測 (statement × timestep) の全実行時間 (values) の分散 (values が無い計測は standard_error と iterations) から，
+# 平均の相対標準誤差 (SE / mean) を target にするのに必要な実行回数を求め，
+# 追加の実行が必要な計測だけを再実行計画 (JSON) として書き出す．
+# 外れ値に支配された計測 (mean と middle_mean が大きく異なるか，一回の実行が合計の大部分を占める) と，
+# max_repetitions 回実行しても target に届かない計測は不安定として印を付ける．
+# usage: python repetition_planner.py result.csv [--target 0.05] [--max-repetitions 100] [--output rerun_plan.json]
+
+
+class RepetitionPlanner:
+    FLAGS = ['outlier', 'unreachable', 'few_samples']
+
+    def __init__(self, target=0.05, min_repetitions=3, max_repetitions=100, outlier_ratio=0.2, max_share=0.5,
+                 iterations=10):
+        self.target = target
+        self.iterations = iterations
+        self.min_repetitions = min_repetitions
+        self.max_repetitions = max_repetitions
+        self.outlier_ratio = outlier_ratio
+        self.max_share = max_share
+
+    # 各計測の実行回数, 平均, 標準偏差, 相対標準誤差, 必要な実行回数と不安定さの印
+    def measurements(self, df, column='mean'):
+        statements = df[df['name'] != "TOTAL"]
+        samples = FileLoader.samples(statements)
+        has_samples = samples.lengths() > 0
+        n = np.where(has_samples, samples.lengths(), self.iterations)
+        row_ids = samples.row_ids()
+        sums = np.bincount(row_ids, weights=samples.flat, minlength=len(n))
+        squares = np.bincount(row_ids, weights=samples.flat ** 2, minlength=len(n))
+        maximums = samples.percentiles([100])[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.where(has_samples, sums / n, statements[column].to_numpy(dtype='float64'))
+            variances = np.where(has_samples & (n > 1), np.maximum(squares - sums ** 2 / n, 0) / (n - 1), np.nan)
+            deviations = np.where(has_samples, np.sqrt(variances),
+                                  statements['standard_error'].to_numpy(dtype='float64') * np.sqrt(n))
+            relative_se = deviations / np.sqrt(n) / means
+            required = np.ceil((deviations / (means * self.target)) ** 2)
+            middle_means = statements['middle_mean'].to_numpy(dtype='float64')
+            outlier = (np.abs(means - middle_means) / middle_means > self.outlier_ratio) \
+                | ((n >= 3) & (maximums / sums > self.max_share))
+
+        result = pd.DataFrame({
+            'timestep': statements['timestep'].to_numpy(),
+            'group': statements['group'].astype(str).to_numpy(),
+            'name': statements['name'].astype(str).to_numpy(),
+            'samples': n,
+            'mean': means,
+            'middle_mean': middle_means,
+            'standard_deviation': deviations,
+            'relative_se': relative_se,
+        })
+        result['required'] = np.clip(np.nan_to_num(required, nan=self.min_repetitions),
+                                     self.min_repetitions, self.max_repetitions).astype('int64')
+        result['additional'] = np.maximum(result['required'] - result['samples'], 0)
+        result['outlier'] = outlier
+        result['unreachable'] = required > self.max_repetitions
+        result['few_samples'] = n < 2
+        return result
+
+    # 追加の実行が必要か不安定な計測を statement ごとにまとめた再実行計画
+    def plan(self, measurements):
+        flagged = measurements[RepetitionPlanner.FLAGS].any(axis=1)
+        rerun = measurements[(measurements['additional'] > 0) | flagged]
+        statements = []
+        for (group, name), rows in rerun.groupby(['group', 'name'], sort=True):
+            statements.append({
+                'group': group,
+                'name': name,
+                'repetitions': int(rows['required'].max()),
+                'timesteps': [{
+                    'timestep': int(r.timestep),
+                    'samples': int(r.samples),
+                    'relative_se': None if np.isnan(r.relative_se) else float(r.relative_se),
+                    'required': int(r.required),
+                    'additional': int(r.additional),
+                    'flags': [f for f in RepetitionPlanner.FLAGS if getattr(r, f)],
+                } for r in rows.itertuples()],
+            })
+        return {
+            'target_relative_se': self.target,
+            'min_repetitions': self.min_repetitions,
+            'max_repetitions': self.max_repetitions,
+            'summary': {
+                'measurements': len(measurements),
+                'rerun_measurements': len(rerun),
+                'rerun_statements': len(statements),
+                'current_runs': int(measurements['samples'].sum()),
+                'required_runs': int(measurements['required'].sum()),
+                'additional_runs': int(measurements['additional'].sum()),
+                **{f: int(measurements[f].sum()) for f in RepetitionPlanner.FLAGS},
+            },
+            'statements': statements,
+        }
+
+    @classmethod
+    def show_report(cls, label, plan):
+        summary = plan['summary']
+        print("=" + label + " (target relative SE " + str(plan['target_relative_se']) + ")")
+        print("  " + str(summary['rerun_measurements']) + " / " + str(summary['measurements'])
+              + " measurements of " + str(summary['rerun_statements']) + " statements need more runs or are unstable")
+        print("  runs: " + str(summary['current_runs']) + " measured, " + str(summary['required_runs'])
+              + " required (" + str(summary['additional_runs']) + " additional)")
+        print("  " + ", ".join(f + ": " + str(summary[f]) for f in RepetitionPlanner.FLAGS))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+', help='td_benchmark result csv of each label')
+    parser.add_argument('--target', type=float, default=0.05, help='target relative standard error (SE / mean)')
+    parser.add_argument('--min-repetitions', type=int, default=3, help='minimum number of runs of each statement')
+    parser.add_argument('--max-repetitions', type=int, default=100,
+                        help='measurements which need more runs than this are flagged as unreachable')
+    parser.add_argument('--outlier-ratio', type=float, default=0.2,
+                        help='flag measurements whose mean differs from middle_mean by more than this ratio')
+    parser.add_argument('--max-share', type=float, default=0.5,
+                        help='flag measurements in which one run takes more than this share of the total time')
+    parser.add_argument('--iterations', type=int, default=10,
+                        help='--num_iterations of td_benchmark, used for measurements without values')
+    parser.add_argument('--output', default="rerun_plan.json", help='JSON file to write the re-run plan of each label')
+    parser.add_argument('--no-cache', action='store_true', help='parse every file without the columnar parse cache')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cache = None if args.no_cache else ParseCache()
+    planner = RepetitionPlanner(args.target, args.min_repetitions, args.max_repetitions, args.outlier_ratio,
+                                args.max_share, args.iterations)
+    plans = {}
+    for file_name in args.files:
+        label = Path(file_name).stem
+        plans[label] = planner.plan(planner.measurements(ParallelLoader.load_file(file_name, cache=cache)))
+        RepetitionPlanner.show_report(label, plans[label])
+    with open(args.output, 'w') as f:
+        json.dump(plans, f, indent=1)
+    print(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+# td_benchmark が values 列に出力する各計測の全実行時間を，全ての値を連結した float64 の配列と
+# 各行の開始位置 (offsets) で保持する．
+# 行は読み込み時の DataFrame の index で参照するので，そこから切り出した DataFrame からも同じ配列を使える．
+class SampleArray:
+    def __init__(self, flat, offsets):
+        self.flat = np.ascontiguousarray(flat, dtype='float64')
+        self.offsets = np.ascontiguousarray(offsets, dtype='int64')
+
+    @classmethod
+    def concatenate(cls, sample_arrays):
+        flat = np.concatenate([sa.flat for sa in sample_arrays] + [np.zeros(0)])
+        lengths = np.concatenate([sa.lengths() for sa in sample_arrays] + [np.zeros(0, dtype='int64')])
+        return SampleArray(flat, np.concatenate([[0], np.cumsum(lengths)]))
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def row_ids(self):
+        return np.repeat(np.arange(len(self.offsets) - 1), self.lengths())
+
+    def rows(self, df):
+        positions = df.index.to_numpy()
+        starts = self.offsets[positions]
+        lengths = self.offsets[positions + 1] - starts
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype('int64')
+        gather = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return SampleArray(self.flat[gather], offsets)
+
+    # 各行の実行時間のパーセンタイル (行 × len(percentiles))．numpy.percentile と同じく線形補間する
+    def percentiles(self, percentiles):
+        lengths = self.lengths()
+        row_ids = self.row_ids()
+        sorted_flat = self.flat[np.lexsort((self.flat, row_ids))]
+
+        result = np.full((len(lengths), len(percentiles)), np.nan)
+        has_samples = lengths > 0
+        starts = self.offsets[:-1][has_samples]
+        for idx, p in enumerate(percentiles):
+            position = (lengths[has_samples] - 1) * (p / 100.0)
+            lower = np.floor(position).astype('int64')
+            upper = np.ceil(position).astype('int64')
+            lower_values = sorted_flat[starts + lower]
+            upper_values = sorted_flat[starts + upper]
+            result[has_samples, idx] = lower_values + (upper_values - lower_values) * (position - lower)
+        return result
+
+    # DataFrame.attrs は DataFrame を切り出す度に deepcopy されるが，配列は変更しないので共有する
+    def __deepcopy__(self, memo):
+        return self
@@ -0,0 +1,138 @@
+import contextlib
+import cProfile
+import json
+import resource
+import sys
+import time
+import tracemalloc
+
+
+# --profile で各処理段階 (読み込み, 文ごとの分割, 集計, 描画, PDF の書き出しなど) の経過時間, CPU 時間, 最大メモリ使用量を計測する．
+# 最大常駐メモリ (ru_maxrss) はプロセス全体の最大値なので，段階の間にプロセスの最大値が増えた量 (max_rss_growth_bytes) を記録する．
+# 前の段階の最大値を超えなかった段階は 0 になる．
+# 段階は入れ子にでき，親からのパス (main;load など) ごとに何回実行されても合計する．
+# 結果は JSON と，flamegraph.pl や speedscope で読める collapsed stack 形式 (パスと自身の経過時間 [us]) で書き出す．
+# プロセスプールのワーカーの中の段階は計測しない．
+# trace_memory では tracemalloc の最大値に加えて，tracemalloc からは見えない Arrow のメモリプールの最大使用量も計測する．
+# 段階ごとに既定のメモリプールを親のプールへの proxy に差し替えるので，段階の中で確保した Arrow のバッファの最大値になる．
+class StageProfiler:
+    ROOT = "main"
+
+    # None でなければ StageProfiler.stage で段階を計測する
+    current = None
+
+    # proxy のプールで確保したバッファは解放する時にそのプールを参照するので，計測を終えた後もプロセスの終了まで保持する
+    arrow_proxy_pools = []
+
+    def __init__(self, trace_memory=False, cprofile=False):
+        self.trace_memory = trace_memory
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.stats = {}
+        self.path = []
+        self.traced_peaks = []
+        self.arrow_pools = []
+        self.root = None
+
+    @classmethod
+    def stage(cls, name):
+        if StageProfiler.current is None:
+            return contextlib.nullcontext()
+        return StageProfiler.current.measure(name)
+
+    def start(self):
+        StageProfiler.current = self
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+        self.root = self.measure(StageProfiler.ROOT)
+        self.root.__enter__()
+
+    def stop(self):
+        self.root.__exit__(None, None, None)
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        if self.trace_memory:
+            tracemalloc.stop()
+        StageProfiler.current = None
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        self.path.append(name)
+        key = ";".join(self.path)
+        if self.trace_memory:
+            # 子の段階の計測のために tracemalloc の最大値を戻すので，それまでの親の最大値を保持しておく
+            if len(self.traced_peaks) > 0:
+                self.traced_peaks[-1] = max(self.traced_peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self.traced_peaks.append(0)
+            import pyarrow
+            self.arrow_pools.append(pyarrow.default_memory_pool())
+            arrow_pool = pyarrow.proxy_memory_pool(self.arrow_pools[-1])
+            StageProfiler.arrow_proxy_pools.append(arrow_pool)
+            pyarrow.set_memory_pool(arrow_pool)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        max_rss_start = StageProfiler.max_rss_bytes()
+        try:
+            yield
+        finally:
+            stat = self.stats.setdefault(key, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                               'max_rss_growth_bytes': 0, 'traced_peak_bytes': None,
+                                               'arrow_peak_bytes': None})
+            stat['calls'] += 1
+            stat['wall_seconds'] += time.perf_counter() - wall_start
+            stat['cpu_seconds'] += time.process_time() - cpu_start
+            stat['max_rss_growth_bytes'] = max(stat['max_rss_growth_bytes'],
+                                               StageProfiler.max_rss_bytes() - max_rss_start)
+            if self.trace_memory:
+                peak = max(self.traced_peaks.pop(), tracemalloc.get_traced_memory()[1])
+                stat['traced_peak_bytes'] = max(stat['traced_peak_bytes'] or 0, peak)
+                if len(self.traced_peaks) > 0:
+                    self.traced_peaks[-1] = max(self.traced_peaks[-1], peak)
+                pyarrow.set_memory_pool(self.arrow_pools.pop())
+                stat['arrow_peak_bytes'] = max(stat['arrow_peak_bytes'] or 0, arrow_pool.max_memory())
+            self.path.pop()
+
+    # プロセス開始からの最大常駐メモリ (Linux では KiB, macOS では byte で返される)
+    @classmethod
+    def max_rss_bytes(cls):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+    def report(self):
+        stages = []
+        for key, stat in self.stats.items():
+            children_seconds = sum(s['wall_seconds'] for k, s in self.stats.items()
+                                   if k.startswith(key + ";") and ";" not in k[len(key) + 1:])
+            stages.append(dict(stat, path=key, self_seconds=max(stat['wall_seconds'] - children_seconds, 0.0)))
+        return {'stages': sorted(stages, key=lambda s: s['path']),
+                'trace_memory': self.trace_memory,
+                'cprofile': self.cprofile is not None}
+
+    # output_prefix.json, output_prefix.collapsed と，cProfile を有効にした場合は output_prefix.pstats を書き出す
+    def write(self, output_prefix):
+        report = self.report()
+        with open(output_prefix + ".json", 'w') as f:
+            json.dump(report, f, indent=1)
+        with open(output_prefix + ".collapsed", 'w') as f:
+            for stage in report['stages']:
+                f.write(stage['path'] + " " + str(int(round(stage['self_seconds'] * 1e6))) + "\n")
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(output_prefix + ".pstats")
+        return report
+
+    @classmethod
+    def show_report(cls, report):
+        print("=== stage profile ===")
+        for stage in report['stages']:
+            depth = stage['path'].count(";")
+            line = "  " * depth + stage['path'].split(";")[-1] + ": " \
+                   + "{:.3f}".format(stage['wall_seconds']) + " [s] (self " + "{:.3f}".format(stage['self_seconds']) \
+                   + " [s], cpu " + "{:.3f}".format(stage['cpu_seconds']) + " [s], " + str(stage['calls']) + " calls, " \
+                   + "max rss growth " + "{:.1f}".format(stage['max_rss_growth_bytes'] / 1024 ** 2) + " [MiB]"
+            if stage['traced_peak_bytes'] is not None:
+                line += ", traced peak " + "{:.1f}".format(stage['traced_peak_bytes'] / 1024 ** 2) + " [MiB]"
+            if stage.get('arrow_peak_bytes') is not None:
+                line += ", arrow peak " + "{:.1f}".format(stage['arrow_peak_bytes'] / 1024 ** 2) + " [MiB]"
+            print(line + ")")
@@ -0,0 +1,75 @@
+import sys
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+
+
+# statement ("group_name") ごとの DataFrame への索引．
+# DataFrame を statement ごとに並べ替えて一度だけ走査し，各 statement の行を連続した範囲として保持する．
+# INSERT, UPDATE は各 CF への書き込みごとに別の行として出力されるので，
+# 元の statement ごとに "Aggregated-" から始まるキーへまとめる．
+class StatementIndex(Mapping):
+    AGGREGATED_PREFIX = "Aggregated-"
+    KINDS = ["SELECT", "INSERT", "UPDATE", "TOTAL"]
+
+    def __init__(self, df):
+        # 行ごとに文字列を連結せずに (group, name) の組で分類し，statement の名前は組ごとに一度だけ作る
+        codes, pairs = pd.factorize(pd.MultiIndex.from_arrays([df['group'], df['name']]))
+        statements = [str(group) + "_" + str(name) for group, name in pairs]
+        order = np.argsort(codes, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(statements)))])
+
+        self.df = df.iloc[order]
+        self.ranges = {}
+        self.kinds = {}
+        self.aggregated = {}
+        self.__keys = []
+        self.__slices = {}
+
+        names = self.df['name'].values[bounds[:-1]]
+        for code, statement in enumerate(statements):
+            statement = sys.intern(str(statement))
+            self.ranges[statement] = (int(bounds[code]), int(bounds[code + 1]))
+            self.kinds[statement] = StatementIndex.kind_of(names[code])
+            self.__keys.append(statement)
+            if self.kinds[statement] in ("INSERT", "UPDATE"):
+                aggregated = StatementIndex.AGGREGATED_PREFIX + statement.split(" -- ")[0]
+                if aggregated not in self.aggregated:
+                    self.aggregated[aggregated] = []
+                    self.kinds[aggregated] = self.kinds[statement]
+                    self.__keys.append(aggregated)
+                self.aggregated[aggregated].append(statement)
+
+    @classmethod
+    def kind_of(cls, name):
+        for kind in StatementIndex.KINDS:
+            if name.startswith(kind):
+                return kind
+        return None
+
+    def statement_df(self, statement):
+        if statement not in self.__slices:
+            start, end = self.ranges[statement]
+            self.__slices[statement] = self.df.iloc[start:end]
+        return self.__slices[statement]
+
+    def keys_of_kind(self, kind, aggregated=False):
+        return [k for k in self.__keys
+                if self.kinds[k] == kind and (k in self.aggregated) == aggregated]
+
+    def aggregated_keys(self):
+        return list(self.aggregated.keys())
+
+    def __getitem__(self, statement):
+        if statement in self.ranges:
+            return [self.statement_df(statement)]
+        return [self.statement_df(s) for s in self.aggregated[statement]]
+
+    def __contains__(self, statement):
+        return statement in self.ranges or statement in self.aggregated
+
+    def __iter__(self):
+        return iter(self.__keys)
+
+    def __len__(self):
+        return len(self.__keys)
@@ -0,0 +1,155 @@
+import argparse
+import csv
+from pathlib import Path
+import numpy as np
+
+# td_benchmark の出力 (bench_res_formatter.rb で整形した CSV) と search の出力を模擬したファイルを生成する．
+# usage: python synthetic_results.py <output dir> [--timesteps N] [--statements N] [--groups N] [--labels N] [--samples N]
+
+
+class SyntheticResults:
+    COLUMNS = ["timestep", "label", "group", "name", "weight", "mean", "cost", "standard_error", "middle_mean", "values"]
+    # RunTimeLogger.write_running_times が出力する列
+    RUNNING_TIME_COLUMNS = ["START", "START_CF_ENUMERATION", "END_CF_ENUMERATION", "START_QUERY_PLAN_ENUMERATION",
+                            "END_QUERY_PLAN_ENUMERATION", "START_WHOLE_OPTIMIZATION", "END_WHOLE_OPTIMIZATION", "END",
+                            "START_MIGRATION_PLAN_ENUMERATION", "END_MIGRATION_PLAN_ENUMERATION", "START_PRUNING",
+                            "END_PRUNING"]
+    # 各グループの文の種類の割合 (SELECT 3 : INSERT 1 : UPDATE 1)
+    KINDS = ["SELECT", "SELECT", "SELECT", "INSERT", "UPDATE"]
+    MAX_FANOUT = 3
+
+    def __init__(self, timesteps=12, statements=20, groups=4, samples=10, seed=0, total_weight=1.0):
+        self.timesteps = timesteps
+        self.samples = samples
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+
+        # 各文の (グループ, 文の名前, CF ごとの計測名) と実行頻度，基準の応答時間
+        self.statements = []
+        for g in range(groups):
+            for i in range(statements):
+                kind = SyntheticResults.KINDS[i % len(SyntheticResults.KINDS)]
+                names = SyntheticResults.__measurement_names(kind, g, i, rng.integers(1, SyntheticResults.MAX_FANOUT + 1))
+                self.statements.append(("group-" + str(g), names))
+        # 周期的に変化する実行頻度を各時刻で合計 total_weight になるように正規化する
+        phase = rng.uniform(0, 2 * np.pi, len(self.statements))
+        base = rng.uniform(0.2, 1.0, len(self.statements))
+        ts = np.arange(timesteps)
+        weights = base[:, None] * (1.2 + np.sin(2 * np.pi * ts[None, :] / max(timesteps, 1) + phase[:, None]))
+        self.weights = np.round(weights / weights.sum(axis=0) * total_weight, 6)
+        self.base_latencies = rng.lognormal(np.log(0.002), 0.8, len(self.statements))
+
+    @classmethod
+    def __measurement_names(cls, kind, group, index, fanout):
+        if kind == "SELECT":
+            return ["SELECT t" + str(group) + ".c" + str(index) + ", t" + str(group) + ".id FROM t" + str(group)
+                    + " WHERE t" + str(group) + ".k" + str(index) + " = ? -- Q" + str(group) + "_" + str(index)]
+        if kind == "INSERT":
+            text = "INSERT INTO t" + str(group) + " SET c" + str(index) + "=? -- I" + str(group) + "_" + str(index)
+        else:
+            text = "UPDATE t" + str(group) + " SET c" + str(index) + "=? WHERE t" + str(group) + ".id=? -- U" \
+                   + str(group) + "_" + str(index)
+        return [text + " for i" + str(group) + "_" + str(index) + "_" + str(cf) for cf in range(fanout)]
+
+    # label_index ごとに応答時間を少しずつ変えた td_benchmark の結果を書き出す
+    def write_td_benchmark(self, path, label, label_index=0):
+        rng = np.random.default_rng([self.seed, label_index])
+        label_scale = 1.0 + 0.1 * label_index
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            for t in range(self.timesteps):
+                writer.writerow(SyntheticResults.COLUMNS)
+                totals = {}
+                rows = []
+                for idx, (group, names) in enumerate(self.statements):
+                    weight = SyntheticResults.number_list(self.weights[idx])
+                    for name in names:
+                        values = self.base_latencies[idx] * label_scale * rng.lognormal(0, 0.3, self.samples)
+                        mean = values.mean()
+                        middle = np.sort(values)[len(values) // 4:len(values) - len(values) // 4]
+                        cost = "" if idx % 7 == 0 else repr(float(mean * rng.uniform(1e3, 1e5)))
+                        rows.append([t, label, group, name, weight, repr(float(mean)), cost,
+                                     repr(float(values.std(ddof=1) / np.sqrt(len(values)) if len(values) > 1 else 0.0)),
+                                     repr(float(middle.mean() if len(middle) > 0 else mean)),
+                                     SyntheticResults.number_list(values)])
+                        totals[group] = totals.get(group, 0.0) + self.weights[idx, t] * mean
+                    if idx + 1 == len(self.statements) or self.statements[idx + 1][0] != group:
+                        rows.append([t, label, group, "TOTAL", 1.0, repr(float(totals[group])), "", "NaN", "NaN",
+                                     SyntheticResults.number_list([totals[group]])])
+                writer.writerows(rows)
+                total = sum(totals.values())
+                writer.writerow([t, label, "TOTAL", "TOTAL", 1.0, repr(float(total)), "", "NaN", "NaN",
+                                 SyntheticResults.number_list([total])])
+
+    # 時刻数 timesteps の最適化を行った search の出力 (ログの後に running time log) を書き出す
+    @classmethod
+    def write_search_output(cls, path, timesteps, pruning=True, log_lines=10000):
+        durations = {
+            'CF_ENUMERATION': 40 * timesteps,
+            'PRUNING': 30 * timesteps if pruning else 0,
+            'QUERY_PLAN_ENUMERATION': 20 * timesteps ** 1.5 * (0.4 if pruning else 1.0),
+            'MIGRATION_PLAN_ENUMERATION': 5 * timesteps ** 2 * (0.3 if pruning else 1.0),
+            'WHOLE_OPTIMIZATION': 50 * timesteps ** 2 * (0.5 if pruning else 1.0),
+        }
+        now = 1600000000000
+        times = {'START': now}
+        for phase, duration in durations.items():
+            times['START_' + phase] = now
+            now += int(duration) + 100
+            times['END_' + phase] = now
+        times['END'] = now + 1000
+        with open(path, 'w') as f:
+            for i in range(log_lines):
+                f.write("iteration " + str(i) + ": objective value " + repr(1.0 / (i + 1)) + "\n")
+            f.write("<running time log> ===========================\n")
+            f.write(",".join(SyntheticResults.RUNNING_TIME_COLUMNS) + "\n")
+            f.write(",".join(str(times[c]) for c in SyntheticResults.RUNNING_TIME_COLUMNS) + "\n")
+            f.write("</running time log> ===========================\n")
+
+    # Ruby の Array#to_s と同じ形式
+    @classmethod
+    def number_list(cls, values):
+        return "[" + ", ".join(repr(float(v)) for v in values) + "]"
+
+    def write_labels(self, output_dir, labels):
+        paths = []
+        for label_index in range(labels):
+            path = Path(output_dir) / ("synthetic_" + str(label_index) + ".csv")
+            self.write_td_benchmark(path, path.stem, label_index)
+            paths.append(str(path))
+        return paths
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output_dir', help='directory to write the generated files')
+    parser.add_argument('--timesteps', type=int, default=12)
+    parser.add_argument('--statements', type=int, default=20, help='number of statements in each group')
+    parser.add_argument('--groups', type=int, default=4)
+    parser.add_argument('--labels', type=int, default=3)
+    parser.add_argument('--samples', type=int, default=10, help='number of samples of each measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--total-weight', type=float, default=1.0, help='total execution frequency of each time step')
+    parser.add_argument('--search-outputs', action='store_true',
+                        help='also write search outputs of 4, 8, ..., TIMESTEPS time steps with and without pruning')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    results = SyntheticResults(args.timesteps, args.statements, args.groups, args.samples, args.seed, args.total_weight)
+    for path in results.write_labels(args.output_dir, args.labels):
+        print(path)
+    if args.search_outputs:
+        search_dir = Path(args.output_dir) / "search"
+        search_dir.mkdir(exist_ok=True)
+        for timesteps in range(4, args.timesteps + 1, 4):
+            for variant, pruning in [("cyclic_prop_80per_synthetic", True), ("cyclic_prop_80per_no_iterative_synthetic", False)]:
+                path = search_dir / (variant + "_" + str(timesteps) + "ts.txt")
+                SyntheticResults.write_search_output(path, timesteps, pruning)
+                print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+import benchmark_pipeline
+import plot_workload_latency
+from file_loader import FileLoader
+from latency_aggregator import LatencyAggregator
+from statement_index import StatementIndex
+from synthetic_results import SyntheticResults
+
+# synthetic_results.py で生成した結果に対して，benchmark_pipeline.py が計測する読み込み, 文ごとの分割, 集計と，
+# 実行頻度で重み付けした全体の応答時間の結果を確かめる．
+# 履歴ファイルが無くても実行できる
+
+TIMESTEPS = 6
+STATEMENTS = 10
+GROUPS = 3
+SAMPLES = 5
+
+
+@pytest.fixture(scope="module")
+def results():
+    return SyntheticResults(TIMESTEPS, STATEMENTS, GROUPS, SAMPLES)
+
+
+@pytest.fixture(scope="module")
+def paths(results, tmp_path_factory):
+    return results.write_labels(tmp_path_factory.mktemp("synthetic"), 2)
+
+
+@pytest.fixture(scope="module")
+def df(paths):
+    return FileLoader.file2dataframe(paths[0])
+
+
+def measurement_num(results):
+    return sum(len(names) for _, names in results.statements)
+
+
+def test_load(results, df):
+    # 各時刻に全ての計測, 各 group の TOTAL, 全体の TOTAL の行がある
+    assert len(df) == TIMESTEPS * (measurement_num(results) + GROUPS + 1)
+    assert sorted(df['timestep'].unique().tolist()) == list(range(TIMESTEPS))
+    statements = (df['name'] != "TOTAL").to_numpy()
+    weights = FileLoader.weight_matrix(df)
+    assert weights.shape == (len(df), TIMESTEPS)
+    expected = np.concatenate([np.repeat(results.weights[idx:idx + 1], len(names), axis=0)
+                               for idx, (_, names) in enumerate(results.statements)])
+    assert np.array_equal(weights[statements][:measurement_num(results)], expected)
+    assert (FileLoader.samples(df).lengths()[statements] == SAMPLES).all()
+
+
+def test_group(results, df):
+    index = StatementIndex(df)
+    for group, names in results.statements:
+        for name in names:
+            statement = group + "_" + name
+            assert statement in index
+            assert index.statement_df(statement)['timestep'].tolist() == list(range(TIMESTEPS))
+        if StatementIndex.kind_of(names[0]) in ("INSERT", "UPDATE"):
+            aggregated = StatementIndex.AGGREGATED_PREFIX + group + "_" + names[0].split(" -- ")[0]
+            assert len(index[aggregated]) == len(names)
+    assert len(index.keys_of_kind("SELECT")) == sum(1 for _, names in results.statements if names[0].startswith("SELECT"))
+
+
+def test_aggregate(results, df):
+    selects = df[df['name'].str.startswith("SELECT")]
+    assert np.allclose(LatencyAggregator.avg_query_latency(df, 'mean').to_numpy(),
+                       selects.groupby('timestep')['mean'].mean().to_numpy(), rtol=1e-12)
+    # INSERT, UPDATE は CF ごとの行を合わせて一つの statement として数える
+    counts = LatencyAggregator.statement_num_matrix(df)
+    assert (counts.to_numpy() == STATEMENTS).all()
+    upserts = df[df['name'].str.startswith("INSERT") | df['name'].str.startswith("UPDATE")]
+    assert np.allclose(LatencyAggregator.upsert_latency_sum(df, 'mean').to_numpy(),
+                       upserts.groupby('timestep')['mean'].sum().to_numpy(), rtol=1e-12)
+
+
+# 各 group の重み付けした平均応答時間は，group の TOTAL (実行頻度 × 応答時間の合計) を各時刻の実行頻度の合計で割ったもの．
+# 実行頻度の合計は INSERT, UPDATE を元の statement ごとに一度だけ数える
+def test_weighted_group_latency(results, df):
+    total_weights = LatencyAggregator.statement_weight_totals(df, FileLoader.weight_matrix(df))
+    assert np.allclose(total_weights, results.weights.sum(axis=0), rtol=1e-12)
+    weighted = LatencyAggregator.weighted_avg_group_latency_matrix(df, 'mean', total_weights)
+    group_totals = df[(df['name'] == "TOTAL") & (df['group'] != "TOTAL")] \
+        .pivot(index='group', columns='timestep', values='mean')
+    assert np.allclose(weighted.to_numpy(), group_totals.to_numpy() / total_weights[None, :TIMESTEPS], rtol=1e-12)
+
+
+# 全体の重み付けした応答時間は各 group の値の和
+def test_weighted_total(df):
+    totals = plot_workload_latency.get_total_weighted_avg_matrix({'label': df})
+    groups = sorted(g for g in df['group'].unique() if g != "TOTAL")
+    group_sums = np.sum([plot_workload_latency.weighted_avg_group_latency(df, g) for g in groups], axis=0)
+    assert np.allclose(totals.loc['label'].to_numpy(), group_sums, rtol=1e-12)
+
+
+# 各時刻の実行頻度の合計が 1 でなくても，重み付けした応答時間は 1 回の実行あたりの応答時間なので変わらない
+@pytest.mark.parametrize("total_weight", [0.25, 3.0])
+def test_weighted_total_for_any_total_weight(df, tmp_path, total_weight):
+    scaled = SyntheticResults(TIMESTEPS, STATEMENTS, GROUPS, SAMPLES, total_weight=total_weight)
+    scaled_df = FileLoader.file2dataframe(scaled.write_labels(tmp_path, 1)[0])
+    assert np.allclose(LatencyAggregator.statement_weight_totals(scaled_df, FileLoader.weight_matrix(scaled_df)),
+                       total_weight, rtol=1e-3)
+    totals = plot_workload_latency.get_total_weighted_avg_matrix({'unit': df, 'scaled': scaled_df})
+    assert np.allclose(totals.loc['scaled'].to_numpy(), totals.loc['unit'].to_numpy(), rtol=1e-3)
+    reduction = LatencyAggregator.reduction_ratio_matrix(totals)
+    assert np.allclose(reduction.to_numpy(), 0.0, atol=1e-3)
+
+
+def test_benchmark_without_history(paths, tmp_path):
+    stages = benchmark_pipeline.measure(paths, 1, str(tmp_path), 1)
+    assert set(stages.keys()) == set(benchmark_pipeline.STAGES)
+    assert stages['load']['throughput'] > 0
+    assert stages['render']['throughput'] > 0
+    record = {'version': "test", 'config': {}, 'stages': stages}
+    previous = benchmark_pipeline.previous_record(str(tmp_path / "benchmark_history.jsonl"), {})
+    assert previous is None
+    assert benchmark_pipeline.regressions(record, previous, 0.2) == []
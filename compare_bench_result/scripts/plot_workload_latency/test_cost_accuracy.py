@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+from cost_accuracy import CostAccuracy
+
+
+# cost は実測の 1000 倍の単位で，過大 (x4) と過小 (x1/4) に見積もる statement を一つずつ含む
+def label_df():
+    rng = np.random.default_rng(0)
+    rows = []
+    for i in range(8):
+        bias = {0: 4.0, 1: 0.25}.get(i, 1.0)
+        for t in range(5):
+            mean = float(rng.uniform(0.001, 0.01))
+            rows.append([t, "group-0", "SELECT s" + str(i) + " -- Q" + str(i), mean, mean * 1000 * bias])
+    return pd.DataFrame(rows, columns=['timestep', 'group', 'name', 'mean', 'cost'])
+
+
+def test_scale_is_removed_before_ranking():
+    accuracy = CostAccuracy({'label': label_df()}, 'mean')
+    by_kind = accuracy.by_kind()
+    assert np.isclose(by_kind['scale'].iloc[0], 1000.0)
+    assert np.isclose(by_kind['log_ratio'].iloc[0], 0.0)
+    worst = accuracy.worst_statements(2)
+    assert sorted(worst['statement'].str.split(" -- ").str[1]) == ["Q0", "Q1"]
+    assert np.allclose(sorted(worst['log_ratio']), [np.log(0.25), np.log(4.0)])
+    # 偏りの無い statement は単位を換算した見積もりが実測と一致する
+    fair = accuracy.by_statement().set_index('statement').drop(worst['statement'])
+    assert np.allclose(fair['r2'], 1.0)
+    assert np.allclose(fair['mape'], 0.0)
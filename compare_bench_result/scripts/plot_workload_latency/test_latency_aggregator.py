@@ -0,0 +1,148 @@
+import ast
+import csv
+import numpy as np
+import pandas as pd
+import pytest
+from file_loader import FileLoader
+from latency_aggregator import LatencyAggregator
+
+# LatencyAggregator の集計が，以前の実装 (Python のループと sum, ast.literal_eval と round) と全く同じ値になることを確かめる
+
+
+COLUMNS = ["timestep", "label", "group", "name", "weight", "mean", "cost", "standard_error", "middle_mean", "values"]
+
+
+# 応答時間の桁が大きく異なる statement と，複数の CF に書き込む INSERT, UPDATE を含む td_benchmark の結果を書き出す
+def write_results(path, timesteps=6, groups=3, statements=40, seed=0):
+    rng = np.random.default_rng(seed)
+    kinds = ["SELECT", "SELECT", "INSERT", "UPDATE"]
+    measurements = []
+    for g in range(groups):
+        for i in range(statements):
+            kind = kinds[i % len(kinds)]
+            fanout = 1 if kind == "SELECT" else int(rng.integers(1, 4))
+            names = [kind + " s" + str(i) + " -- " + kind[0] + str(g) + "_" + str(i)
+                     + ("" if kind == "SELECT" else " for cf" + str(cf)) for cf in range(fanout)]
+            weights = np.round(rng.uniform(0, 0.05, timesteps), 7)
+            measurements.append(("group-" + str(g), names, weights))
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        for t in range(timesteps):
+            writer.writerow(COLUMNS)
+            total = 0.0
+            for g in range(groups):
+                group = "group-" + str(g)
+                group_total = 0.0
+                for measurement_group, names, weights in measurements:
+                    if measurement_group != group:
+                        continue
+                    weight = "[" + ", ".join(repr(float(w)) for w in weights) + "]"
+                    for name in names:
+                        mean = float(10.0 ** rng.uniform(-6, 0))
+                        writer.writerow([t, "label", group, name, weight, repr(mean), repr(mean * 1000), 0.0, mean,
+                                         "[" + repr(mean) + "]"])
+                        group_total += float(weights[t]) * mean
+                writer.writerow([t, "label", group, "TOTAL", 1.0, repr(group_total), "", "NaN", "NaN",
+                                 "[" + repr(group_total) + "]"])
+                total += group_total
+            writer.writerow([t, "label", "TOTAL", "TOTAL", 1.0, repr(total), "", "NaN", "NaN", "[" + repr(total) + "]"])
+
+
+@pytest.fixture(scope="module")
+def results_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("results") / "label.csv"
+    write_results(path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def df(results_path):
+    return FileLoader.file2dataframe(str(results_path))
+
+
+# 整形前の文字列のままの結果 (以前の実装の入力)
+@pytest.fixture(scope="module")
+def raw_df(results_path):
+    raw = pd.read_csv(results_path, dtype=str, keep_default_na=False)
+    raw = raw[raw['timestep'] != "timestep"]
+    return raw.assign(timestep=raw['timestep'].astype(int), mean=raw['mean'].astype(float))
+
+
+def baseline_avg_query_latency(df, column):
+    values = [[] for _ in range((max(df['timestep'].values.tolist()) + 1))]
+    for ts, v in df.query("name.str.startswith(\"SELECT\")")[['timestep', column]].values.tolist():
+        values[int(ts)].append(v)
+    return [sum(vs) / len(vs) for vs in values]
+
+
+def baseline_count_statement_num_for_each_ts(df, group_name):
+    statement_counts = [[] for _ in range((max(df['timestep'].values.tolist()) + 1))]
+    for ts in sorted(set(list(df.query("group == @group_name and name != \"TOTAL\"")['timestep'].values.tolist()))):
+        statement_counts[int(ts)] = len(set(list(map(lambda x: x[0].split("for")[0], df.query("group == @group_name and name != \"TOTAL\" and timestep == @ts")[['name']].values.tolist()))))
+    return statement_counts
+
+
+def baseline_avg_group_latency(df, group_name, column):
+    values = [[] for _ in range((max(df['timestep'].values.tolist()) + 1))]
+    for ts, v in df.query("group == @group_name and name != \"TOTAL\"")[['timestep', column]].values.tolist():
+        values[int(ts)].append(v)
+    statement_counts = baseline_count_statement_num_for_each_ts(df, group_name)
+    return [sum(vs) / statement_counts[idx] for idx, vs in enumerate(values)]
+
+
+def baseline_avg_upseart_latency(df, insert_statement_num, column):
+    values = [[] for _ in range((max(df['timestep'].values.tolist()) + 1))]
+    for ts, v in df.query("name.str.startswith(\"UPDATE\")")[['timestep', column]].values.tolist():
+        values[int(ts)].append(v)
+    for ts, v in df.query("name.str.startswith(\"INSERT\")")[['timestep', column]].values.tolist():
+        values[int(ts)].append(v)
+    return [sum(vs) / insert_statement_num for vs in values]
+
+
+def baseline_get_total_weight_each_timestep(df):
+    weight_totals = [[] for _ in range((max(df['timestep'].values.tolist()) + 1))]
+    for ts, v in df.query("name != \"TOTAL\"")[['timestep', 'weight']].values.tolist():
+        weights = ast.literal_eval(v)
+        if len(weight_totals[int(ts)]) != 0:
+            weight_totals[int(ts)] = [round(a + b, 5) for a, b in zip(weight_totals[int(ts)], weights)]
+        else:
+            weight_totals[int(ts)] = weights
+    return weight_totals[0]
+
+
+def test_avg_query_latency_is_identical_to_baseline(df, raw_df):
+    assert LatencyAggregator.avg_query_latency(df, 'mean').tolist() == baseline_avg_query_latency(raw_df, 'mean')
+
+
+def test_avg_group_latency_is_identical_to_baseline(df, raw_df):
+    counts = LatencyAggregator.statement_num_matrix(df)
+    latencies = LatencyAggregator.avg_group_latency_matrix(df, 'mean')
+    for group in ["group-0", "group-1", "group-2"]:
+        assert counts.loc[group].tolist() == baseline_count_statement_num_for_each_ts(raw_df, group)
+        assert latencies.loc[group].tolist() == baseline_avg_group_latency(raw_df, group, 'mean')
+
+
+def test_upsert_latency_sum_is_identical_to_baseline(df, raw_df):
+    statement_num = 7
+    assert (LatencyAggregator.upsert_latency_sum(df, 'mean') / statement_num).tolist() \
+        == baseline_avg_upseart_latency(raw_df, statement_num, 'mean')
+
+
+def test_total_weight_each_timestep_is_identical_to_baseline(df, raw_df):
+    assert LatencyAggregator.total_weight_each_timestep(df, FileLoader.weight_matrix(df)).tolist() \
+        == baseline_get_total_weight_each_timestep(raw_df)
+
+
+# 足す度に丸める値がちょうど中間に近い場合も，以前の実装と同じ値に丸める
+@pytest.mark.parametrize("seed", range(20))
+def test_total_weight_each_timestep_rounds_like_baseline(seed):
+    rng = np.random.default_rng(seed)
+    rows, timesteps = 200, 4
+    timestep = np.repeat(np.arange(timesteps), rows // timesteps)
+    statement_weights = np.round(rng.uniform(0, 0.01, (rows // timesteps, timesteps)), int(rng.integers(5, 9)))
+    weight_strings = ["[" + ", ".join(repr(float(w)) for w in ws) + "]" for ws in statement_weights]
+    df = pd.DataFrame({'timestep': timestep, 'name': "SELECT",
+                       'weight': weight_strings * timesteps})
+    weights = np.array([ast.literal_eval(w) for w in df['weight']], dtype='float64')
+    assert LatencyAggregator.total_weight_each_timestep(df, weights).tolist() \
+        == baseline_get_total_weight_each_timestep(df)
@@ -1,11 +1,16 @@
 import sys
 import numpy as np
-from sklearn.metrics import r2_score
+import pandas as pd
 from file_loader import FileLoader
 from graph import Graph
+from latency_aggregator import LatencyAggregator
+from statement_index import StatementIndex
 
 
 class Upseart:
+    # 書き込みの増幅 (write amplification) の表で，各 label について表示する statement の数
+    WRITE_AMPLIFICATION_TOP_NUM = 10
+
     @classmethod
     def show_upseart_plan_num(cls, label_grouped_dfs_hash, max_timestep):
         for label in label_grouped_dfs_hash.keys():
@@ -17,7 +22,7 @@ class Upseart:
     def plot_unweighted_upsert_latency(cls, dir_name, label_dfs_hash, label_grouped_dfs_hash, evaluation_result_column):
         label_data_hash = {}
         for label in label_grouped_dfs_hash.keys():
-            insert_statement_nums = len([s for s in label_grouped_dfs_hash[label].keys() if "Aggregate" in s and ("INSERT" in s or "UPDATE" in s)])
+            insert_statement_nums = len(label_grouped_dfs_hash[label].aggregated_keys())
             label_data_hash[label] = Upseart.__avg_upseart_latency(label_dfs_hash[label],
                                                                    insert_statement_nums, evaluation_result_column)
         Graph.plot_graph(
@@ -27,36 +32,51 @@ class Upseart:
             "Average Insert Latency[s]",
             label_data_hash, {})
 
+    # 全ての label の INSERT, UPDATE の元の statement ごとの各時刻の書き込み先の CF の数, CF ごとの応答時間の合計と最大値,
+    # 実行頻度で重み付けした応答時間の合計に占める割合の表 (label, statement, timestep, ...)
+    @classmethod
+    def write_amplification_table(cls, label_dfs_hash, evaluation_result_column):
+        tables = [LatencyAggregator.write_amplification(df, FileLoader.weight_matrix(df), evaluation_result_column)
+                  for df in label_dfs_hash.values()]
+        return pd.concat(tables, keys=list(label_dfs_hash.keys()), names=['label', None]) \
+            .reset_index(level='label').reset_index(drop=True)
+
+    # 書き込みの増幅の表を dir_name/write_amplification.csv に，CF の数と重み付けした応答時間の割合を一つの図に書き出し，
+    # 各 label で全時刻の重み付けした応答時間が大きい statement を表示する
+    @classmethod
+    def show_write_amplification(cls, dir_name, label_dfs_hash, evaluation_result_column):
+        table = Upseart.write_amplification_table(label_dfs_hash, evaluation_result_column)
+        output_path = dir_name + "/write_amplification.csv"
+        table.to_csv(output_path, index=False)
+        print("=== write amplification of INSERT and UPDATE ===")
+        for label, rows in table.groupby('label', sort=False):
+            summary = rows.groupby('statement', sort=False).agg(
+                max_cfs=('cfs', 'max'), latency_sum=('latency_sum', 'sum'), latency_max=('latency_max', 'max'),
+                weighted_share=('weighted_share', 'mean')) \
+                .sort_values('weighted_share', ascending=False)
+            print("=" + label + " (" + "{:.1f}".format(rows.groupby('timestep')['weighted_share'].sum().mean() * 100)
+                  + "% of the frequency weighted latency on average)")
+            print("    " + summary.head(Upseart.WRITE_AMPLIFICATION_TOP_NUM).to_string().replace("\n", "\n    "))
+        print(output_path)
+        if len(table) > 0:
+            Graph.plot_write_amplification(dir_name, "Write Amplification", table)
 
+    # 元の statement ごとに，各時刻の書き込み先の CF の数 (CF ごとの計測の行数) を表示する
     @classmethod
     def __show_upseart_plan_num_each_ts(cls, statement_dfs_hash, timestep):
-        plan_num = [0] * (timestep + 1)
-        for statement in statement_dfs_hash:
-            if not statement.startswith("Aggregated"):
-                continue
-            if not (statement.split('_')[1].startswith(
-                    "UPDATE") or statement.split('_')[1].startswith("INSERT")):
-                continue
-
-            related_dfs = statement_dfs_hash[statement]
-            for r_df in related_dfs:
-                for t, n in r_df[['timestep', 'name']].values.tolist():
-                    plan_num[t] += 1
+        df = statement_dfs_hash.df
+        names = df['name'].astype(str)
+        writes = df[(names.str.startswith("INSERT") | names.str.startswith("UPDATE")).to_numpy()]
+        statements = StatementIndex.AGGREGATED_PREFIX + writes['group'].astype(str) + "_" \
+            + writes['name'].astype(str).str.split(" -- ", n=1).str[0]
+        plan_nums = writes.groupby([statements.to_numpy(), writes['timestep'].to_numpy()]).size() \
+            .unstack(fill_value=0).reindex(columns=range(timestep + 1), fill_value=0)
+        for statement in statement_dfs_hash.aggregated_keys():
             print("  --" + statement)
-            print("      " + str(plan_num))
-            plan_num = [0] * (timestep + 1)
+            print("      " + str(plan_nums.loc[statement].tolist()))
 
     @classmethod
     def __avg_upseart_latency(cls, df, insert_statement_num, evaluation_result_column):
-        values = [[]
-                  for _ in range((max(df['timestep'].values.tolist()) + 1))]
-        for ts, v in df.query("name.str.startswith(\"UPDATE\")")[
-            ['timestep', evaluation_result_column]].values.tolist():
-            values[int(ts)].append(v)
-        for ts, v in df.query("name.str.startswith(\"INSERT\")")[
-            ['timestep', evaluation_result_column]].values.tolist():
-            values[int(ts)].append(v)
         if insert_statement_num == 0:
             return [0]
-        avg_values = [sum(vs) / insert_statement_num for vs in values]
-        return avg_values
+        return (LatencyAggregator.upsert_latency_sum(df, evaluation_result_column) / insert_statement_num).tolist()
@@ -0,0 +1,28 @@
+import numpy as np
+
+
+# 読み込んだ DataFrame の weight 列 (各時刻の実行頻度のリスト) を (行 × 時刻) の float64 行列として保持する．
+# 行は読み込み時の DataFrame の index で参照するので，そこから切り出した DataFrame からも同じ行列を使える．
+# TOTAL 行のように実行頻度がリストではない行は nan になる．
+class WeightMatrix:
+    def __init__(self, values):
+        self.values = np.ascontiguousarray(values, dtype='float64')
+
+    @classmethod
+    def from_number_lists(cls, flat, offsets, is_list):
+        lengths = np.diff(offsets)
+        timestep_num = int(lengths[is_list].max()) if is_list.any() else 0
+
+        values = np.full((len(is_list), timestep_num), np.nan)
+        rows = np.repeat(np.arange(len(is_list)), lengths)
+        columns = np.arange(len(flat)) - np.repeat(offsets[:-1], lengths)
+        in_list = np.repeat(is_list, lengths)
+        values[rows[in_list], columns[in_list]] = flat[in_list]
+        return WeightMatrix(values)
+
+    def rows(self, df):
+        return self.values[df.index.to_numpy()]
+
+    # DataFrame.attrs は DataFrame を切り出す度に deepcopy されるが，行列は変更しないので共有する
+    def __deepcopy__(self, memo):
+        return self
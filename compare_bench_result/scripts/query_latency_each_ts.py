@@ -1,11 +1,11 @@
 import sys
 from pathlib import Path
 import pandas as pd
-import matplotlib.pyplot as pyplot
-import pyparsing as pp
-import japanize_matplotlib
 import numpy as np
 
+sys.path.append(str(Path(__file__).resolve().parent / "plot_workload_latency"))
+from file_loader import FileLoader
+
 # 総実行時間
 # 1. 各時刻の各処理の応答時間に実行頻度を掛け合わせる (各処理の加重した応答時間)
 # 2. 各グループごとに、グループ内の処理の加重した応答時間の平均値をとる
@@ -13,42 +13,7 @@ import numpy as np
 # 4. 全ての時刻においてこの値を足し合わせる。
 
 
-class FileLoader:
-    @classmethod
-    def file2dataframe(cls, file_path):
-        with open(file_path) as f:
-            tmp_lines = f.readlines()
-        column = pp.commaSeparatedList.parseString(tmp_lines[0]).asList()
-        lines = []
-        header = 'timestep,label,group,name,weight,mean,cost,standard_error\n'
-
-        for tl in tmp_lines[1:]:
-            if tl != header:
-                tmp = pp.commaSeparatedList.parseString(tl).asList()
-                tmp[3] = tmp[3].strip("\"")
-                tmp[4] = tmp[4].strip("\"")
-                lines.append(tmp)
-        df = pd.DataFrame(lines, columns=column)
-        df['timestep'] = df['timestep'].astype('int')
-        df['mean'] = df['mean'].astype('float64')
-        df['cost'] = df.cost.apply(lambda  x: float(x) if x else np.nan)
-        if 'standard_error' in column:
-            df['standard_error'] = df['standard_error'].astype('float64')
-        return df
-
-    @classmethod
-    def file_2_statement_dfs(cls, df):
-        statements = []
-        for g, n in df[['group', 'name']].values:
-            statements.append(g + n)
-        statements = set(statements)
-        stmnt_dfs = []
-        for s in statements:
-            stmnt_dfs.append(
-                df[df['group'] + df['name'] == s])
-        return stmnt_dfs
-
-
+# matplotlib と japanize_matplotlib は読み込みに時間がかかるので，図を描画するときに初めて import する
 class Graph:
     @classmethod
     def convert_legends(cls, legend):
@@ -75,6 +40,8 @@ class Graph:
 
     @classmethod
     def plot_graph(cls, title, x_label, y_label, label_data_hash, label_se_hash):
+        from matplotlib import pyplot
+        import japanize_matplotlib
         x = list(range(0, len(list(label_data_hash.values())[0])))
 
         # fig = pyplot.figure(dpi=300)
@@ -85,9 +52,9 @@ class Graph:
         makers = ["o", "v", "^", "<", ">", "1", "2", "3"]
         for idx, label in enumerate(label_data_hash.keys()):
             if label_data_hash[label] is not None:
-                ax.plot(x, label_data_hash[label], marker=makers[idx], label=Graph.convert_legends(label), linewidth=1.5, markersize=4)
-                if y_max_lim < max(label_data_hash[label]):
-                    y_max_lim = max(label_data_hash[label])
+                ax.plot(x, label_data_hash[label], marker=makers[idx % len(makers)], label=Graph.convert_legends(label), linewidth=1.5, markersize=4)
+                if y_max_lim < np.nanmax(label_data_hash[label]):
+                    y_max_lim = np.nanmax(label_data_hash[label])
                 # if label in label_cost_hash:
                 # ax.plot(x, label_cost_hash[label], label=label + "_cost", marker="x")
                 if bool(label_se_hash) and not any([np.isnan(se) for se in label_se_hash[label]]):
@@ -109,8 +76,10 @@ class Graph:
         pyplot.legend()
         output_dir= DIR_NAME + "/figs/"
         Path(output_dir).mkdir(parents=True, exist_ok=True)
-        #fig.savefig(output_dir + title.split('--')[-1].strip(" ") + "_" + y_label.strip(" ") + ".pdf")
-        fig.show()
+        output_path = output_dir + title.split('--')[-1].strip(" ") + "_" + y_label.strip(" ") + ".pdf"
+        fig.savefig(output_path)
+        pyplot.close(fig)
+        print(output_path)
 
     @classmethod
     def title_with_newline(cls, title):
@@ -163,29 +132,37 @@ def group_dfs_by_statement(dfs):
     return statement_hash
 
 
+# 全ての SELECT の各時刻の平均応答時間を，statement ごとの系列として一つの図に描画する
 def plot_query_latencies(max_timestep, statement_dfs):
     label_data_hash = {}
-    for s_dfs in statement_dfs:
-        if not s_dfs.name in label_data_hash:
-            label_data_hash[s_dfs.name] = {}
-        for ts, m in s_dfs[['timestep', 'mean']]:
-            label_data_hash[s_dfs.name][ts] = m
-    label_data_hash
-
-
-
-
-label_grouped_dfs_hash = {}
-label_dfs_hash = {}
-max_timestep = -1
-file_name = sys.argv[1]
-dataframe = FileLoader.file2dataframe(file_name)
-#dir_name = file_name.split('.')[0].split('/')[0]
-dir_name = "/".join(file_name.split('.')[0].split('/')[0:-1])
-label = file_name.split('.')[0].split('/')[-1]
-max_timestep = max(dataframe['timestep'].values.tolist())
-statement_dfs = FileLoader.file_2_statement_dfs(dataframe)
-
-DIR_NAME = dir_name
-#plot_queries(max_timestep, label_grouped_dfs_hash, )
-plot_query_latencies(max_timestep, statement_dfs)
+    for s_df in statement_dfs:
+        name = s_df['name'].values[0]
+        if not name.startswith("SELECT"):
+            continue
+        latencies = [np.nan] * (max_timestep + 1)
+        for ts, m in s_df[['timestep', 'mean']].values.tolist():
+            latencies[int(ts)] = m
+        label_data_hash[name.split("--")[-1].strip(" ")] = latencies
+    if len(label_data_hash) == 0:
+        return
+    Graph.plot_graph("Query latency of each time step", 'timestep', 'Latency [s]', label_data_hash, {})
+
+
+def main(argv=None):
+    global DIR_NAME
+    file_name = (sys.argv[1:] if argv is None else argv)[0]
+    dataframe = FileLoader.file2dataframe(file_name)
+    #dir_name = file_name.split('.')[0].split('/')[0]
+    dir_name = "/".join(file_name.split('.')[0].split('/')[0:-1]) or "."
+    max_timestep = max(dataframe['timestep'].values.tolist())
+    statement_dfs = FileLoader.file_2_statement_dfs(dataframe)
+
+    DIR_NAME = dir_name
+    #plot_queries(max_timestep, label_grouped_dfs_hash, )
+    plot_query_latencies(max_timestep, statement_dfs)
+
+
+DIR_NAME = "."
+
+if __name__ == '__main__':
+    main()